@@ -0,0 +1,110 @@
+# Description: Cache of the authenticated users.
+import pickle
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+
+class UserCache:
+    """
+    Two level cache of the users loaded by the authentication, with their reading_stats preloaded.
+    The first level is a per-process LRU with AUTH_USER_LOCAL_CACHE_TIMEOUT, the second one is the shared cache
+    with AUTH_USER_CACHE_TIMEOUT. Users are kept pickled, so every request gets its own instance.
+    Keys are deleted when the user or its reading stats are saved, the LRU of other processes
+    keeps the user until the short local timeout expires. Bulk updates of the reading stats send no signals,
+    they increment the version of the shared cache instead, the users are kept with the version they were loaded at.
+    """
+
+    prefix = "auth:user"
+    version_key = f"{prefix}:version"
+    local = OrderedDict()
+    lock = threading.Lock()
+
+    @classmethod
+    def key(cls, user_id):
+        return f"{cls.prefix}:{user_id}"
+
+    @classmethod
+    def get_local(cls, key):
+        with cls.lock:
+            entry = cls.local.get(key)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires < monotonic():
+                del cls.local[key]
+                return None
+            cls.local.move_to_end(key)
+            return data
+
+    @classmethod
+    def set_local(cls, key, data):
+        with cls.lock:
+            cls.local[key] = (monotonic() + settings.AUTH_USER_LOCAL_CACHE_TIMEOUT, data)
+            cls.local.move_to_end(key)
+            while len(cls.local) > settings.AUTH_USER_LOCAL_CACHE_SIZE:
+                cls.local.popitem(last=False)
+
+    @classmethod
+    def get(cls, user_id):
+        """
+        Returns the user with its reading_stats, from the local LRU, the shared cache or the database.
+        :param user_id: Id of the user.
+        :return: User instance.
+        :raises User.DoesNotExist: If there is no such user.
+        """
+        key = cls.key(user_id)
+        data = cls.get_local(key)
+        if data is None:
+            cached = cache.get_many([key, cls.version_key])
+            version = cached.get(cls.version_key, 0)
+            loaded_version, data = cached.get(key, (None, None))
+            if data is None or loaded_version != version:
+                user = User.objects.select_related("reading_stats").get(pk=user_id)
+                data = pickle.dumps(user)
+                cache.set(key, (version, data), timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+            cls.set_local(key, data)
+        return pickle.loads(data)
+
+    @classmethod
+    def invalidate(cls, user_id):
+        """
+        Deletes the user from the local LRU and the shared cache, now and once the transaction is committed,
+        so a concurrent request cannot cache the user from before the commit.
+        """
+        key = cls.key(user_id)
+
+        def delete():
+            with cls.lock:
+                cls.local.pop(key, None)
+            cache.delete(key)
+
+        delete()
+        transaction.on_commit(delete)
+
+    @classmethod
+    def invalidate_all(cls):
+        """
+        Increments the version of the shared cache once the transaction is committed, e.g. after bulk updates
+        of the reading stats, and clears the local LRU of this process.
+        """
+
+        def increment():
+            cls.clear_local()
+            try:
+                cache.incr(cls.version_key)
+            except ValueError:
+                cache.add(cls.version_key, 0, timeout=None)
+                cache.incr(cls.version_key)
+
+        transaction.on_commit(increment)
+
+    @classmethod
+    def clear_local(cls):
+        with cls.lock:
+            cls.local.clear()
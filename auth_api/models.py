@@ -2,9 +2,11 @@ from datetime import timedelta
 
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from auth_api.cache import UserCache
+
 
 class UserReadingStats(models.Model):
     user = models.OneToOneField(
@@ -21,3 +23,14 @@ class UserReadingStats(models.Model):
 def create_user_reading_stats(sender, instance, created, **kwargs):
     if created:
         UserReadingStats.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    UserCache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=UserReadingStats)
+def invalidate_cached_user_reading_stats(sender, instance, **kwargs):
+    UserCache.invalidate(instance.user_id)
@@ -1,6 +1,50 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def create_search_index(using, **kwargs):
+    """
+    Creates the GIN index of the book search vector, the index is PostgreSQL specific,
+    so it is not declared in Book.Meta and is not created on other databases.
+    """
+    from library.models import Book, BookQuerySet
+
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return
+
+    index = BookQuerySet.search_index
+    with connection.cursor() as cursor:
+        existing = connection.introspection.get_constraints(cursor, Book._meta.db_table)
+    if index.name not in existing:
+        with connection.schema_editor() as editor:
+            editor.add_index(Book, index)
+
+
+def create_active_session_constraint(using, **kwargs):
+    """
+    Creates the unique active session index of the users, unless the reading session table is partitioned,
+    then starting a session locks the user row instead.
+    """
+    from library.models import ReadingSession
+
+    connection = connections[using]
+    if ReadingSession.objects.db_manager(using).is_partitioned():
+        return
+
+    constraint = ReadingSession.active_session_constraint
+    with connection.cursor() as cursor:
+        existing = connection.introspection.get_constraints(cursor, ReadingSession._meta.db_table)
+    if constraint.name not in existing:
+        with connection.schema_editor() as editor:
+            editor.add_constraint(ReadingSession, constraint)
 
 
 class LibraryConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "library"
+
+    def ready(self):
+        post_migrate.connect(create_search_index, sender=self)
+        post_migrate.connect(create_active_session_constraint, sender=self)
@@ -0,0 +1,114 @@
+# Description: Buffer of the reading session heartbeats.
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from library.models import ReadingSession
+
+
+class HeartbeatBuffer:
+    """
+    Coalesces the heartbeats of the active reading sessions in the cache and writes them to the database in batches.
+    Every heartbeat overwrites the last activity time of the user, so a user costs one row update per flush,
+    however often the client sends heartbeats. The first heartbeat after a flush adds a pending flag of the user
+    and appends the user id to a log of dirty users, numbered by an incremented sequence, which the flusher reads
+    from where the previous flush ended. A heartbeat writes the activity time before it checks the flag,
+    and the flusher deletes the flags before it reads the activity times, so a heartbeat during a flush is either
+    read by it or logged again for the next one. A pending flag expires HEARTBEAT_TIMEOUT after it was added,
+    so a user whose log entry was lost, e.g. evicted or expired, is logged again.
+    """
+
+    prefix = "library:heartbeat"
+    sequence_key = f"{prefix}:sequence"
+    flushed_key = f"{prefix}:flushed"
+    lock_key = f"{prefix}:lock"
+
+    @classmethod
+    def last_seen_key(cls, user_id):
+        return f"{cls.prefix}:user:{user_id}"
+
+    @classmethod
+    def pending_key(cls, user_id):
+        return f"{cls.prefix}:pending:{user_id}"
+
+    @classmethod
+    def dirty_key(cls, position):
+        return f"{cls.prefix}:dirty:{position}"
+
+    @classmethod
+    def record(cls, user_id, seen_at=None):
+        """
+        Records the activity of the user, no database query is made.
+        :param user_id: Id of the user who reads.
+        :param seen_at: Time of the activity, the current time by default.
+        :return: None
+        """
+        cache.set(cls.last_seen_key(user_id), seen_at or timezone.now(), timeout=settings.HEARTBEAT_TIMEOUT)
+        if not cache.add(cls.pending_key(user_id), True, timeout=settings.HEARTBEAT_TIMEOUT):
+            return
+
+        try:
+            position = cache.incr(cls.sequence_key)
+        except ValueError:
+            # The sequence starts again, e.g. after an eviction, so the positions of the previous one are skipped.
+            if cache.add(cls.sequence_key, 0, timeout=None):
+                cache.set(cls.flushed_key, 0, timeout=None)
+            position = cache.incr(cls.sequence_key)
+        cache.set(cls.dirty_key(position), user_id, timeout=settings.HEARTBEAT_TIMEOUT)
+
+    @classmethod
+    def flush(cls):
+        """
+        Writes the buffered last activity times to the active sessions of the users,
+        one UPDATE per HEARTBEAT_FLUSH_BATCH_SIZE users. Concurrent flushes are skipped.
+        :return: Number of flushed users.
+        """
+        if not cache.add(cls.lock_key, True, timeout=settings.HEARTBEAT_TIMEOUT):
+            return 0
+        try:
+            counters = cache.get_many([cls.sequence_key, cls.flushed_key])
+            last = counters.get(cls.sequence_key, 0)
+            first = counters.get(cls.flushed_key, 0) + 1
+            if first > last + 1:
+                # The sequence was evicted and started again.
+                first = 1
+                cache.set(cls.flushed_key, 0, timeout=None)
+            positions = iter(range(first, last + 1))
+            flushed = 0
+            while chunk := list(islice(positions, settings.HEARTBEAT_FLUSH_BATCH_SIZE)):
+                dirty_keys = [cls.dirty_key(position) for position in chunk]
+                user_ids = set(cache.get_many(dirty_keys).values())
+                cache.delete_many([*dirty_keys, *(cls.pending_key(user_id) for user_id in user_ids)])
+                last_seen_keys = {cls.last_seen_key(user_id): user_id for user_id in user_ids}
+                last_seen = {
+                    last_seen_keys[key]: seen_at for key, seen_at in cache.get_many(list(last_seen_keys)).items()
+                }
+
+                cls.write(last_seen)
+                cache.set(cls.flushed_key, chunk[-1], timeout=None)
+                flushed += len(last_seen)
+            return flushed
+        finally:
+            cache.delete(cls.lock_key)
+
+    @staticmethod
+    def write(last_seen):
+        """
+        Sets last_seen of the active sessions of the users with a single statement,
+        a heartbeat from before the start of the active session is ignored.
+        :param last_seen: Dict {user_id: last activity time}.
+        """
+        if not last_seen:
+            return
+        ReadingSession.objects.filter(user_id__in=last_seen, status=True).update(
+            last_seen=Case(
+                *(
+                    When(user_id=user_id, start_time__lte=seen_at, then=Value(seen_at))
+                    for user_id, seen_at in last_seen.items()
+                ),
+                default=F("last_seen"),
+            )
+        )
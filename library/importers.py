@@ -0,0 +1,122 @@
+# Description: Streaming import of the book catalog.
+import csv
+import json
+from itertools import islice
+
+from django.db import connection
+
+from library.models import Book
+
+
+class BookImporter:
+    """
+    Streams books from CSV or JSONL files and upserts them on the natural key (title, author, year).
+    Rows are validated against the limits of the Book fields and written in batches
+    with bulk_create(update_conflicts=True), so re-importing a catalog updates the books instead of duplicating them.
+    """
+
+    formats = ("csv", "jsonl")
+    unique_fields = ["title", "author", "year"]
+    update_fields = ["short_description", "full_description"]
+
+    def __init__(self, path, import_format=None):
+        """
+        :param path: Path of the imported file.
+        :param import_format: csv or jsonl, guessed from the file extension by default.
+        """
+        self.path = path
+        self.import_format = import_format or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        self.errors = []
+
+    def read(self):
+        """
+        Generates (line number, raw row) pairs of the file without loading it into memory.
+        """
+        with open(self.path, newline="", encoding="utf-8") as file:
+            if self.import_format == "csv":
+                reader = csv.DictReader(file)
+                for row in reader:
+                    yield reader.line_num, row
+                return
+
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as error:
+                    self.errors.append((line_number, {"row": [str(error)]}))
+
+    @staticmethod
+    def validate(row):
+        """
+        Validates the row against the Book fields.
+        :param row: Dict with the raw values of the row.
+        :return: Tuple (Book instance or None, dict of errors by field).
+        """
+        values, errors = {}, {}
+        for name in [*BookImporter.unique_fields, *BookImporter.update_fields]:
+            field = Book._meta.get_field(name)
+            value = row.get(name)
+            if value in (None, ""):
+                if not field.null:
+                    errors[name] = ["This field is required."]
+                values[name] = None
+                continue
+            if name == "year":
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    errors[name] = ["A valid integer is required."]
+                    continue
+            else:
+                value = str(value).strip()
+                if field.max_length and len(value) > field.max_length:
+                    errors[name] = [f"Ensure this field has no more than {field.max_length} characters."]
+                    continue
+            values[name] = value
+
+        if errors:
+            return None, errors
+        return Book(**values), errors
+
+    def batches(self, batch_size):
+        """
+        Generates lists of valid books, each of at most batch_size books.
+        Duplicates of the natural key inside one batch are collapsed to the last row,
+        because one upsert statement can not affect the same row twice.
+        Books are sorted by the natural key, so concurrent batches lock rows in the same order.
+        """
+        books = self.valid_books()
+        while chunk := list(islice(books, batch_size)):
+            unique_books = {tuple(getattr(book, name) for name in self.unique_fields): book for book in chunk}
+            yield [unique_books[key] for key in sorted(unique_books)]
+
+    def valid_books(self):
+        for line_number, row in self.read():
+            book, errors = self.validate(row) if isinstance(row, dict) else (None, {"row": ["Expected an object."]})
+            if errors:
+                self.errors.append((line_number, errors))
+            else:
+                yield book
+
+    @classmethod
+    def upsert(cls, books, close_connection=False):
+        """
+        Upserts the batch of books with one statement.
+        :param books: List of Book instances.
+        :param close_connection: Close the database connection of the current thread afterwards,
+                used by worker threads.
+        :return: Number of upserted books.
+        """
+        try:
+            Book.objects.bulk_create(
+                books,
+                update_conflicts=True,
+                unique_fields=cls.unique_fields,
+                update_fields=cls.update_fields,
+            )
+        finally:
+            if close_connection:
+                connection.close()
+        return len(books)
@@ -0,0 +1,77 @@
+# Description: Load test of the book list with and without keyset pagination.
+import tracemalloc
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from library.models import Book
+from library.pagination import IdCursorPagination
+from library.serializers import BookListSerializer
+from library.views import BookListView
+
+
+class Command(BaseCommand):
+    """
+    Compares response time and peak memory of the whole catalog serialized at once,
+    as the book list worked before pagination, with the first and a deep cursor page.
+    The books are created in a transaction that is rolled back.
+    Usage example:
+    python manage.py benchmark_book_list --sizes 1000 10000 100000 1000000
+    """
+
+    help = "Compare response time and memory of the unpaginated and the cursor paginated book list."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+
+    @staticmethod
+    def measure(build):
+        tracemalloc.start()
+        started = perf_counter()
+        build()
+        elapsed = (perf_counter() - started) * 1000
+        peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+        return f"{elapsed:10.1f} ms {peak:10.2f} MiB"
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = BookListView.as_view()
+
+        with transaction.atomic():
+            user = User.objects.create(username="benchmark_book_list")
+            created = 0
+            for size in sorted(options["sizes"]):
+                Book.objects.bulk_create(
+                    (
+                        Book(title=f"Book {index}", author="Author", year=2000, short_description="...")
+                        for index in range(created, size)
+                    ),
+                    batch_size=10000,
+                )
+                created = size
+
+                pagination = IdCursorPagination()
+                pagination.base_url = "/api/v1/library/books/"
+                deep_position = Book.objects.order_by("-id").values_list("id", flat=True)[
+                    pagination.page_size
+                ]
+                deep_page_url = pagination.encode_cursor(Cursor(offset=0, reverse=False, position=deep_position))
+
+                def get_page(url):
+                    request = factory.get(url, HTTP_HOST="localhost")
+                    force_authenticate(request, user=user)
+                    return view(request).render()
+
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{size} books"))
+                self.stdout.write(
+                    "whole catalog " + self.measure(lambda: BookListSerializer(Book.objects.all(), many=True).data)
+                )
+                self.stdout.write("first page    " + self.measure(lambda: get_page(pagination.base_url)))
+                self.stdout.write("deep page     " + self.measure(lambda: get_page(deep_page_url)))
+
+            transaction.set_rollback(True)
@@ -0,0 +1,91 @@
+# Description: Benchmark of the indexed catalog search against filtering the whole list on the client.
+import random
+import statistics
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from library.models import Book, BookQuerySet
+
+
+class Command(BaseCommand):
+    """
+    Seeds books with generate_series, then compares the p50/p95 latency of a search page served
+    by the GIN index with downloading the whole catalog and filtering it, as clients did before the search.
+    Everything runs in one transaction that is rolled back, so use a scratch database.
+    Usage example:
+    python manage.py benchmark_book_search --books 1000000
+    """
+
+    help = "Compare latency of the full-text book search with filtering the full book list."
+
+    words = ["dragon", "winter", "garden", "river", "shadow", "empire", "silence", "harbor", "mirror", "forest"]
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=1_000_000)
+        parser.add_argument("--samples", type=int, default=100)
+        parser.add_argument("--full-list-samples", type=int, default=3)
+
+    def seed(self, cursor, books):
+        words = "ARRAY[" + ", ".join(f"'{word}'" for word in self.words) + "]"
+        cursor.execute(
+            "INSERT INTO library_book (title, author, year, short_description) "
+            f"SELECT 'Book ' || i || ' ' || ({words})[1 + i %% 10], 'Author ' || (i %% 10000), "
+            f"1900 + i %% 120, 'About the ' || ({words})[1 + (i / 10) %% 10] || ' ' || md5(i::text) "
+            "FROM generate_series(1, %s) AS i",
+            [books],
+        )
+        cursor.execute("ANALYZE library_book")
+
+    @staticmethod
+    def report(name, latencies):
+        quantiles = statistics.quantiles(latencies, n=20) if len(latencies) > 1 else latencies * 19
+        return f"{name}: p50 {quantiles[9]:.3f} ms, p95 {quantiles[18]:.3f} ms"
+
+    def search_page(self, query):
+        return list(Book.objects.search(query).order_by("id").values("id", "title")[: settings.API_PAGE_SIZE])
+
+    @staticmethod
+    def full_list(query):
+        return [
+            row
+            for row in Book.objects.order_by("id").values_list("id", "title", "author", "short_description")
+            if any(query in value.lower() for value in row[1:])
+        ]
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The benchmark needs PostgreSQL.")
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            with connection.schema_editor() as editor:
+                if BookQuerySet.search_index.name not in connection.introspection.get_constraints(
+                    cursor, Book._meta.db_table
+                ):
+                    editor.add_index(Book, BookQuerySet.search_index)
+
+            started = perf_counter()
+            self.seed(cursor, options["books"])
+            self.stdout.write(f"Seeded {options['books']} books in {perf_counter() - started:.1f} s")
+
+            queries = [" ".join(random.sample(self.words, 2)) for _ in range(options["samples"])]
+            plan = Book.objects.search(queries[0]).order_by("id")[: settings.API_PAGE_SIZE].explain(analyze=True)
+            self.stdout.write(plan)
+
+            for name, run, samples in (
+                ("indexed search page", self.search_page, queries),
+                # The client side filter matches a single word, which only favours the old approach.
+                ("full list filtered", self.full_list, [query.split()[0] for query in queries][
+                    : options["full_list_samples"]
+                ]),
+            ):
+                latencies = []
+                for query in samples:
+                    started = perf_counter()
+                    run(query)
+                    latencies.append((perf_counter() - started) * 1000)
+                self.stdout.write(self.report(name, latencies))
+
+            transaction.set_rollback(True)
@@ -0,0 +1,95 @@
+# Description: Load test of the reading session heartbeats and of their flush.
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from library.heartbeats import HeartbeatBuffer
+from library.models import Book, ReadingSession
+from library.views import ReadingSessionHeartbeatView
+
+
+class Command(BaseCommand):
+    """
+    Sends heartbeats of many users to the heartbeat view from several threads at the target rate,
+    then flushes the buffer and reports the achieved rate, p50/p95 latency, flush time and statements.
+    Users and sessions are created in a transaction that is rolled back, the heartbeats go to the configured cache.
+    One process is limited by the GIL, run it in several processes or behind the application server for higher rates.
+    Usage example:
+    python manage.py benchmark_heartbeats --rate 10000 --seconds 10 --users 100000
+    """
+
+    help = "Load test the heartbeat endpoint and the batched flush of the heartbeats."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rate", type=int, default=10000, help="Target heartbeats per second.")
+        parser.add_argument("--seconds", type=int, default=10)
+        parser.add_argument("--users", type=int, default=100000)
+        parser.add_argument("--threads", type=int, default=8)
+
+    @staticmethod
+    def send(users, rate, seconds):
+        """
+        Sends heartbeats of the users round-robin at the given rate.
+        :return: List of latencies in milliseconds.
+        """
+        factory = APIRequestFactory()
+        view = ReadingSessionHeartbeatView.as_view()
+        latencies = []
+        started = perf_counter()
+        for index in range(rate * seconds):
+            delay = started + index / rate - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            request = factory.post("/api/v1/library/sessions/heartbeat")
+            force_authenticate(request, users[index % len(users)])
+            sent = perf_counter()
+            view(request)
+            latencies.append((perf_counter() - sent) * 1000)
+        return latencies
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            book = Book.objects.create(title="benchmark_heartbeats", author="Author", year=2000, short_description="")
+            User.objects.bulk_create(
+                (User(username=f"benchmark_heartbeats_{index}") for index in range(options["users"])),
+                batch_size=10000,
+            )
+            users = list(User.objects.filter(username__startswith="benchmark_heartbeats_"))
+            ReadingSession.objects.bulk_create(
+                (ReadingSession(user=user, book=book, start_time=timezone.now(), status=True) for user in users),
+                batch_size=10000,
+            )
+
+            threads = options["threads"]
+            started = perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                results = executor.map(
+                    self.send,
+                    [users[thread::threads] for thread in range(threads)],
+                    [options["rate"] // threads] * threads,
+                    [options["seconds"]] * threads,
+                )
+                latencies = [latency for thread_latencies in results for latency in thread_latencies]
+            elapsed = perf_counter() - started
+            quantiles = statistics.quantiles(latencies, n=20)
+            self.stdout.write(
+                f"Heartbeats: {len(latencies)} in {elapsed:.1f} s, {len(latencies) / elapsed:.0f}/s "
+                f"of target {options['rate']}/s, p50 {quantiles[9]:.3f} ms, p95 {quantiles[18]:.3f} ms"
+            )
+
+            with CaptureQueriesContext(connection) as context:
+                started = perf_counter()
+                flushed = HeartbeatBuffer.flush()
+                elapsed = perf_counter() - started
+            self.stdout.write(
+                f"Flush: {flushed} users in {elapsed:.2f} s, {len(context.captured_queries)} statements"
+            )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,79 @@
+# Description: Benchmark of the model serializer and the fast path of the list endpoints.
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from library.models import Book
+from library.renderers import ORJSONRenderer
+from library.serializers import BookListSerializer
+from statistic.models import BookReadingStatistics
+from statistic.serializers import BookReadingTimeSerializer
+from statistic.views import BaseReadingTimeView
+
+
+class Command(BaseCommand):
+    """
+    Measures rows per second of BookListSerializer and BookReadingTimeSerializer with JSONRenderer
+    against values() with ORJSONRenderer, the path of FastListMixin.
+    The books are created in a transaction that is rolled back.
+    Usage example:
+    python manage.py benchmark_list_serialization --rows 100000
+    """
+
+    help = "Compare rows per second of the model serializers and the values()/orjson fast path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000)
+
+    def measure(self, name, rows, render):
+        started = perf_counter()
+        content = render()
+        elapsed = perf_counter() - started
+        self.stdout.write(f"{name:30} {rows / elapsed:12.0f} rows/s {len(content) / 1024 / 1024:8.2f} MiB")
+        return content
+
+    def compare(self, title, queryset, serializer_class, rows):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        serialized = self.measure(
+            "serializer + JSONRenderer",
+            rows,
+            lambda: JSONRenderer().render(serializer_class(queryset.all(), many=True).data),
+        )
+        fast = self.measure(
+            "values() + ORJSONRenderer",
+            rows,
+            lambda: ORJSONRenderer().render(list(queryset.values(*serializer_class.Meta.fields))),
+        )
+        if fast != serialized:
+            self.stderr.write("The fast path rendered different bytes.")
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        with transaction.atomic():
+            books = Book.objects.bulk_create(
+                (
+                    Book(title=f"Book {index}", author=f"Author {index}", year=2000, short_description="...")
+                    for index in range(rows)
+                ),
+                batch_size=10000,
+            )
+            BookReadingStatistics.objects.bulk_create(
+                (
+                    BookReadingStatistics(book=book, total_reading_time=timedelta(minutes=index))
+                    for index, book in enumerate(books, start=1)
+                ),
+                batch_size=10000,
+            )
+
+            self.compare("Book list", Book.objects.order_by("id"), BookListSerializer, rows)
+            self.compare(
+                "Book reading time list",
+                BaseReadingTimeView.counted_reading_time(Book.objects.order_by("id")),
+                BookReadingTimeSerializer,
+                rows,
+            )
+
+            transaction.set_rollback(True)
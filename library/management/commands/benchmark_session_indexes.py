@@ -0,0 +1,149 @@
+# Description: Benchmark of the ReadingSession indexes on a seeded PostgreSQL table.
+import random
+import statistics
+from datetime import timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.db.models import DurationField, ExpressionWrapper, F, Sum
+from django.utils import timezone
+
+from library.models import ReadingSession
+
+
+class Command(BaseCommand):
+    """
+    Seeds reading sessions, then shows query plans and latencies of the session hot paths
+    with the previous single-column foreign key indexes and with the ReadingSession indexes.
+    Everything runs in one transaction that is rolled back, but the table is locked while it runs,
+    so use a scratch database.
+    Usage example:
+    python manage.py benchmark_session_indexes --sessions 10000000
+    """
+
+    help = "Compare query plans and latencies of the session hot paths before and after the indexes."
+
+    # Indexes that Django created for the user and book foreign keys before the composite indexes.
+    baseline_indexes = [
+        models.Index(fields=["user"], name="benchmark_session_user_idx"),
+        models.Index(fields=["book"], name="benchmark_session_book_idx"),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sessions", type=int, default=10_000_000)
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--books", type=int, default=10_000)
+        parser.add_argument("--samples", type=int, default=200)
+
+    @staticmethod
+    def seed(cursor, sessions, users, books):
+        """
+        Inserts users, books and closed sessions with generate_series, the last session of every user stays active.
+        :return: Ids of the first seeded user and book.
+        """
+        cursor.execute(
+            "INSERT INTO auth_user (password, is_superuser, username, first_name, last_name, email, "
+            "is_staff, is_active, date_joined) "
+            "SELECT '', false, 'benchmark_' || i, '', '', '', false, true, now() FROM generate_series(1, %s) AS i",
+            [users],
+        )
+        cursor.execute("SELECT min(id) FROM auth_user WHERE username LIKE %s", ["benchmark\\_%"])
+        first_user_id = cursor.fetchone()[0]
+
+        cursor.execute(
+            "INSERT INTO library_book (title, author, year, short_description) "
+            "SELECT 'Book ' || i, 'Author ' || (i %% 1000), 2000, '' FROM generate_series(1, %s) AS i "
+            "RETURNING id",
+            [books],
+        )
+        first_book_id = min(row[0] for row in cursor.fetchall())
+
+        cursor.execute(
+            "INSERT INTO library_readingsession (user_id, book_id, start_time, end_time, status) "
+            "SELECT %(user)s + i %% %(users)s, %(book)s + (i * 7919) %% %(books)s, start_time, "
+            "CASE WHEN i > %(sessions)s - %(users)s THEN NULL ELSE start_time + random() * interval '2 hours' END, "
+            "i > %(sessions)s - %(users)s "
+            "FROM (SELECT i, now() - random() * interval '365 days' AS start_time "
+            "FROM generate_series(1, %(sessions)s) AS i) AS seeded",
+            {"user": first_user_id, "users": users, "book": first_book_id, "books": books, "sessions": sessions},
+        )
+        return first_user_id, first_book_id
+
+    @staticmethod
+    def hot_paths(user_id, book_id):
+        date_from = timezone.now() - timedelta(days=30)
+        duration = ExpressionWrapper(F("end_time") - F("start_time"), output_field=DurationField())
+        return {
+            "active session of user": ReadingSession.objects.filter(user_id=user_id, status=True),
+            "user sessions for 30 days": ReadingSession.objects.filter(user_id=user_id, end_time__gte=date_from),
+            "book reading time for 30 days": ReadingSession.objects.filter(
+                book_id=book_id, end_time__gte=date_from
+            ).values("book_id").annotate(total=Sum(duration)),
+        }
+
+    def measure(self, options, first_user_id, first_book_id):
+        """
+        Prints the plan of every hot path and its p50/p95 latency over random users and books.
+        """
+        samples = [
+            (
+                first_user_id + random.randrange(options["users"]),
+                first_book_id + random.randrange(options["books"]),
+            )
+            for _ in range(options["samples"])
+        ]
+        for name, queryset in self.hot_paths(*samples[0]).items():
+            self.stdout.write(f"--- {name}")
+            self.stdout.write(queryset.explain(analyze=True))
+
+            latencies = []
+            for user_id, book_id in samples:
+                started = perf_counter()
+                list(self.hot_paths(user_id, book_id)[name])
+                latencies.append((perf_counter() - started) * 1000)
+            quantiles = statistics.quantiles(latencies, n=20)
+            self.stdout.write(f"p50 {quantiles[9]:.3f} ms, p95 {quantiles[18]:.3f} ms")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The benchmark needs PostgreSQL.")
+
+        meta = ReadingSession._meta
+        # The active session constraint is added by library.apps rather than Meta,
+        # and a partitioned table does not have it.
+        constraints = [] if ReadingSession.objects.is_partitioned() else [ReadingSession.active_session_constraint]
+        with transaction.atomic(), connection.cursor() as cursor:
+            with connection.schema_editor() as editor:
+                for index in meta.indexes:
+                    editor.remove_index(ReadingSession, index)
+                for constraint in constraints:
+                    editor.remove_constraint(ReadingSession, constraint)
+                for index in self.baseline_indexes:
+                    editor.add_index(ReadingSession, index)
+
+            started = perf_counter()
+            first_user_id, first_book_id = self.seed(
+                cursor, options["sessions"], options["users"], options["books"]
+            )
+            cursor.execute("ANALYZE library_readingsession")
+            self.stdout.write(f"Seeded {options['sessions']} sessions in {perf_counter() - started:.1f} s")
+
+            self.stdout.write(self.style.MIGRATE_HEADING("Before: foreign key indexes"))
+            self.measure(options, first_user_id, first_book_id)
+
+            started = perf_counter()
+            with connection.schema_editor() as editor:
+                for index in self.baseline_indexes:
+                    editor.remove_index(ReadingSession, index)
+                for index in meta.indexes:
+                    editor.add_index(ReadingSession, index)
+                for constraint in constraints:
+                    editor.add_constraint(ReadingSession, constraint)
+            cursor.execute("ANALYZE library_readingsession")
+            self.stdout.write(f"Built indexes in {perf_counter() - started:.1f} s")
+
+            self.stdout.write(self.style.MIGRATE_HEADING("After: composite and partial indexes"))
+            self.measure(options, first_user_id, first_book_id)
+
+            transaction.set_rollback(True)
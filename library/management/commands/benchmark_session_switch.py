@@ -0,0 +1,62 @@
+# Description: Latency benchmark of starting and closing reading sessions.
+import statistics
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from library.models import Book, ReadingSession
+
+
+class Command(BaseCommand):
+    """
+    Measures p50/p95 latency and the number of statements of ReadingSessionManager.start() and close_active().
+    The benchmark user, books and sessions are created in a transaction that is rolled back.
+    Usage example:
+    python manage.py benchmark_session_switch --iterations 1000
+    """
+
+    help = "Measure latency and statements of starting, switching and closing reading sessions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=1000)
+
+    def report(self, name, latencies, statements):
+        quantiles = statistics.quantiles(latencies, n=20)
+        self.stdout.write(
+            f"{name}: p50 {quantiles[9]:.3f} ms, p95 {quantiles[18]:.3f} ms, "
+            f"{statistics.mean(statements):.1f} statements per call"
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create(username="benchmark_session_switch")
+            books = [
+                Book.objects.create(title=f"Book {index}", author="Author", year=2000, short_description="")
+                for index in range(2)
+            ]
+
+            timings = {"start": [], "close": []}
+            statements = {"start": [], "close": []}
+            for iteration in range(options["iterations"]):
+                for name, operation in (
+                    ("start", lambda: ReadingSession.objects.start(user.pk, books[iteration % 2].pk)),
+                    ("close", lambda: ReadingSession.objects.close_active(user.pk)),
+                ):
+                    if iteration % 2 and name == "close":
+                        # Every other iteration switches books without closing, to measure the switch path.
+                        continue
+                    with CaptureQueriesContext(connection) as context:
+                        started = perf_counter()
+                        operation()
+                        timings[name].append((perf_counter() - started) * 1000)
+                    statements[name].append(
+                        sum("SAVEPOINT" not in query["sql"] for query in context.captured_queries)
+                    )
+
+            for name, latencies in timings.items():
+                self.report(name, latencies, statements[name])
+
+            transaction.set_rollback(True)
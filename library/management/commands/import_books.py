@@ -0,0 +1,60 @@
+# Description: Imports the book catalog from CSV or JSONL files.
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.importers import BookImporter
+
+
+class Command(BaseCommand):
+    """
+    Streams books from a CSV or JSONL file and upserts them on (title, author, year) in batches.
+    With several workers the batches are written by a thread pool, at most two batches per worker are kept in memory.
+    Invalid rows are skipped and reported with their line numbers.
+    Usage example:
+    python manage.py import_books catalog.jsonl --batch-size 2000 --workers 4
+    """
+
+    help = "Import books from a CSV or JSONL file, re-importing the same file is idempotent."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", dest="import_format", choices=BookImporter.formats)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1 or options["workers"] < 1:
+            raise CommandError("--batch-size and --workers must be positive.")
+
+        importer = BookImporter(options["path"], options["import_format"])
+        started = perf_counter()
+        try:
+            if options["workers"] == 1:
+                imported = sum(map(importer.upsert, importer.batches(options["batch_size"])))
+            else:
+                imported = self.import_in_parallel(importer, options["batch_size"], options["workers"])
+        except FileNotFoundError as error:
+            raise CommandError(error)
+        elapsed = perf_counter() - started
+
+        for line_number, errors in importer.errors:
+            self.stderr.write(f"Line {line_number}: {errors}")
+        self.stdout.write(
+            f"Imported {imported} books, skipped {len(importer.errors)} invalid rows "
+            f"in {elapsed:.2f} s ({imported / elapsed if elapsed else 0:.0f} books/s)."
+        )
+
+    @staticmethod
+    def import_in_parallel(importer, batch_size, workers):
+        imported = 0
+        pending = set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in importer.batches(batch_size):
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    imported += sum(future.result() for future in done)
+                pending.add(executor.submit(importer.upsert, batch, close_connection=True))
+            imported += sum(future.result() for future in wait(pending).done)
+        return imported
@@ -0,0 +1,49 @@
+# Description: Creates and detaches the monthly partitions of the reading sessions.
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from library.models import ReadingSession
+from library.partitions import ReadingSessionPartitions
+from statistic.models import BookReadingTotal
+
+
+class Command(BaseCommand):
+    """
+    Converts the reading session table into monthly range partitions on start_time once with --convert,
+    in a maintenance window, the table is locked while its rows are copied,
+    then creates the partitions of the next months and detaches the partitions older than the retention.
+    The same maintenance runs daily as the maintain_reading_session_partitions task. PostgreSQL only.
+    Usage example:
+    python manage.py partition_reading_sessions --convert
+    python manage.py partition_reading_sessions --months-ahead 6 --retention-months 24
+    """
+
+    help = "Partition the reading sessions by month of the start time, create and detach partitions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--convert", action="store_true", help="Convert the existing table, once.")
+        parser.add_argument("--months-ahead", type=int, default=settings.READING_SESSION_PARTITIONS_AHEAD)
+        parser.add_argument(
+            "--retention-months", type=int, default=settings.READING_SESSION_PARTITION_RETENTION_MONTHS
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning of the reading sessions requires PostgreSQL.")
+        partitioned = ReadingSession.objects.is_partitioned()
+
+        if options["convert"]:
+            if partitioned:
+                raise CommandError("The reading sessions are already partitioned.")
+            copied = ReadingSessionPartitions.convert(options["months_ahead"])
+            # The view of the per-book totals was dropped with the old table.
+            BookReadingTotal.create_view(connection.alias, replace=True)
+            self.stdout.write(f"Converted {ReadingSessionPartitions.table}, copied {copied} sessions.")
+        elif not partitioned:
+            raise CommandError("The reading sessions are not partitioned, run with --convert first.")
+
+        created, detached = ReadingSessionPartitions.maintain(options["months_ahead"], options["retention_months"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Created {created} partitions, detached {len(detached)}: {', '.join(detached)}")
+        )
@@ -1,5 +1,48 @@
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db import IntegrityError, connection, connections, models, transaction
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+
+from library.signals import reading_sessions_closed
+
+
+class BookQuerySet(models.QuerySet):
+    # Language independent configuration, the catalog has titles in several languages.
+    search_config = "simple"
+    search_vector = SearchVector("title", "author", "short_description", config=search_config)
+    # Created by library.apps on PostgreSQL only, the expression must stay the same as search_vector.
+    search_index = GinIndex(search_vector, name="book_search_vector_idx")
+
+    def search(self, query):
+        """
+        Full-text search over title, author and short description.
+        On PostgreSQL the query is parsed as a web search query and matched against the GIN indexed search vector,
+        other databases fall back to a case-insensitive substring match.
+        :param query: Search string entered by the user.
+        """
+        if connection.vendor != "postgresql":
+            return self.filter(
+                models.Q(title__icontains=query)
+                | models.Q(author__icontains=query)
+                | models.Q(short_description__icontains=query)
+            )
+        return self.alias(search=self.search_vector).filter(
+            search=SearchQuery(query, config=self.search_config, search_type="websearch")
+        )
+
+    def with_last_read_date(self, user):
+        """
+        Annotates each book with the end time of the last closed reading session of the user,
+        the correlated subquery is served by the (book, end_time) index.
+        :param user: User whose reading sessions are considered, e.g. the user of the request.
+        """
+        last_session = ReadingSession.objects.filter(
+            book=models.OuterRef("pk"), user=user, end_time__isnull=False
+        ).order_by("-end_time")
+        return self.annotate(last_read_date=models.Subquery(last_session.values("end_time")[:1]))
 
 
 class Book(models.Model):
@@ -9,16 +52,217 @@ class Book(models.Model):
     short_description = models.TextField(max_length=128)
     full_description = models.TextField(max_length=256, null=True, blank=True)
 
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Natural key of the catalog, the import upserts books on it.
+            models.UniqueConstraint(fields=["title", "author", "year"], name="unique_book_natural_key"),
+        ]
+        indexes = [
+            models.Index(fields=["author", "year"], name="book_author_year_idx"),
+        ]
+
     def __str__(self):
         return self.title
 
 
+class ReadingSessionManager(models.Manager):
+    """
+    Start and close reading sessions with UPDATE ... RETURNING and INSERT ... SELECT ... RETURNING,
+    so switching to another book takes two statements in one transaction.
+    """
+
+    # The active session is switched inside one transaction, a concurrent start of the same user
+    # may still win the race for the unique active session index. Then the switch is retried
+    # with the user row locked, so the retries of concurrent starts are serialized.
+    # The partitioned table has no unique active session index, so every start locks the user row.
+    start_attempts = 5
+
+    def is_partitioned(self):
+        """
+        Checks the schema on every call, not once per process, so the processes that were started before
+        the table was converted lock the user row as well. The catalog lookup is an index scan.
+        :return: True if the reading session table is partitioned, always False on other databases than PostgreSQL.
+        """
+        db_connection = connections[self.db]
+        if db_connection.vendor != "postgresql":
+            return False
+        with db_connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [self.model._meta.db_table]
+            )
+            return cursor.fetchone() is not None
+
+    def close_active(self, user_id, book_id=None, end_time=None):
+        """
+        Closes the active reading sessions of the user with a single statement.
+        :param user_id: Id of the user whose reading sessions should be closed.
+        :param book_id: Optional book identifier, if provided only the sessions of that book are closed.
+        :param end_time: End time of the closed sessions, the current time by default.
+        :return: List of the closed ReadingSession instances.
+        """
+        end_time = end_time or timezone.now()
+        sql = (
+            f"UPDATE {self.model._meta.db_table} SET end_time = %s, status = %s "
+            f"WHERE user_id = %s AND status = %s"
+        )
+        params = [connections[self.db].ops.adapt_datetimefield_value(end_time), False, user_id, True]
+        if book_id is not None:
+            sql += " AND book_id = %s"
+            params.append(book_id)
+        sql += " RETURNING id, user_id, book_id, start_time, end_time, last_seen, status"
+
+        with transaction.atomic(using=self.db):
+            closed_sessions = list(self.raw(sql, params))
+            if closed_sessions:
+                reading_sessions_closed.send(sender=self.model, sessions=closed_sessions)
+        return closed_sessions
+
+    def record_completed(self, user_id, sessions):
+        """
+        Inserts completed reading sessions with bulk_create in chunks of BULK_SESSIONS_BATCH_SIZE
+        and sends reading_sessions_closed, so the reading time aggregates are updated.
+        :param user_id: Id of the user who read.
+        :param sessions: Iterable of dicts with book_id, start_time and end_time.
+        :return: List of the created ReadingSession instances.
+        """
+        with transaction.atomic():
+            created_sessions = self.bulk_create(
+                [self.model(user_id=user_id, status=False, **session) for session in sessions],
+                batch_size=settings.BULK_SESSIONS_BATCH_SIZE,
+            )
+            if created_sessions:
+                reading_sessions_closed.send(sender=self.model, sessions=created_sessions)
+        return created_sessions
+
+    def close_stale(self, idle_limit, max_duration, batch_size):
+        """
+        Closes the sessions without activity for longer than idle_limit, in batches of batch_size sessions,
+        each batch in its own short transaction. The activity is the last heartbeat, or the start without heartbeats.
+        A stale session with heartbeats ends at its last heartbeat, so only the active time is counted,
+        a session without heartbeats ends max_duration after its start, but not later than now.
+        Rows locked by a concurrent start or end of the session are skipped.
+        :param idle_limit: Sessions without activity since now - idle_limit are stale.
+        :param max_duration: Cap of the duration of a stale session without heartbeats.
+        :param batch_size: Number of sessions closed per transaction.
+        :return: Number of closed sessions.
+        """
+        now = timezone.now()
+        stale = self.alias(last_activity=Coalesce("last_seen", "start_time")).filter(
+            status=True, last_activity__lt=now - idle_limit
+        )
+        closed = 0
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    stale.select_for_update(skip_locked=True)
+                    .order_by("last_activity")
+                    .values_list("id", "user_id", "book_id", "start_time", "last_seen")[:batch_size]
+                )
+                if not rows:
+                    return closed
+                self.filter(pk__in=[row[0] for row in rows]).update(
+                    end_time=Coalesce(
+                        "last_seen", Least(models.F("start_time") + max_duration, models.Value(now))
+                    ),
+                    status=False,
+                )
+                closed_sessions = [
+                    self.model(
+                        id=session_id,
+                        user_id=user_id,
+                        book_id=book_id,
+                        start_time=start_time,
+                        end_time=last_seen or min(start_time + max_duration, now),
+                        last_seen=last_seen,
+                        status=False,
+                    )
+                    for session_id, user_id, book_id, start_time, last_seen in rows
+                ]
+                reading_sessions_closed.send(sender=self.model, sessions=closed_sessions)
+            closed += len(rows)
+            if len(rows) < batch_size:
+                return closed
+
+    def start(self, user_id, book_id):
+        """
+        Closes the active reading session of the user and starts a new one for the book atomically.
+        Sessions are only closed if the book exists.
+        :param user_id: Id of the user who starts reading.
+        :param book_id: Id of the book.
+        :return: The new active ReadingSession instance or None if the book does not exist.
+        """
+        book_table = Book._meta.db_table
+        session_table = self.model._meta.db_table
+        db_connection = connections[self.db]
+        for attempt in range(1, self.start_attempts + 1):
+            now = timezone.now()
+            db_now = db_connection.ops.adapt_datetimefield_value(now)
+            try:
+                with transaction.atomic(using=self.db):
+                    if attempt > 1 or self.is_partitioned():
+                        list(User.objects.using(self.db).select_for_update().filter(pk=user_id).values_list("pk"))
+                    closed_sessions = list(
+                        self.raw(
+                            f"UPDATE {session_table} SET end_time = %s, status = %s "
+                            f"WHERE user_id = %s AND status = %s "
+                            f"AND EXISTS (SELECT 1 FROM {book_table} WHERE id = %s) "
+                            f"RETURNING id, user_id, book_id, start_time, end_time, last_seen, status",
+                            [db_now, False, user_id, True, book_id],
+                        )
+                    )
+                    started_sessions = list(
+                        self.raw(
+                            f"INSERT INTO {session_table} (user_id, book_id, start_time, status) "
+                            f"SELECT %s, id, %s, %s FROM {book_table} WHERE id = %s "
+                            f"RETURNING id, user_id, book_id, start_time, end_time, last_seen, status",
+                            [user_id, db_now, True, book_id],
+                        )
+                    )
+                    if closed_sessions:
+                        reading_sessions_closed.send(sender=self.model, sessions=closed_sessions)
+            except IntegrityError:
+                if attempt == self.start_attempts:
+                    raise
+                continue
+
+            return started_sessions[0] if started_sessions else None
+
+
 class ReadingSession(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    book = models.ForeignKey(Book, on_delete=models.CASCADE)
-    start_time = models.DateTimeField(auto_now_add=True)
+    # The composite indexes below start with user and book, so separate FK indexes are not needed.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False)
+    start_time = models.DateTimeField(default=timezone.now)
     end_time = models.DateTimeField(null=True, blank=True)
+    # Time of the last heartbeat of the active session, written in batches by HeartbeatBuffer.flush().
+    last_seen = models.DateTimeField(null=True, blank=True)
     status = models.BooleanField(default=False)
 
+    objects = ReadingSessionManager()
+
+    # Partial unique index, also serves the lookup of the active session of a user. A partitioned table cannot
+    # have it, so it is not declared in Meta and is created by library.apps only if the table is not partitioned.
+    active_session_constraint = models.UniqueConstraint(
+        fields=["user"], condition=models.Q(status=True), name="unique_active_session_per_user"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "end_time"], name="session_user_end_time_idx"),
+            models.Index(fields=["book", "end_time"], name="session_book_end_time_idx"),
+            # Partial index of the active sessions only, the sweeper of stale sessions scans it by last activity.
+            models.Index(
+                Coalesce("last_seen", "start_time"),
+                condition=models.Q(status=True),
+                name="session_active_activity_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.book.title}"
+
+    @property
+    def duration(self):
+        return self.end_time - self.start_time if self.end_time else None
@@ -0,0 +1,45 @@
+# Description: Pagination classes and the fast path of the list endpoints of library and statistic apps.
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from library.renderers import ORJSONRenderer
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key, every page is an index range scan,
+    so deep pages cost the same as the first one.
+    The page size is API_PAGE_SIZE and can be changed by the page_size query parameter.
+    """
+
+    page_size = settings.API_PAGE_SIZE
+    ordering = "id"
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+class FastListMixin:
+    """
+    Opt-in fast path for list views, enabled by the FAST_LIST_SERIALIZATION setting.
+    Rows are fetched with values() in the order of the serializer fields and rendered by ORJSONRenderer,
+    so no serializer fields are built per row. The response is the same as with the serializer,
+    only plain model fields and annotations may be listed in the serializer fields.
+    """
+
+    def get_renderers(self):
+        if settings.FAST_LIST_SERIALIZATION:
+            return [ORJSONRenderer()]
+        return super().get_renderers()
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_LIST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+
+        fields = self.get_serializer_class().Meta.fields
+        queryset = self.filter_queryset(self.get_queryset()).values(*fields)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(list(queryset))
@@ -0,0 +1,173 @@
+# Description: Monthly range partitions of the reading sessions by start time, PostgreSQL only.
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+from library.models import ReadingSession
+
+
+class ReadingSessionPartitions:
+    """
+    Declarative range partitioning of the reading session table on start_time, one partition per month.
+    The existing table is converted once, its rows are copied into the monthly partitions of their start,
+    so every month, including the history, can be pruned by the queries filtered by start_time,
+    like the histograms and the exports, and detached after the retention.
+    Sessions that start before the first partition or in a detached month, e.g. old sessions of the offline
+    clients, are stored in the DEFAULT partition, which is never detached. Partitions are only created
+    after the last one, for months no session can start in yet, so the DEFAULT partition has no rows of them.
+    A partitioned table cannot have a unique index without the partition key, so the unique active session
+    of a user is not created on it, see ReadingSession.active_session_constraint, and starting a session
+    locks the user row instead.
+    """
+
+    table = ReadingSession._meta.db_table
+    legacy_table = f"{table}_legacy"
+    default_partition = f"{table}_default"
+    active_user_index = "session_active_user_idx"
+    bound_pattern = re.compile(r"TO \('([^']+)'\)")
+
+    @staticmethod
+    def month_start(value):
+        return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+    @staticmethod
+    def add_months(month, months):
+        index = month.year * 12 + month.month - 1 + months
+        return month.replace(year=index // 12, month=index % 12 + 1)
+
+    @classmethod
+    def partition_name(cls, month):
+        return f"{cls.table}_y{month.year}m{month.month:02d}"
+
+    @classmethod
+    def get_partitions(cls):
+        """
+        :return: List of tuples (partition name, upper bound of start_time) ordered by the bound,
+                 without the DEFAULT partition.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid WHERE pg_inherits.inhparent = %s::regclass "
+                "AND child.relname <> %s",
+                [cls.table, cls.default_partition],
+            )
+            partitions = [
+                (name, datetime.fromisoformat(cls.bound_pattern.search(bound).group(1)))
+                for name, bound in cursor.fetchall()
+            ]
+        return sorted(partitions, key=lambda partition: partition[1])
+
+    @classmethod
+    def convert(cls, months_ahead):
+        """
+        Converts the reading session table into a partitioned table in one transaction. The table is locked
+        exclusively while its rows are copied into the monthly partitions, so it should run in a maintenance window.
+        The views that select from the table are dropped with it, the caller has to recreate them.
+        :param months_ahead: Number of monthly partitions to create after the current month.
+        :return: Number of the copied sessions.
+        """
+        now = datetime.now(dt_timezone.utc)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {cls.table} IN ACCESS EXCLUSIVE MODE")
+                bounds = ReadingSession.objects.aggregate(last_id=Max("id"), first_start=Min("start_time"))
+                cursor.execute(
+                    "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                    "WHERE conrelid = %s::regclass AND contype = 'f'",
+                    [cls.table],
+                )
+                foreign_keys = cursor.fetchall()
+
+                cursor.execute(f"ALTER TABLE {cls.table} RENAME TO {cls.legacy_table}")
+                cursor.execute(
+                    f"CREATE TABLE {cls.table} (LIKE {cls.legacy_table} INCLUDING DEFAULTS) "
+                    f"PARTITION BY RANGE (start_time)"
+                )
+
+            cls.create_partitions(months_ahead, start=cls.month_start(bounds["first_start"] or now))
+            with connection.cursor() as cursor:
+                cursor.execute(f"CREATE TABLE {cls.default_partition} PARTITION OF {cls.table} DEFAULT")
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {cls.table} SELECT * FROM {cls.legacy_table}")
+                copied = cursor.rowcount
+                # The primary key index and the id sequence keep their names until the old table is dropped.
+                cursor.execute(f"DROP TABLE {cls.legacy_table} CASCADE")
+                cursor.execute(f"CREATE SEQUENCE {cls.table}_id_seq OWNED BY {cls.table}.id")
+                last_id = bounds["last_id"]
+                cursor.execute("SELECT setval(%s, %s, %s)", [f"{cls.table}_id_seq", last_id or 1, bool(last_id)])
+                cursor.execute(f"ALTER TABLE {cls.table} ALTER COLUMN id SET DEFAULT nextval('{cls.table}_id_seq')")
+                cursor.execute(f"ALTER TABLE {cls.table} ADD PRIMARY KEY (id, start_time)")
+                for name, definition in foreign_keys:
+                    cursor.execute(f"ALTER TABLE {cls.table} ADD CONSTRAINT {name} {definition}")
+
+            # The indexes are built once the rows are copied.
+            with connection.schema_editor() as editor:
+                for index in ReadingSession._meta.indexes:
+                    editor.add_index(ReadingSession, index)
+            with connection.cursor() as cursor:
+                cursor.execute(f"CREATE INDEX {cls.active_user_index} ON {cls.table} (user_id) WHERE status")
+        return copied
+
+    @classmethod
+    def create_partitions(cls, months_ahead, start=None):
+        """
+        Creates the missing monthly partitions from the end of the last partition,
+        or from start, to months_ahead months after the current month.
+        :return: Number of created partitions.
+        """
+        partitions = cls.get_partitions()
+        month = start or (partitions[-1][1] if partitions else cls.month_start(datetime.now(dt_timezone.utc)))
+        last_month = cls.add_months(cls.month_start(datetime.now(dt_timezone.utc)), months_ahead)
+        created = 0
+        with connection.cursor() as cursor:
+            while month <= last_month:
+                next_month = cls.add_months(month, 1)
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {cls.partition_name(month)} PARTITION OF {cls.table} "
+                    f"FOR VALUES FROM (%s) TO (%s)",
+                    [month, next_month],
+                )
+                month = next_month
+                created += 1
+        return created
+
+    @classmethod
+    def detach_partitions(cls, before):
+        """
+        Detaches the partitions whose rows all started before the given time, the detached tables are kept
+        as they are, as the archive of the sessions. A partition with active sessions, and all after it,
+        stay attached.
+        The reading time counters and buckets already include the detached sessions,
+        sessions of the detached months that are recorded later are stored in the DEFAULT partition.
+        :param before: Upper bound of the start_time of the detached partitions.
+        :return: Names of the detached partitions.
+        """
+        detached = []
+        for name, bound in cls.get_partitions():
+            if bound > before:
+                break
+            if ReadingSession.objects.filter(status=True, start_time__lt=bound).exists():
+                break
+            with connection.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {cls.table} DETACH PARTITION {name}")
+            detached.append(name)
+        return detached
+
+    @classmethod
+    def maintain(cls, months_ahead, retention_months=None):
+        """
+        Creates the partitions of the next months and detaches the partitions older than the retention.
+        Is a no-op if the table is not partitioned.
+        :return: Tuple (number of created partitions, names of the detached partitions).
+        """
+        if not ReadingSession.objects.is_partitioned():
+            return 0, []
+        created = cls.create_partitions(months_ahead)
+        detached = []
+        if retention_months is not None:
+            cutoff = cls.add_months(cls.month_start(datetime.now(dt_timezone.utc)), -retention_months)
+            detached = cls.detach_partitions(cutoff)
+        return created, detached
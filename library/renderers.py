@@ -0,0 +1,30 @@
+# Description: Renderers for library and statistic apps.
+from datetime import timedelta
+
+import orjson
+from django.utils.duration import duration_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON renderer based on orjson, renders the same bytes as the compact JSONRenderer.
+    Durations are rendered as the DurationField of the serializers renders them.
+    """
+
+    encoder = JSONEncoder()
+
+    @classmethod
+    def default(cls, obj):
+        if isinstance(obj, timedelta):
+            return duration_string(obj)
+        return cls.encoder.default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        ret = orjson.dumps(data, default=self.default)
+        # JSONRenderer escapes the unicode line separators, they are not valid in JavaScript strings.
+        return ret.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
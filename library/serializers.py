@@ -1,4 +1,6 @@
 # Description: Serializers for library app.
+from django.db.models import Max
+from django.utils import timezone
 from rest_framework import serializers
 
 from library.models import Book, ReadingSession
@@ -14,10 +16,21 @@ class BookListSerializer(serializers.ModelSerializer):
         fields = ["id", "title", "author", "year", "short_description"]
 
 
+class BookSearchSerializer(serializers.Serializer):
+    """
+    Serializer for the search and filter query parameters of the book list.
+    """
+
+    q = serializers.CharField(required=False, max_length=256)
+    author = serializers.CharField(required=False, max_length=50)
+    year = serializers.IntegerField(required=False)
+
+
 class BookRetrieveSerializer(serializers.ModelSerializer):
     """
-    Serializer for detailed book view, including last read date.
-    Method get_last_read_date() is used to get the date of the last reading session.
+    Serializer for detailed book view, including last read date of the user of the request.
+    Method get_last_read_date() is used to get the date of the last reading session,
+    use it with Book.objects.with_last_read_date(user) to avoid a query per book.
     """
 
     last_read_date = serializers.SerializerMethodField()
@@ -36,12 +49,18 @@ class BookRetrieveSerializer(serializers.ModelSerializer):
 
     def get_last_read_date(self, obj):
         """
-        Get the date of the last reading session.
+        Get the date of the last reading session of the user of the request, None without a request.
+        The date is taken from the last_read_date annotation, the query is only made for not annotated books.
         :param obj:
         :return:
         """
-        last_reading_session = obj.readingsession_set.last()
-        return last_reading_session.end_time if last_reading_session else None
+        if hasattr(obj, "last_read_date"):
+            return obj.last_read_date
+        request = self.context.get("request")
+        if request is None:
+            return None
+        sessions = obj.readingsession_set.filter(user=request.user)
+        return sessions.aggregate(last_read_date=Max("end_time"))["last_read_date"]
 
 
 class StartReadingSessionSerializer(serializers.ModelSerializer):
@@ -56,9 +75,29 @@ class StartReadingSessionSerializer(serializers.ModelSerializer):
 
 class EndReadingSessionSerializer(serializers.ModelSerializer):
     """
-    Serializer for ReadingSession model.
+    Serializer for ReadingSession model, including the duration of the closed session.
     """
 
+    duration = serializers.DurationField(read_only=True)
+
     class Meta:
         model = ReadingSession
-        fields = ["user", "book", "end_time"]
+        fields = ["user", "book", "end_time", "duration"]
+
+
+class CompletedReadingSessionSerializer(serializers.Serializer):
+    """
+    Serializer for one completed reading session of the bulk ingestion.
+    The book is validated by the view for all sessions at once.
+    """
+
+    book = serializers.IntegerField(min_value=1)
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+
+    def validate(self, attrs):
+        if attrs["end_time"] <= attrs["start_time"]:
+            raise serializers.ValidationError("end_time must be later than start_time.")
+        if attrs["end_time"] > timezone.now():
+            raise serializers.ValidationError("end_time can not be in the future.")
+        return attrs
@@ -0,0 +1,6 @@
+# Description: Signals of the library app.
+from django.dispatch import Signal
+
+# Sent after active reading sessions were closed or completed reading sessions were recorded.
+# Arguments: sessions - list of closed ReadingSession instances with end_time already set.
+reading_sessions_closed = Signal()
@@ -0,0 +1,27 @@
+# Description: This file contains the periodic tasks of the reading sessions.
+from celery import shared_task
+from django.conf import settings
+
+from library.heartbeats import HeartbeatBuffer
+from library.models import ReadingSession
+from library.partitions import ReadingSessionPartitions
+
+
+@shared_task
+def close_stale_reading_sessions():
+    return ReadingSession.objects.close_stale(
+        settings.STALE_SESSION_IDLE_LIMIT, settings.STALE_SESSION_MAX_DURATION, settings.STALE_SESSION_BATCH_SIZE
+    )
+
+
+@shared_task
+def flush_heartbeats():
+    return HeartbeatBuffer.flush()
+
+
+@shared_task
+def maintain_reading_session_partitions():
+    created, detached = ReadingSessionPartitions.maintain(
+        settings.READING_SESSION_PARTITIONS_AHEAD, settings.READING_SESSION_PARTITION_RETENTION_MONTHS
+    )
+    return created + len(detached)
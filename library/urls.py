@@ -1,7 +1,14 @@
 # Description: URL patterns for the library app
 from django.urls import path
 
-from library.views import BookListView, BookRetrieveView, EndReadingSessionView, StartReadingSessionView
+from library.views import (
+    BookListView,
+    BookRetrieveView,
+    BulkReadingSessionView,
+    EndReadingSessionView,
+    ReadingSessionHeartbeatView,
+    StartReadingSessionView,
+)
 
 urlpatterns = [
     path("books/", BookListView.as_view(), name="books"),
@@ -11,6 +18,21 @@ urlpatterns = [
         StartReadingSessionView.as_view(),
         name="start-reading-session",
     ),
+    path(
+        "sessions/bulk",
+        BulkReadingSessionView.as_view(),
+        name="bulk-reading-sessions",
+    ),
+    path(
+        "sessions/heartbeat",
+        ReadingSessionHeartbeatView.as_view(),
+        name="reading-session-heartbeat",
+    ),
+    path(
+        "sessions/end",
+        EndReadingSessionView.as_view(),
+        name="end-all-reading-sessions",
+    ),
     path(
         "sessions/<int:book_id>/end",
         EndReadingSessionView.as_view(),
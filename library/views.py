@@ -1,15 +1,28 @@
 # Description: Views for library app.
-from django.utils import timezone
+from bisect import bisect_left
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404
 from rest_framework import status
-from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveAPIView, get_object_or_404
+from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from library.heartbeats import HeartbeatBuffer
 from library.models import Book, ReadingSession
+from library.pagination import FastListMixin, IdCursorPagination
 from library.serializers import (
     BookListSerializer,
     BookRetrieveSerializer,
+    BookSearchSerializer,
+    CompletedReadingSessionSerializer,
     EndReadingSessionSerializer,
     StartReadingSessionSerializer,
 )
@@ -25,15 +38,31 @@ class BaseBookView:
     queryset = Book.objects.all()
 
 
-class BookListView(BaseBookView, ListAPIView):
+class BookListView(FastListMixin, BaseBookView, ListAPIView):
     """
-    View for list books.
+    View for list books, paginated by the book id.
+    Books can be searched by title, author and short description with q and filtered by author and year.
     Usage example:
-    GET api/v1/library/books/
+    GET api/v1/library/books/?page_size=50
+    GET api/v1/library/books/?q=harry potter&year=1997
     """
 
     serializer_class = BookListSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = IdCursorPagination
+
+    def filter_queryset(self, queryset):
+        serializer = BookSearchSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        if "q" in params:
+            queryset = queryset.search(params["q"])
+        if "author" in params:
+            queryset = queryset.filter(author=params["author"])
+        if "year" in params:
+            queryset = queryset.filter(year=params["year"])
+        return queryset
 
 
 class BookRetrieveView(BaseBookView, RetrieveAPIView):
@@ -47,6 +76,9 @@ class BookRetrieveView(BaseBookView, RetrieveAPIView):
     serializer_class = BookRetrieveSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        return Book.objects.with_last_read_date(self.request.user)
+
 
 class StartReadingSessionView(CreateAPIView):
     """
@@ -66,6 +98,7 @@ class StartReadingSessionView(CreateAPIView):
         This method is used to create a record of the start of a new book reading session by the user.
         Before creating a new session, all previous active reading sessions are automatically closed
         this user to ensure that only one reading session is active at a time.
+        Closing and creating run in one transaction, see ReadingSessionManager.start().
 
         :param request: Request object from the user. Includes user data and other metadata.
         :param args: Additional positional arguments (not used in this method).
@@ -73,12 +106,10 @@ class StartReadingSessionView(CreateAPIView):
         :return: HTTP response with new reading session data if creation was successful, otherwise -
               response with the appropriate error status.
         """
-        book = get_object_or_404(Book, pk=kwargs.get("book_id"))
-        EndReadingSessionView.end_active_sessions(request.user)
+        reading_session = ReadingSession.objects.start(request.user.pk, kwargs.get("book_id"))
+        if reading_session is None:
+            raise Http404
 
-        reading_session = ReadingSession.objects.create(
-            user=request.user, book=book, status=True
-        )
         serializer = self.get_serializer(reading_session)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -86,9 +117,11 @@ class StartReadingSessionView(CreateAPIView):
 class EndReadingSessionView(APIView):
     """
     View for end reading session.
-    Method update() is used to close the active reading session for the user.
+    Method patch() is used to close the active reading session for the user.
+    Without book_id all active reading sessions of the user are closed.
     Usage example:
     PATCH api/v1/library/sessions/ { "book_id": 1 } /end
+    PATCH api/v1/library/sessions/end
     """
 
     queryset = ReadingSession.objects.all()
@@ -109,41 +142,167 @@ class EndReadingSessionView(APIView):
                 if there were no active sessions.
 
             Process:
-         1. A query is generated to select all active reading sessions of the user.
-         2. If a book_id is provided, the request is further filtered by the book ID.
-         3. Checks for active sessions.
-         4. If there are active sessions, they are updated - the end time is set and the status is 'inactive'.
+         1. Active reading sessions of the user, optionally only of the book, are closed by a single
+            UPDATE ... RETURNING statement - the end time is set and the status is 'inactive'.
+         2. The reading_sessions_closed signal is sent, so the reading time counters are incremented.
         """
-        active_sessions_query = ReadingSession.objects.filter(user=user, status=True)
-
-        if book_id is not None:
-            active_sessions_query = active_sessions_query.filter(book_id=book_id)
-
-        active_sessions = active_sessions_query.exists()
-
-        if active_sessions:
-            active_sessions_query.update(end_time=timezone.now(), status=False)
-
-        return active_sessions
+        return bool(ReadingSession.objects.close_active(user.pk, book_id))
 
     def patch(self, request, *args, **kwargs):
         """
         Close the active reading session for the user.
+        The sessions are closed by a single statement, so all of them get the same end time.
         :param request: Request object from the user. Includes user data and other metadata.
         :param args: Additional positional arguments (not used in this method).
-        :param kwargs: Expected to contain the 'book_id' key, which points to the book ID for the reading session.
-        :return: HTTP response with a message about successful closing of the reading session or an error message,
-              if no active reading session is found.
+        :param kwargs: May contain the 'book_id' key, which points to the book ID for the reading session.
+        :return: HTTP response with the closed reading session and its duration or an error message,
+              if no active reading session is found. Without book_id - the number of closed sessions.
         """
-        book = get_object_or_404(Book, pk=kwargs.get("book_id"))
+        book_id = kwargs.get("book_id")
+        closed_sessions = ReadingSession.objects.close_active(request.user.pk, book_id)
+
+        if book_id is None:
+            return Response(
+                {"message": "Reading sessions closed.", "closed": len(closed_sessions)},
+                status=status.HTTP_200_OK,
+            )
 
-        if not self.end_active_sessions(request.user, book.pk):
+        if not closed_sessions:
             return Response(
                 {"message": "No active reading session found for this book."},
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        EndReadingSessionView.end_active_sessions(request.user)
+        serializer = self.serializer_class(closed_sessions[0])
+        return Response(
+            {"message": "Reading session closed.", "session": serializer.data},
+            status=status.HTTP_200_OK,
+        )
+
+
+class ReadingSessionHeartbeatView(APIView):
+    """
+    View for the heartbeat of the active reading session.
+    Heartbeats are only buffered, the last one is written to the session by HeartbeatBuffer.flush(),
+    so the request does not touch the reading sessions table.
+    Usage example:
+    POST api/v1/library/sessions/heartbeat
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        HeartbeatBuffer.record(request.user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class BulkReadingSessionView(APIView):
+    """
+    View for recording completed reading sessions in bulk, e.g. buffered offline by e-reader clients.
+    Every session gets its own result, sessions that overlap another session of the user are rejected.
+    Usage example:
+    POST api/v1/library/sessions/bulk
+    {"sessions": [{"book": 1, "start_time": "2024-01-01T10:00:00Z", "end_time": "2024-01-01T11:00:00Z"}]}
+    """
+
+    serializer_class = CompletedReadingSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    @staticmethod
+    def rejected(index, errors):
+        return {"index": index, "status": "rejected", "errors": errors}
+
+    @staticmethod
+    def find_overlaps(user, sessions):
+        """
+        Finds the sessions that overlap a stored session of the user or an earlier session of the batch.
+        :param user: User object whose sessions are recorded.
+        :param sessions: List of tuples (index, validated data).
+        :return: Set of indexes of the overlapping sessions.
+        """
+        starts = [data["start_time"] for _, data in sessions]
+        ends = [data["end_time"] for _, data in sessions]
+        stored = sorted(
+            (start_time, end_time or datetime.max.replace(tzinfo=dt_timezone.utc))
+            for start_time, end_time in ReadingSession.objects.filter(
+                Q(end_time__gt=min(starts)) | Q(end_time__isnull=True),
+                user=user,
+                start_time__lt=max(ends),
+            ).values_list("start_time", "end_time")
+        )
+        stored_starts = [start_time for start_time, _ in stored]
+        # The latest end among the stored sessions that start before the position.
+        stored_max_ends = list(accumulate((end_time for _, end_time in stored), max))
+
+        overlaps = set()
+        batch_end = None
+        for index, data in sorted(sessions, key=lambda session: session[1]["start_time"]):
+            position = bisect_left(stored_starts, data["end_time"])
+            if position and stored_max_ends[position - 1] > data["start_time"]:
+                overlaps.add(index)
+            elif batch_end and batch_end > data["start_time"]:
+                overlaps.add(index)
+            else:
+                batch_end = data["end_time"]
+        return overlaps
+
+    def post(self, request, *args, **kwargs):
+        """
+        Record completed reading sessions.
+        :param request: Request object from the user, data is a list of sessions or {"sessions": [...]}.
+        :return: HTTP response with a result for each session, in the order of the request.
+        """
+        items = request.data.get("sessions") if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not 0 < len(items) <= settings.BULK_SESSIONS_MAX_ITEMS:
+            return Response(
+                {"message": f"Expected a list of 1 to {settings.BULK_SESSIONS_MAX_ITEMS} sessions."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = [None] * len(items)
+        sessions = []
+        for index, item in enumerate(items):
+            serializer = self.serializer_class(data=item)
+            if serializer.is_valid():
+                sessions.append((index, serializer.validated_data))
+            else:
+                results[index] = self.rejected(index, serializer.errors)
+
+        books = set(
+            Book.objects.filter(id__in={data["book"] for _, data in sessions}).values_list("id", flat=True)
+        )
+        for index, data in sessions:
+            if data["book"] not in books:
+                results[index] = self.rejected(index, {"book": ["Book not found."]})
+        sessions = [(index, data) for index, data in sessions if data["book"] in books]
+
+        with transaction.atomic():
+            if sessions:
+                # Concurrent uploads of the same user are serialized, so they can not overlap each other.
+                list(User.objects.select_for_update().filter(pk=request.user.pk).values_list("pk"))
+                overlaps = self.find_overlaps(request.user, sessions)
+                for index in overlaps:
+                    results[index] = self.rejected(
+                        index, {"non_field_errors": ["Session overlaps another reading session."]}
+                    )
+                sessions = [(index, data) for index, data in sessions if index not in overlaps]
+
+            created_sessions = ReadingSession.objects.record_completed(
+                request.user.pk,
+                (
+                    {"book_id": data["book"], "start_time": data["start_time"], "end_time": data["end_time"]}
+                    for _, data in sessions
+                ),
+            )
+
+        for (index, _), session in zip(sessions, created_sessions):
+            results[index] = {"index": index, "status": "created", "id": session.pk}
+
         return Response(
-            {"message": "Reading session closed."}, status=status.HTTP_200_OK
+            {
+                "created": len(created_sessions),
+                "rejected": len(results) - len(created_sessions),
+                "results": results,
+            },
+            status=status.HTTP_200_OK,
         )
@@ -1,6 +1,8 @@
 import os
+from time import perf_counter
 
 from celery import Celery
+from celery.signals import task_postrun, task_prerun
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "rtas_backend.settings")
@@ -17,6 +19,22 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
 
+@task_prerun.connect
+def start_task_timer(task_id, task, **kwargs):
+    task.request.metrics_started = perf_counter()
+
+
+@task_postrun.connect
+def observe_task_metrics(task_id, task, retval, state, **kwargs):
+    from django.conf import settings
+
+    started = getattr(task.request, "metrics_started", None)
+    if settings.METRICS_ENABLED and started is not None:
+        from rtas_backend.metrics import observe_task
+
+        observe_task(task.name, state, perf_counter() - started, retval)
+
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f"Request: {self.request!r}")
@@ -0,0 +1,121 @@
+# Description: Prometheus metrics of the requests, the database queries, the serializers and the Celery tasks.
+import os
+from functools import wraps
+from ipaddress import ip_address, ip_network
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, PermissionDenied
+from django.db import connection
+from django.http import Http404, HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from rest_framework.serializers import BaseSerializer
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Duration of the requests by view.", ["view", "method", "status"]
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries per request by view.",
+    ["view"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+REQUEST_DB_DURATION = Histogram("http_request_db_duration_seconds", "Database time per request by view.", ["view"])
+SERIALIZER_DURATION = Histogram(
+    "serializer_duration_seconds", "Duration of the serialization of the response data by serializer.", ["serializer"]
+)
+TASK_DURATION = Histogram("celery_task_duration_seconds", "Duration of the Celery tasks.", ["task", "state"])
+TASK_ROWS = Counter("celery_task_rows", "Rows processed by the Celery tasks, the tasks return the count.", ["task"])
+
+
+class QueryTimer:
+    """
+    Database execute wrapper, counts the queries of the request and sums their time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    Observes the duration, the number of database queries and the database time of every request,
+    labelled with the name of the resolved view, so the number of label values is bounded by the routes.
+    Is not loaded at all when METRICS_ENABLED is off.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        instrument_serializers()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = perf_counter() - started
+
+        view = request.resolver_match.view_name if request.resolver_match else "<unresolved>"
+        REQUEST_DURATION.labels(view, request.method, response.status_code).observe(duration)
+        REQUEST_DB_QUERIES.labels(view).observe(timer.count)
+        REQUEST_DB_DURATION.labels(view).observe(timer.duration)
+        return response
+
+
+def instrument_serializers():
+    """
+    Wraps BaseSerializer.data, the entry point of the serialization of the response data, once per process.
+    Nested serializers are serialized inside the data of their parent and are not observed separately.
+    """
+    data = BaseSerializer.data
+    if getattr(data.fget, "instrumented", False):
+        return
+
+    @wraps(data.fget)
+    def timed_data(serializer):
+        if getattr(serializer, "_data", None) is not None:
+            return data.fget(serializer)
+        started = perf_counter()
+        result = data.fget(serializer)
+        name = type(getattr(serializer, "child", serializer)).__name__
+        SERIALIZER_DURATION.labels(name).observe(perf_counter() - started)
+        return result
+
+    timed_data.instrumented = True
+    BaseSerializer.data = property(timed_data)
+
+
+def observe_task(task_name, state, duration, retval):
+    TASK_DURATION.labels(task_name, state).observe(duration)
+    if isinstance(retval, int) and not isinstance(retval, bool):
+        TASK_ROWS.labels(task_name).inc(retval)
+
+
+def metrics_view(request):
+    """
+    Prometheus exposition of the metrics. With PROMETHEUS_MULTIPROC_DIR the metrics of all processes
+    are collected, including the Celery workers that write to the same directory.
+    Only the scrapers from the addresses or networks of METRICS_ALLOWED_IPS are served.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    address = ip_address(request.META["REMOTE_ADDR"])
+    if not any(address in ip_network(allowed) for allowed in settings.METRICS_ALLOWED_IPS):
+        raise PermissionDenied
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -13,6 +13,7 @@ import os.path
 from datetime import timedelta
 from pathlib import Path
 
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -52,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "rtas_backend.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -143,28 +145,124 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "auth_api.authentication.CachedJWTAuthentication",
     ),
 }
 
+# Page size of the list endpoints with keyset pagination
+API_PAGE_SIZE = 100
+# Serialize the list endpoints with values() and orjson instead of the model serializers
+FAST_LIST_SERIALIZATION = False
+
 # JWT
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=int(os.getenv("ACCESS_TOKEN_LIFETIME"))),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=int(os.getenv("REFRESH_TOKEN_LIFETIME"))),
 }
 
+# Prometheus metrics of the requests and the Celery tasks, exposed at /metrics
+# to the comma separated addresses or networks of METRICS_ALLOWED_IPS only.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False") == "True"
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1").split(",") if ip]
+
+# Users authenticated by the JWT are cached per process and in the shared cache, in seconds
+AUTH_USER_LOCAL_CACHE_TIMEOUT = 5
+AUTH_USER_LOCAL_CACHE_SIZE = 10000
+AUTH_USER_CACHE_TIMEOUT = 60
+
 # Celery
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
+# Keeps the results of the shards of the reading statistics chord.
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND")
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 
+# Source of the per-book totals of the book statistic views: "live" aggregation of the reading sessions,
+# the running "counters", or the "materialized" view refreshed every interval seconds.
+BOOK_READING_TIME_SOURCE = "counters"
+BOOK_READING_TOTALS_REFRESH_INTERVAL = 300
+
+# Heartbeats of the reading sessions are buffered in the cache and written to the sessions every interval seconds.
+HEARTBEAT_FLUSH_INTERVAL = 10
+HEARTBEAT_FLUSH_BATCH_SIZE = 1000
+# Seconds a buffered heartbeat is kept, must be longer than the flush interval.
+HEARTBEAT_TIMEOUT = 300
+
 CELERY_BEAT_SCHEDULE = {
-    "statistic_last_7_day": {
-        "task": "statistic.tasks.update_user_reading_stats_7_days",
+    "statistic_last_7_and_30_days": {
+        "task": "statistic.tasks.update_user_reading_stats",
         "schedule": 86400,
     },
-    "statistic_last_30_day": {
-        "task": "statistic.tasks.update_user_reading_stats_30_days",
+    "statistic_compact_reading_time_buckets": {
+        "task": "statistic.tasks.compact_reading_time_buckets",
         "schedule": 86400,
     },
+    "library_flush_heartbeats": {
+        "task": "library.tasks.flush_heartbeats",
+        "schedule": HEARTBEAT_FLUSH_INTERVAL,
+    },
+    "library_close_stale_reading_sessions": {
+        "task": "library.tasks.close_stale_reading_sessions",
+        "schedule": 900,
+    },
+    "statistic_rebuild_leaderboards": {
+        "task": "statistic.tasks.rebuild_leaderboards",
+        "schedule": crontab(minute=0, hour=0),
+    },
+    "library_maintain_reading_session_partitions": {
+        "task": "library.tasks.maintain_reading_session_partitions",
+        "schedule": crontab(minute=30, hour=0),
+    },
+    "statistic_archive_reading_sessions": {
+        "task": "statistic.tasks.archive_reading_sessions",
+        "schedule": crontab(minute=0, hour=2, day_of_month=1),
+    },
+    "statistic_refresh_book_reading_totals": {
+        "task": "statistic.tasks.refresh_book_reading_totals",
+        "schedule": BOOK_READING_TOTALS_REFRESH_INTERVAL,
+    },
+}
+
+# Active sessions without a heartbeat for longer than STALE_SESSION_IDLE_LIMIT are closed by the sweeper
+# at their last heartbeat, the duration of sessions without heartbeats is capped to STALE_SESSION_MAX_DURATION.
+STALE_SESSION_IDLE_LIMIT = timedelta(hours=12)
+STALE_SESSION_MAX_DURATION = timedelta(hours=2)
+STALE_SESSION_BATCH_SIZE = 1000
+
+# Monthly partitions of the reading sessions on PostgreSQL, see library.partitions. Partitions are created
+# the given number of months ahead, partitions older than the retention are detached, None keeps all attached.
+READING_SESSION_PARTITIONS_AHEAD = 3
+READING_SESSION_PARTITION_RETENTION_MONTHS = None
+
+# Closed reading sessions that ended before the first day of the month this many months ago are moved
+# into the per-(user, book, month) ReadingSessionSummary rows, see statistic.archive.
+READING_SESSION_ARCHIVE_MONTHS = 12
+READING_SESSION_ARCHIVE_BATCH_SIZE = 1000
+
+# Bulk ingestion of completed reading sessions
+BULK_SESSIONS_MAX_ITEMS = 5000
+BULK_SESSIONS_BATCH_SIZE = 1000
+
+# Cache
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_URL"),
+    }
 }
+
+# Statistic
+STATISTIC_CACHE_TIMEOUT = 300
+READING_STATS_BATCH_SIZE = 1000
+# Users per shard of the parallel reading statistics update, and the number of shards updated at the same time.
+READING_STATS_SHARD_SIZE = 50000
+READING_STATS_SHARD_CONCURRENCY = 8
+# Rows fetched per round trip of the server-side cursor of the reading sessions export
+EXPORT_CHUNK_SIZE = 2000
+# Days of reading time kept with day granularity, older days are compacted into months.
+READING_TIME_BUCKETS_DAILY_HORIZON = 90
+# Windows of the leaderboards in days, rebuilt from the daily buckets, so they must fit in the daily horizon.
+LEADERBOARD_WINDOWS = (1, 7, 30)
+LEADERBOARD_MAX_LIMIT = 100
+# Upper bound of the buckets of one histogram response, e.g. three years of days.
+HISTOGRAM_MAX_BUCKETS = 1200
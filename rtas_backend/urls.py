@@ -22,6 +22,8 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
+from rtas_backend.metrics import metrics_view
+
 ...
 
 schema_view = get_schema_view(
@@ -48,4 +50,5 @@ urlpatterns = [
     path("api/v1/auth/", include("auth_api.urls")),
     path("api/v1/library/", include("library.urls")),
     path("api/v1/statistic/", include("statistic.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
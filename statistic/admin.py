@@ -1,5 +1,8 @@
 from django.contrib import admin
 
-from statistic.models import ReadingStatistics
+from statistic.models import BookReadingStatistics, LeaderboardEntry, ReadingSessionSummary, ReadingStatistics
 
 admin.site.register(ReadingStatistics)
+admin.site.register(BookReadingStatistics)
+admin.site.register(LeaderboardEntry)
+admin.site.register(ReadingSessionSummary)
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_book_reading_totals_view(using, **kwargs):
+    """
+    Creates the view of the per-book reading time totals, the model is unmanaged,
+    so the view is not created by the migrations.
+    """
+    from statistic.models import BookReadingTotal
+
+    BookReadingTotal.create_view(using)
 
 
 class StatisticConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "statistic"
+
+    def ready(self):
+        post_migrate.connect(create_book_reading_totals_view, sender=self)
@@ -0,0 +1,110 @@
+# Description: Archival of the old closed reading sessions into monthly summaries.
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from heapq import merge
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DurationField, ExpressionWrapper, F, Sum
+from django.utils import timezone
+
+from library.models import ReadingSession
+from statistic.models import ReadingSessionSummary
+
+
+class ReadingSessionArchiver:
+    """
+    Moves the closed reading sessions that ended before the first day of the month `months` months ago
+    out of ReadingSession into ReadingSessionSummary rows per (user, book, month of the start).
+    Sessions are streamed in batches ordered by id, each batch is folded into the summaries and deleted
+    in its own transaction, rows locked by concurrent requests are skipped until the next run.
+    The reading time counters and the daily buckets are not touched, they already include the sessions.
+    """
+
+    @staticmethod
+    def totals(*group_by):
+        """
+        Streams the reading time totals of the closed reading sessions and of the archived session summaries.
+        :param group_by: Fields of the groups, e.g. book_id, or user_id and book_id.
+        :return: Iterator of tuples (*group, total), ordered by the group.
+        """
+        sessions = (
+            ReadingSession.objects.filter(end_time__isnull=False)
+            .order_by(*group_by)
+            .values(*group_by)
+            .annotate(total=Sum(ExpressionWrapper(F("end_time") - F("start_time"), output_field=DurationField())))
+            .values_list(*group_by, "total")
+            .iterator(chunk_size=settings.READING_STATS_BATCH_SIZE)
+        )
+        summaries = (
+            ReadingSessionSummary.objects.order_by(*group_by)
+            .values(*group_by)
+            .annotate(total=Sum("total_reading_time"))
+            .values_list(*group_by, "total")
+            .iterator(chunk_size=settings.READING_STATS_BATCH_SIZE)
+        )
+        for group, rows in groupby(merge(sessions, summaries, key=lambda row: row[:-1]), key=lambda row: row[:-1]):
+            yield *group, sum((total for *_, total in rows), timedelta())
+
+    def __init__(self, months, batch_size):
+        self.months = months
+        self.batch_size = batch_size
+
+    @staticmethod
+    def get_cutoff(months):
+        """
+        :return: Start of the first day of the month `months` months ago, the archived sessions ended before it.
+        """
+        today = timezone.localdate()
+        index = today.year * 12 + today.month - 1 - months
+        month = today.replace(year=index // 12, month=index % 12 + 1, day=1)
+        return timezone.make_aware(datetime.combine(month, time.min))
+
+    @property
+    def cutoff(self):
+        return self.get_cutoff(self.months)
+
+    def get_batch(self, cutoff):
+        return list(
+            ReadingSession.objects.filter(status=False, start_time__lt=cutoff, end_time__lt=cutoff)
+            .select_for_update(skip_locked=True)
+            .order_by("id")
+            .values_list("id", "user_id", "book_id", "start_time", "end_time")[: self.batch_size]
+        )
+
+    @staticmethod
+    def fold(rows):
+        """
+        Adds the sessions of a batch to their summaries, the summaries are locked before they are updated.
+        :param rows: List of tuples (id, user_id, book_id, start_time, end_time).
+        :return: None
+        """
+        grouped = defaultdict(list)
+        for session_id, user_id, book_id, start_time, end_time in rows:
+            month = ReadingSessionSummary.month_of(start_time)
+            grouped[user_id, book_id, month].append((session_id, start_time, end_time))
+
+        for (user_id, book_id, month), sessions in grouped.items():
+            summary, _ = ReadingSessionSummary.objects.select_for_update().get_or_create(
+                user_id=user_id, book_id=book_id, month=month
+            )
+            summary.add_sessions(sessions)
+            summary.save(update_fields=["sessions", "session_count", "total_reading_time"])
+
+    def archive(self):
+        """
+        :return: Number of archived sessions.
+        """
+        cutoff = self.cutoff
+        archived = 0
+        while True:
+            with transaction.atomic():
+                rows = self.get_batch(cutoff)
+                if not rows:
+                    return archived
+                self.fold(rows)
+                ReadingSession.objects.filter(id__in=[row[0] for row in rows]).delete()
+            archived += len(rows)
+            if len(rows) < self.batch_size:
+                return archived
@@ -0,0 +1,101 @@
+# Description: Response cache of the statistic endpoints.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class StatisticCache:
+    """
+    Cache of the statistic responses, keyed per user and per book.
+    Keys are invalidated when reading sessions of the user or the book are closed,
+    the pages of the book list share a version that is incremented instead, and all books share a version
+    that is incremented when the per-book totals are refreshed,
+    STATISTIC_CACHE_TIMEOUT is the fallback for changes without an event, e.g. the nightly UserReadingStats update.
+    Hits and misses are counted in the cache, so the counters are shared by all processes.
+    """
+
+    prefix = "statistic"
+    hits_key = f"{prefix}:cache:hits"
+    misses_key = f"{prefix}:cache:misses"
+    books_version_key = f"{prefix}:books:version"
+    book_version_key = f"{prefix}:book:version"
+
+    @classmethod
+    def books_key(cls, url=""):
+        version = cache.get_or_set(cls.books_version_key, 0, timeout=None)
+        return f"{cls.prefix}:books:{version}:{url}"
+
+    @classmethod
+    def book_key(cls, book_id, version=None):
+        if version is None:
+            version = cache.get_or_set(cls.book_version_key, 0, timeout=None)
+        return f"{cls.prefix}:book:{version}:{book_id}"
+
+    @classmethod
+    def user_key(cls, user_id):
+        return f"{cls.prefix}:user:{user_id}"
+
+    @staticmethod
+    def increment(key):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key)
+
+    @classmethod
+    def get_or_set(cls, key, build):
+        """
+        Returns the cached data or builds, caches and returns it.
+        :param key: Cache key.
+        :param build: Callable without arguments that returns the data to cache.
+        :return: Cached or built data.
+        """
+        data = cache.get(key)
+        if data is not None:
+            cls.increment(cls.hits_key)
+            return data
+
+        cls.increment(cls.misses_key)
+        data = build()
+        cache.set(key, data, timeout=settings.STATISTIC_CACHE_TIMEOUT)
+        return data
+
+    @classmethod
+    def invalidate_sessions(cls, sessions):
+        """
+        Deletes the keys affected by the sessions once the current transaction is committed,
+        so a concurrent request cannot cache the counters from before the commit.
+        :param sessions: Closed ReadingSession instances.
+        :return: None
+        """
+        book_ids = {session.book_id for session in sessions}
+        user_ids = {session.user_id for session in sessions}
+
+        def invalidate():
+            version = cache.get_or_set(cls.book_version_key, 0, timeout=None)
+            keys = [cls.book_key(book_id, version) for book_id in book_ids]
+            cache.delete_many(keys + [cls.user_key(user_id) for user_id in user_ids])
+            cls.increment(cls.books_version_key)
+
+        transaction.on_commit(invalidate)
+
+    @classmethod
+    def invalidate_books(cls, using=None):
+        """
+        Increments the versions of the pages of the book list and of the books once the current transaction
+        is committed.
+        :param using: Alias of the database of the transaction.
+        :return: None
+        """
+
+        def invalidate():
+            cls.increment(cls.books_version_key)
+            cls.increment(cls.book_version_key)
+
+        transaction.on_commit(invalidate, using=using)
+
+    @classmethod
+    def get_counters(cls):
+        counters = cache.get_many([cls.hits_key, cls.misses_key])
+        return {"hits": counters.get(cls.hits_key, 0), "misses": counters.get(cls.misses_key, 0)}
@@ -0,0 +1,95 @@
+# Description: Streaming export of the reading sessions.
+import csv
+import zlib
+
+import orjson
+from django.conf import settings
+
+from library.models import ReadingSession
+
+
+class Echo:
+    """
+    File-like object for csv.writer, returns the written line instead of buffering it.
+    """
+
+    def write(self, value):
+        return value
+
+
+class ReadingSessionExporter:
+    """
+    Streams reading sessions joined with their user and book as CSV or NDJSON.
+    Rows are read with a server-side cursor in chunks of EXPORT_CHUNK_SIZE and encoded one by one,
+    so memory does not depend on the number of exported sessions.
+    """
+
+    formats = ("csv", "ndjson")
+    columns = {
+        "id": "id",
+        "user_id": "user_id",
+        "username": "user__username",
+        "book_id": "book_id",
+        "book_title": "book__title",
+        "book_author": "book__author",
+        "start_time": "start_time",
+        "end_time": "end_time",
+        "status": "status",
+    }
+
+    def __init__(self, export_format="csv", user_id=None, date_from=None, date_to=None):
+        """
+        :param export_format: csv or ndjson.
+        :param user_id: Optional user id, if provided only the sessions of this user are exported.
+        :param date_from: Optional lower bound of start_time, inclusive.
+        :param date_to: Optional upper bound of start_time, exclusive.
+        """
+        self.export_format = export_format
+        self.user_id = user_id
+        self.date_from = date_from
+        self.date_to = date_to
+
+    @property
+    def content_type(self):
+        return "text/csv" if self.export_format == "csv" else "application/x-ndjson"
+
+    def get_rows(self):
+        queryset = ReadingSession.objects.all()
+        if self.user_id is not None:
+            queryset = queryset.filter(user_id=self.user_id)
+        if self.date_from is not None:
+            queryset = queryset.filter(start_time__gte=self.date_from)
+        if self.date_to is not None:
+            queryset = queryset.filter(start_time__lt=self.date_to)
+
+        return (
+            queryset.order_by("id")
+            .values_list(*self.columns.values())
+            .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+        )
+
+    def lines(self):
+        """
+        Generates the encoded lines of the export, the CSV export starts with a header.
+        """
+        if self.export_format == "ndjson":
+            names = list(self.columns)
+            for row in self.get_rows():
+                yield orjson.dumps(dict(zip(names, row))) + b"\n"
+            return
+
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.columns).encode()
+        for row in self.get_rows():
+            yield writer.writerow(value.isoformat() if hasattr(value, "isoformat") else value for value in row).encode()
+
+    def gzip_lines(self):
+        """
+        Generates the lines compressed as one gzip stream, compressed data is yielded as soon as zlib emits it.
+        """
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+        for line in self.lines():
+            chunk = compressor.compress(line)
+            if chunk:
+                yield chunk
+        yield compressor.flush()
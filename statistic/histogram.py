@@ -0,0 +1,146 @@
+# Description: Histogram of the reading time by hour, day or month.
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncHour, TruncMonth
+from django.utils import timezone
+
+from library.models import ReadingSession
+from statistic.archive import ReadingSessionArchiver
+from statistic.models import ReadingTimeBucket
+
+
+class ReadingHistogram:
+    """
+    Reading time of a user or of a book split into consecutive buckets of an hour, a day or a month.
+    Sessions are split at the bucket boundaries, empty buckets are returned with zero reading time.
+    Days and months are summed from the ReadingTimeBucket rollup and hours from the sessions of the range
+    by the database. The days compacted into monthly buckets and the hours of the archived sessions are not
+    available, so day and hour histograms start no earlier than first_day.
+    """
+
+    class Granularity:
+        HOUR = "hour"
+        DAY = "day"
+        MONTH = "month"
+
+        choices = (HOUR, DAY, MONTH)
+
+    def __init__(self, granularity, date_from, date_to, **filters):
+        """
+        :param granularity: hour, day or month.
+        :param date_from: First day of the range.
+        :param date_to: Last day of the range, inclusive. Month buckets cover the whole months of the range.
+        :param filters: Filters of the reading time, user_id or book_id.
+        """
+        self.granularity = granularity
+        self.filters = filters
+        if granularity == self.Granularity.MONTH:
+            date_from = date_from.replace(day=1)
+            date_to = self.next_month(date_to) - timedelta(days=1)
+        self.date_from = date_from
+        self.date_to = date_to
+
+    @staticmethod
+    def next_month(date):
+        return (date.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+    @staticmethod
+    def start_of_day(date):
+        return timezone.make_aware(datetime.combine(date, time.min))
+
+    @classmethod
+    def first_day(cls, granularity):
+        """
+        :return: Earliest first day of a histogram of the granularity, None if the history is not limited.
+        """
+        if granularity == cls.Granularity.HOUR:
+            cutoff = ReadingSessionArchiver.get_cutoff(settings.READING_SESSION_ARCHIVE_MONTHS)
+            return timezone.localdate(cutoff)
+        if granularity == cls.Granularity.DAY:
+            return ReadingTimeBucket.daily_from()
+        return None
+
+    @classmethod
+    def count_buckets(cls, granularity, date_from, date_to):
+        days = (date_to - date_from).days + 1
+        if granularity == cls.Granularity.HOUR:
+            return days * 24
+        if granularity == cls.Granularity.DAY:
+            return days
+        return (date_to.year - date_from.year) * 12 + date_to.month - date_from.month + 1
+
+    def bucket_starts(self):
+        if self.granularity == self.Granularity.HOUR:
+            start = self.start_of_day(self.date_from)
+            end = self.start_of_day(self.date_to + timedelta(days=1))
+            while start < end:
+                yield timezone.localtime(start)
+                start += timedelta(hours=1)
+        elif self.granularity == self.Granularity.DAY:
+            day = self.date_from
+            while day <= self.date_to:
+                yield day
+                day += timedelta(days=1)
+        else:
+            month = self.date_from
+            while month <= self.date_to:
+                yield month
+                month = self.next_month(month)
+
+    def hour_totals(self):
+        """
+        The sessions inside one hour are summed by the database, only the sessions that cross an hour
+        are fetched, by the (user, end_time) or (book, end_time) index, and split at the hours.
+        """
+        range_start = self.start_of_day(self.date_from)
+        range_end = self.start_of_day(self.date_to + timedelta(days=1))
+        sessions = (
+            ReadingSession.objects.filter(end_time__gt=range_start, start_time__lt=range_end, **self.filters)
+            .annotate(start_hour=TruncHour("start_time"), end_hour=TruncHour("end_time"))
+            .order_by()
+        )
+        duration = ExpressionWrapper(F("end_time") - F("start_time"), output_field=DurationField())
+        totals = defaultdict(
+            timedelta,
+            sessions.filter(start_hour=F("end_hour")).values_list("start_hour").annotate(total=Sum(duration)),
+        )
+        crossing = sessions.exclude(start_hour=F("end_hour")).values_list("start_time", "end_time")
+        for start_time, end_time in crossing.iterator():
+            start_time, end_time = max(start_time, range_start), min(end_time, range_end)
+            while start_time < end_time:
+                hour = timezone.localtime(start_time).replace(minute=0, second=0, microsecond=0)
+                boundary = min(hour + timedelta(hours=1), end_time)
+                totals[hour] += boundary - start_time
+                start_time = boundary
+        return totals
+
+    def day_totals(self):
+        buckets = ReadingTimeBucket.objects.filter(
+            period=ReadingTimeBucket.Period.DAY, date__gte=self.date_from, date__lte=self.date_to, **self.filters
+        )
+        return dict(buckets.order_by().values_list("date").annotate(total=Sum("total_reading_time")))
+
+    def month_totals(self):
+        buckets = ReadingTimeBucket.objects.filter(date__gte=self.date_from, date__lte=self.date_to, **self.filters)
+        return dict(
+            buckets.annotate(month=TruncMonth("date"))
+            .order_by()
+            .values_list("month")
+            .annotate(total=Sum("total_reading_time"))
+        )
+
+    def series(self):
+        """
+        :return: List of dicts with the start of the bucket and its total reading time, in chronological order.
+        """
+        totals = {
+            self.Granularity.HOUR: self.hour_totals,
+            self.Granularity.DAY: self.day_totals,
+            self.Granularity.MONTH: self.month_totals,
+        }[self.granularity]()
+        return [
+            {"start": start, "total_reading_time": totals.get(start, timedelta())} for start in self.bucket_starts()
+        ]
@@ -0,0 +1,36 @@
+# Description: Archives the old closed reading sessions into monthly summaries.
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from statistic.archive import ReadingSessionArchiver
+
+
+class Command(BaseCommand):
+    """
+    Moves the closed reading sessions older than the given number of months into ReadingSessionSummary rows,
+    the same archival runs monthly as the archive_reading_sessions task.
+    Usage example:
+    python manage.py archive_reading_sessions --months 12 --batch-size 5000
+    """
+
+    help = "Fold the old closed reading sessions into per-(user, book, month) summaries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months", type=int, default=settings.READING_SESSION_ARCHIVE_MONTHS)
+        parser.add_argument("--batch-size", type=int, default=settings.READING_SESSION_ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        # The histograms read the summaries only for the ranges before the cutoff of the setting.
+        if options["months"] is None or options["months"] < settings.READING_SESSION_ARCHIVE_MONTHS:
+            raise CommandError(
+                f"--months must not be less than READING_SESSION_ARCHIVE_MONTHS "
+                f"({settings.READING_SESSION_ARCHIVE_MONTHS})."
+            )
+
+        archiver = ReadingSessionArchiver(options["months"], options["batch_size"])
+        archived = archiver.archive()
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {archived} reading sessions that ended before {archiver.cutoff:%Y-%m-%d}.")
+        )
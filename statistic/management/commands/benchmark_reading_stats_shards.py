@@ -0,0 +1,88 @@
+# Description: Speedup benchmark of the sharded reading statistics update.
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from library.models import Book
+from statistic.models import ReadingTimeBucket
+from statistic.tasks import UserReadingStatsUpdater
+
+
+class Command(BaseCommand):
+    """
+    Seeds users with daily buckets, then updates the reading statistics with 1, 2, 4, ... workers,
+    each worker updates its lane of user id shards with its own database connection, as the Celery workers do.
+    The shards are read by other connections, so the seeded rows are committed and deleted afterwards,
+    use a scratch database.
+    Usage example:
+    python manage.py benchmark_reading_stats_shards --users 200000 --workers 1 2 4 8
+    """
+
+    help = "Measure the speedup of the sharded reading statistics update with the number of workers."
+
+    prefix = "benchmark_shards_"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200_000)
+        parser.add_argument("--days", type=int, default=30)
+        parser.add_argument("--shard-size", type=int, default=10_000)
+        parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+
+    def seed(self, users, days):
+        book = Book.objects.create(title=f"{self.prefix}book", author="Author", year=2000, short_description="")
+        User.objects.bulk_create(
+            (User(username=f"{self.prefix}{index}") for index in range(users)), batch_size=10000
+        )
+        user_ids = User.objects.filter(username__startswith=self.prefix).values_list("id", flat=True)
+        today = timezone.localdate()
+        ReadingTimeBucket.objects.bulk_create(
+            (
+                ReadingTimeBucket(
+                    user_id=user_id,
+                    book=book,
+                    date=today - timedelta(days=day),
+                    total_reading_time=timedelta(minutes=user_id % 60),
+                )
+                for user_id in user_ids.iterator()
+                for day in range(0, days, 3)
+            ),
+            batch_size=10000,
+        )
+        return book
+
+    @staticmethod
+    def update_lane(lane):
+        try:
+            return sum(
+                UserReadingStatsUpdater.update_reading_stats(UserReadingStatsUpdater.WINDOWS, *shard) for shard in lane
+            )
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        book = self.seed(options["users"], options["days"])
+        self.stdout.write(f"Seeded {options['users']} users in {perf_counter() - started:.1f} s")
+
+        try:
+            shards = UserReadingStatsUpdater.get_shards(options["shard_size"])
+            baseline = None
+            for workers in options["workers"]:
+                lanes = UserReadingStatsUpdater.split_lanes(shards, workers)
+                started = perf_counter()
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    updated = sum(executor.map(self.update_lane, lanes))
+                elapsed = perf_counter() - started
+                baseline = baseline or (workers, elapsed)
+                self.stdout.write(
+                    f"{workers} workers, {len(shards)} shards: {updated} users in {elapsed:.2f} s, "
+                    f"speedup {baseline[1] / elapsed:.2f}x of ideal {workers / baseline[0]:.2f}x"
+                )
+        finally:
+            User.objects.filter(username__startswith=self.prefix).delete()
+            book.delete()
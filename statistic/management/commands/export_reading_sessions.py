@@ -0,0 +1,42 @@
+# Description: Exports the reading sessions as CSV or NDJSON.
+import sys
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from statistic.export import ReadingSessionExporter
+
+
+class Command(BaseCommand):
+    """
+    Streams the reading sessions joined with their user and book to a file or to stdout.
+    Usage example:
+    python manage.py export_reading_sessions --type ndjson --from 2024-01-01T00:00:00Z --gzip --output out.ndjson.gz
+    """
+
+    help = "Export reading sessions as CSV or NDJSON with constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--type", choices=ReadingSessionExporter.formats, default="csv")
+        parser.add_argument("--user", type=int, help="Export only the sessions of this user id.")
+        parser.add_argument("--from", dest="date_from", type=parse_datetime, help="Lower bound of start_time.")
+        parser.add_argument("--to", dest="date_to", type=parse_datetime, help="Upper bound of start_time.")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--output", help="Output file, stdout by default.")
+
+    def handle(self, *args, **options):
+        exporter = ReadingSessionExporter(
+            export_format=options["type"],
+            user_id=options["user"],
+            date_from=options["date_from"],
+            date_to=options["date_to"],
+        )
+        chunks = exporter.gzip_lines() if options["gzip"] else exporter.lines()
+
+        output = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options["output"]:
+                output.close()
@@ -0,0 +1,91 @@
+# Description: Rebuilds the reading time counters from the closed reading sessions.
+from collections import defaultdict
+from datetime import timedelta
+from heapq import merge
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from library.models import ReadingSession
+from statistic.archive import ReadingSessionArchiver
+from statistic.models import (
+    BookReadingStatistics,
+    BookReadingTotal,
+    LeaderboardEntry,
+    ReadingSessionSummary,
+    ReadingStatistics,
+    ReadingTimeBucket,
+)
+
+
+class Command(BaseCommand):
+    """
+    Recalculates ReadingStatistics, BookReadingStatistics and the daily ReadingTimeBucket rows from scratch,
+    from the reading sessions and the archived session summaries,
+    then the leaderboards from the buckets, and refreshes the materialized per-book totals.
+    Is needed once for the sessions closed before the counters existed, or after manual data fixes.
+    Usage example:
+    python manage.py rebuild_reading_statistics
+    """
+
+    help = "Rebuild the per-(user, book) and per-book reading time counters from the reading sessions."
+
+    @staticmethod
+    def rebuild(model, rows, *fields):
+        model.objects.all().delete()
+        created = 0
+        while chunk := list(islice(rows, settings.READING_STATS_BATCH_SIZE)):
+            model.objects.bulk_create(
+                [model(total_reading_time=total, **dict(zip(fields, keys))) for *keys, total in chunk]
+            )
+            created += len(chunk)
+        return created
+
+    @staticmethod
+    def day_buckets():
+        """
+        Streams the daily buckets, the sessions are split by day one (user, book) pair at a time.
+        """
+        sessions = (
+            ReadingSession.objects.filter(end_time__isnull=False)
+            .order_by("user_id", "book_id")
+            .values_list("user_id", "book_id", "start_time", "end_time")
+            .iterator(chunk_size=settings.READING_STATS_BATCH_SIZE)
+        )
+        summaries = (
+            ReadingSessionSummary.objects.order_by("user_id", "book_id")
+            .values_list("user_id", "book_id", "sessions")
+            .iterator(chunk_size=settings.READING_STATS_BATCH_SIZE)
+        )
+        archived_sessions = (
+            (user_id, book_id, start_time, end_time)
+            for user_id, book_id, data in summaries
+            for _, start_time, end_time in ReadingSessionSummary.decode_sessions(data)
+        )
+        all_sessions = merge(sessions, archived_sessions, key=lambda session: session[:2])
+        for (user_id, book_id), pair_sessions in groupby(all_sessions, key=lambda session: session[:2]):
+            day_times = defaultdict(timedelta)
+            for *_, start_time, end_time in pair_sessions:
+                for day, reading_time in ReadingTimeBucket.split_by_day(start_time, end_time):
+                    day_times[day] += reading_time
+            for day, reading_time in day_times.items():
+                yield user_id, book_id, day, reading_time
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user_book_count = self.rebuild(
+                ReadingStatistics, ReadingSessionArchiver.totals("user_id", "book_id"), "user_id", "book_id"
+            )
+            book_count = self.rebuild(BookReadingStatistics, ReadingSessionArchiver.totals("book_id"), "book_id")
+            bucket_count = self.rebuild(ReadingTimeBucket, self.day_buckets(), "user_id", "book_id", "date")
+            LeaderboardEntry.rebuild()
+            BookReadingTotal.refresh(DEFAULT_DB_ALIAS)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {user_book_count} user/book counters, {book_count} book counters "
+                f"and {bucket_count} daily buckets."
+            )
+        )
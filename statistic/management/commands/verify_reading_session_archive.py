@@ -0,0 +1,84 @@
+# Description: Verifies that the archival of the reading sessions kept the reading time totals.
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from library.models import ReadingSession
+from statistic.archive import ReadingSessionArchiver
+from statistic.models import BookReadingStatistics, ReadingSessionSummary, ReadingStatistics
+
+
+class Command(BaseCommand):
+    """
+    Checks that every summary matches its archived sessions and that none of them is still in ReadingSession,
+    then that the totals of the reading sessions plus the summaries, per book and per (user, book),
+    are equal to the running counters, which the statistic endpoints read.
+    Fails with the first mismatches listed.
+    Usage example:
+    python manage.py verify_reading_session_archive
+    """
+
+    help = "Verify the archived reading session summaries against the sessions and the counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-reported", type=int, default=20)
+
+    @staticmethod
+    def check_summaries():
+        for summary in ReadingSessionSummary.objects.order_by("id").iterator(
+            chunk_size=settings.READING_STATS_BATCH_SIZE
+        ):
+            sessions = ReadingSessionSummary.decode_sessions(summary.sessions)
+            total = sum((end_time - start_time for _, start_time, end_time in sessions), timedelta())
+            if len(sessions) != summary.session_count or total != summary.total_reading_time:
+                yield (
+                    f"Summary {summary.id}: {len(sessions)} archived sessions of {total}, "
+                    f"expected {summary.session_count} of {summary.total_reading_time}."
+                )
+            remaining = ReadingSession.objects.filter(id__in=[session[0] for session in sessions])
+            if remaining.exists():
+                yield f"Summary {summary.id}: sessions {list(remaining.values_list('id', flat=True))} not removed."
+
+    @staticmethod
+    def compare(name, totals, counters):
+        """
+        Merge join of two streams of (*key, total) ordered by the key, a missing key counts as zero.
+        """
+        totals, counters = iter(totals), iter(counters)
+        total, counter = next(totals, None), next(counters, None)
+        while total is not None or counter is not None:
+            if counter is None or (total is not None and total[:-1] < counter[:-1]):
+                key, expected, actual = total[:-1], total[-1], timedelta()
+                total = next(totals, None)
+            elif total is None or counter[:-1] < total[:-1]:
+                key, expected, actual = counter[:-1], timedelta(), counter[-1]
+                counter = next(counters, None)
+            else:
+                key, expected, actual = total[:-1], total[-1], counter[-1]
+                total, counter = next(totals, None), next(counters, None)
+            if expected != actual:
+                yield f"{name} {key}: sessions and summaries {expected}, counter {actual}."
+
+    def handle(self, *args, **options):
+        book_counters = (
+            BookReadingStatistics.objects.order_by("book_id")
+            .values_list("book_id", "total_reading_time")
+            .iterator(chunk_size=settings.READING_STATS_BATCH_SIZE)
+        )
+        user_book_counters = (
+            ReadingStatistics.objects.order_by("user_id", "book_id")
+            .values_list("user_id", "book_id", "total_reading_time")
+            .iterator(chunk_size=settings.READING_STATS_BATCH_SIZE)
+        )
+        errors = [
+            *self.check_summaries(),
+            *self.compare("Book", ReadingSessionArchiver.totals("book_id"), book_counters),
+            *self.compare("User, book", ReadingSessionArchiver.totals("user_id", "book_id"), user_book_counters),
+        ]
+
+        for error in errors[: options["max_reported"]]:
+            self.stderr.write(error)
+        if errors:
+            raise CommandError(f"{len(errors)} mismatches found.")
+        self.stdout.write(self.style.SUCCESS("The archived reading sessions match the reading time totals."))
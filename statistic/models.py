@@ -1,12 +1,525 @@
-from datetime import timedelta
+import struct
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import DurationField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
 
-from library.models import Book
+from library.models import Book, ReadingSession
+from library.signals import reading_sessions_closed
+from statistic.cache import StatisticCache
 
 
-class ReadingStatistics(models.Model):
+class ReadingTimeCounter(models.Model):
+    """
+    Running total of reading time, incremented when reading sessions are closed.
+    """
+
+    total_reading_time = models.DurationField(default=timedelta())
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def add_reading_time(cls, reading_time, **lookup):
+        """
+        Atomically adds reading time to the counter selected by lookup, the counter is created if it does not exist.
+        :param reading_time: Duration to add.
+        :param lookup: Fields that identify the counter, e.g. user_id and book_id.
+        :return: None
+        """
+        increment = {"total_reading_time": F("total_reading_time") + reading_time}
+        if cls.objects.filter(**lookup).update(**increment):
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(total_reading_time=reading_time, **lookup)
+        except IntegrityError:
+            # The counter was created by a concurrent request.
+            cls.objects.filter(**lookup).update(**increment)
+
+    @classmethod
+    def add_reading_times(cls, reading_times, fields):
+        """
+        Atomically adds reading time to many counters, with one INSERT ... ON CONFLICT DO UPDATE statement
+        per READING_STATS_BATCH_SIZE counters, the missing counters are created.
+        The rows are written in the order of the keys, so concurrent upserts lock them in the same order.
+        :param reading_times: Dict {tuple of the values of fields: duration to add}.
+        :param fields: Names of the fields that identify a counter, they must be a unique constraint of the model.
+        :return: None
+        """
+        db_connection = connections[router.db_for_write(cls)]
+        model_fields = [cls._meta.get_field(name) for name in [*fields, "total_reading_time"]]
+        columns = ", ".join(db_connection.ops.quote_name(field.column) for field in model_fields)
+        conflict = ", ".join(db_connection.ops.quote_name(field.column) for field in model_fields[:-1])
+        table = db_connection.ops.quote_name(cls._meta.db_table)
+        total = db_connection.ops.quote_name("total_reading_time")
+        placeholders = f"({', '.join(['%s'] * len(model_fields))})"
+
+        rows = iter(sorted(reading_times.items()))
+        with db_connection.cursor() as cursor:
+            while chunk := list(islice(rows, settings.READING_STATS_BATCH_SIZE)):
+                params = [
+                    field.get_db_prep_save(value, db_connection)
+                    for key, reading_time in chunk
+                    for field, value in zip(model_fields, [*key, reading_time])
+                ]
+                cursor.execute(
+                    f"INSERT INTO {table} ({columns}) VALUES {', '.join([placeholders] * len(chunk))} "
+                    f"ON CONFLICT ({conflict}) DO UPDATE SET {total} = {table}.{total} + EXCLUDED.{total}",
+                    params,
+                )
+
+
+class ReadingStatistics(ReadingTimeCounter):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
-    total_reading_time = models.DurationField(default=timedelta())
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "book"], name="unique_user_book_reading_statistics"),
+        ]
+
+
+class BookReadingStatistics(ReadingTimeCounter):
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, related_name="reading_statistics")
+
+
+class ReadingTimeBucket(ReadingTimeCounter):
+    """
+    Reading time of a user for a book, rolled up per day.
+    Days older than READING_TIME_BUCKETS_DAILY_HORIZON are compacted into monthly buckets,
+    so the table grows with users and days instead of with reading sessions.
+    """
+
+    class Period(models.TextChoices):
+        DAY = "day"
+        MONTH = "month"
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    period = models.CharField(max_length=5, choices=Period.choices, default=Period.DAY)
+    date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "book", "period", "date"], name="unique_reading_time_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["period", "date"], name="reading_time_bucket_date_idx"),
+        ]
+
+    @staticmethod
+    def split_by_day(start_time, end_time):
+        """
+        Splits the interval between start_time and end_time at local midnights.
+        :return: Iterator of tuples (date, duration of the interval inside this date).
+        """
+        start_time = timezone.localtime(start_time)
+        end_time = timezone.localtime(end_time)
+        while start_time < end_time:
+            next_day = (start_time + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            boundary = min(next_day, end_time)
+            yield start_time.date(), boundary - start_time
+            start_time = boundary
+
+    @staticmethod
+    def next_month(date):
+        return (date.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+    @staticmethod
+    def daily_from():
+        """
+        :return: First day of the month of the daily horizon, the days before it may be compacted into months.
+        """
+        horizon = timezone.localdate() - timedelta(days=settings.READING_TIME_BUCKETS_DAILY_HORIZON)
+        return horizon.replace(day=1)
+
+    @classmethod
+    def get_reading_time(cls, date_from, date_to=None, **filters):
+        """
+        Total reading time for the range of days, e.g. for the user or for the book.
+        Daily buckets are summed for the days of the range, monthly buckets for the months wholly inside it.
+        A range past the daily horizon must start and end at the month boundaries, the days of a partial month
+        may be compacted already.
+        :param date_from: First day of the range.
+        :param date_to: Last day of the range, inclusive. If not provided, the range ends today.
+        :param filters: Additional filters, e.g. user=user or book_id=1.
+        :return: Total reading time.
+        :raises ValueError: If the range starts or ends inside a month before the daily horizon.
+        """
+        date_to = date_to or timezone.localdate()
+        months_from = date_from if date_from.day == 1 else cls.next_month(date_from)
+        next_day = date_to + timedelta(days=1)
+        months_to = next_day if next_day.day == 1 else date_to.replace(day=1)
+        daily_from = cls.daily_from()
+        if (date_from < months_from and date_from < daily_from) or (date_to >= months_to and months_to < daily_from):
+            raise ValueError(f"The range before {daily_from} must start and end at the month boundaries.")
+
+        queryset = cls.objects.filter(
+            models.Q(period=cls.Period.DAY, date__gte=date_from, date__lte=date_to)
+            | models.Q(period=cls.Period.MONTH, date__gte=months_from, date__lt=months_to),
+            **filters,
+        )
+        return queryset.aggregate(
+            total=Coalesce(Sum("total_reading_time"), Value(timedelta()))
+        )["total"]
+
+    @classmethod
+    def compact(cls, before):
+        """
+        Folds the daily buckets of every whole month before the given date into monthly buckets.
+        Each month is compacted in its own transaction.
+        :param before: First day that should stay with day granularity, must be the first day of a month.
+        :return: Number of compacted months.
+        """
+        months = (
+            cls.objects.filter(period=cls.Period.DAY, date__lt=before)
+            .annotate(month=TruncMonth("date"))
+            .order_by("month")
+            .values_list("month", flat=True)
+            .distinct()
+        )
+
+        compacted = 0
+        for month in list(months):
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            with transaction.atomic():
+                month_buckets = cls.objects.filter(date__gte=month, date__lt=next_month)
+                totals = list(
+                    month_buckets.order_by()
+                    .values_list("user_id", "book_id")
+                    .annotate(total=Sum("total_reading_time"))
+                )
+                month_buckets.delete()
+                cls.objects.bulk_create(
+                    [
+                        cls(
+                            user_id=user_id,
+                            book_id=book_id,
+                            period=cls.Period.MONTH,
+                            date=month,
+                            total_reading_time=total,
+                        )
+                        for user_id, book_id, total in totals
+                    ],
+                    batch_size=settings.READING_STATS_BATCH_SIZE,
+                )
+            compacted += 1
+
+        return compacted
+
+
+class LeaderboardEntry(ReadingTimeCounter):
+    """
+    Reading time of a book or of a reader over the last N days, N is one of LEADERBOARD_WINDOWS.
+    The window of N days consists of today and N - 1 previous days. Entries are incremented when reading sessions
+    are closed and rebuilt from the daily buckets every night, so the days that left the window are dropped.
+    The rebuild adds corrections to the entries instead of replacing them, so it runs alongside the increments.
+    Top N queries are index range scans over (board, days, total_reading_time).
+    """
+
+    class Board(models.TextChoices):
+        BOOKS = "books"
+        READERS = "readers"
+
+    board = models.CharField(max_length=7, choices=Board.choices)
+    days = models.PositiveSmallIntegerField()
+    # Book id for the books board, user id for the readers board.
+    subject_id = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["board", "days", "subject_id"], name="unique_leaderboard_entry"),
+        ]
+        indexes = [
+            models.Index(fields=["board", "days", "-total_reading_time", "subject_id"], name="leaderboard_top_idx"),
+        ]
+
+    @staticmethod
+    def window_start(days, today=None):
+        return (today or timezone.localdate()) - timedelta(days=days - 1)
+
+    @classmethod
+    def add_day_times(cls, day_times):
+        """
+        Adds the reading time of the days that are inside the windows.
+        :param day_times: Dict {(user_id, book_id, date): reading time}.
+        :return: None
+        """
+        subject_times = defaultdict(timedelta)
+        for days in settings.LEADERBOARD_WINDOWS:
+            window_start = cls.window_start(days)
+            for (user_id, book_id, day), reading_time in day_times.items():
+                if day >= window_start:
+                    subject_times[cls.Board.BOOKS, days, book_id] += reading_time
+                    subject_times[cls.Board.READERS, days, user_id] += reading_time
+
+        cls.add_reading_times(subject_times, ["board", "days", "subject_id"])
+
+    @classmethod
+    def rebuild(cls, today=None):
+        """
+        Corrects all entries to the totals of the daily buckets inside the windows, without locking the table.
+        The totals and the entries are read in one snapshot, then the differences are added to the entries
+        like increments, so the sessions closed in the meantime, which increment both the buckets and the entries,
+        are kept. The entries that drop to zero are deleted.
+        :param today: Last day of the windows, the current date by default.
+        :return: Number of entries with reading time.
+        """
+        subject_fields = {cls.Board.BOOKS: "book_id", cls.Board.READERS: "user_id"}
+        db_connection = connections[router.db_for_write(cls)]
+        snapshot = db_connection.vendor == "postgresql" and not db_connection.in_atomic_block
+        corrections = defaultdict(timedelta)
+        with transaction.atomic(using=db_connection.alias):
+            if snapshot:
+                with db_connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            for days in settings.LEADERBOARD_WINDOWS:
+                buckets = ReadingTimeBucket.objects.using(db_connection.alias).filter(
+                    period=ReadingTimeBucket.Period.DAY, date__gte=cls.window_start(days, today)
+                )
+                for board, subject_field in subject_fields.items():
+                    totals = (
+                        buckets.order_by()
+                        .values_list(subject_field)
+                        .annotate(total=Sum("total_reading_time"))
+                        .filter(total__gt=timedelta())
+                        .iterator(chunk_size=settings.READING_STATS_BATCH_SIZE)
+                    )
+                    for subject_id, total in totals:
+                        corrections[board, days, subject_id] += total
+            created = len(corrections)
+            entries = (
+                cls.objects.using(db_connection.alias)
+                .values_list("board", "days", "subject_id", "total_reading_time")
+                .iterator(chunk_size=settings.READING_STATS_BATCH_SIZE)
+            )
+            for board, days, subject_id, total in entries:
+                corrections[board, days, subject_id] -= total
+
+        corrections = {key: correction for key, correction in corrections.items() if correction}
+        with transaction.atomic(using=db_connection.alias):
+            cls.add_reading_times(corrections, ["board", "days", "subject_id"])
+            for board, days in {key[:2] for key in corrections}:
+                cls.objects.using(db_connection.alias).filter(
+                    board=board, days=days, total_reading_time__lte=timedelta()
+                ).delete()
+        return created
+
+    @classmethod
+    def top(cls, board, days, limit):
+        return list(
+            cls.objects.filter(board=board, days=days, total_reading_time__gt=timedelta())
+            .order_by("-total_reading_time", "subject_id")
+            .values_list("subject_id", "total_reading_time")[:limit]
+        )
+
+
+class ReadingSessionSummary(ReadingTimeCounter):
+    """
+    Closed reading sessions of a user for a book that started in a month, moved out of ReadingSession
+    by the ReadingSessionArchiver. Keeps the total reading time and the number of the sessions,
+    and the sessions themselves as a zlib compressed array of (id, start, end) triples of 64-bit integers,
+    the times in microseconds since the epoch, so the histograms can still split them by hour and day.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    month = models.DateField()
+    session_count = models.PositiveIntegerField(default=0)
+    sessions = models.BinaryField(default=b"")
+
+    epoch = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    session_format = struct.Struct("<qqq")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "book", "month"], name="unique_reading_session_summary"),
+        ]
+        indexes = [
+            models.Index(fields=["book", "month"], name="session_summary_book_month_idx"),
+        ]
+
+    @staticmethod
+    def month_of(start_time):
+        return timezone.localtime(start_time).date().replace(day=1)
+
+    @classmethod
+    def encode_sessions(cls, sessions):
+        """
+        :param sessions: Iterable of tuples (id, start_time, end_time).
+        :return: Compressed bytes.
+        """
+        microsecond = timedelta(microseconds=1)
+        return zlib.compress(
+            b"".join(
+                cls.session_format.pack(
+                    session_id, (start_time - cls.epoch) // microsecond, (end_time - cls.epoch) // microsecond
+                )
+                for session_id, start_time, end_time in sessions
+            )
+        )
+
+    @classmethod
+    def decode_sessions(cls, data):
+        """
+        :return: List of tuples (id, start_time, end_time) of the archived sessions.
+        """
+        if not data:
+            return []
+        return [
+            (session_id, cls.epoch + timedelta(microseconds=start), cls.epoch + timedelta(microseconds=end))
+            for session_id, start, end in cls.session_format.iter_unpack(zlib.decompress(bytes(data)))
+        ]
+
+    def add_sessions(self, sessions):
+        """
+        Appends sessions to the summary, the summary must be locked by the caller.
+        :param sessions: List of tuples (id, start_time, end_time).
+        :return: None
+        """
+        self.sessions = self.encode_sessions(self.decode_sessions(self.sessions) + sessions)
+        self.session_count += len(sessions)
+        self.total_reading_time += sum((end_time - start_time for _, start_time, end_time in sessions), timedelta())
+
+
+class BookReadingTotal(models.Model):
+    """
+    Total reading time of the closed and the archived reading sessions per book,
+    mapped onto the statistic_book_reading_total_v2 view.
+    On PostgreSQL the view is materialized, created with a unique index on the book, and refreshed concurrently
+    by the refresh_book_reading_totals task, on other databases it is a plain view that is always up to date.
+    The name of the view is versioned, it must be bumped whenever the query changes, so create_view replaces
+    a view with an old definition instead of keeping it.
+    """
+
+    # Names of the views with the previous definitions, dropped by create_view.
+    obsolete_views = ["statistic_book_reading_total"]
+
+    book = models.OneToOneField(
+        Book,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_constraint=False,
+        related_name="reading_total",
+    )
+    total_reading_time = models.DurationField()
+
+    class Meta:
+        managed = False
+        db_table = "statistic_book_reading_total_v2"
+
+    @staticmethod
+    def view_queries():
+        """
+        Totals of the reading sessions and of the archived session summaries, both grouped by book.
+        """
+        sessions = (
+            ReadingSession.objects.filter(end_time__isnull=False)
+            .order_by()
+            .values("book_id")
+            .annotate(
+                total_reading_time=Sum(
+                    ExpressionWrapper(F("end_time") - F("start_time"), output_field=DurationField())
+                )
+            )
+        )
+        summaries = (
+            ReadingSessionSummary.objects.order_by()
+            .values("book_id")
+            .annotate(total_reading_time=Sum("total_reading_time"))
+        )
+        return sessions, summaries
+
+    @classmethod
+    def create_view(cls, using, replace=False):
+        """
+        Creates the view if it does not exist and drops the views of the previous versions,
+        the query is compiled by the ORM for the database of the connection.
+        :param using: Alias of the database.
+        :param replace: Drop and create the view, e.g. after the reading session table was replaced.
+        :return: None
+        """
+        compiled = [queryset.query.get_compiler(using).as_sql() for queryset in cls.view_queries()]
+        sql = " UNION ALL ".join(part_sql for part_sql, _ in compiled)
+        params = [param for _, part_params in compiled for param in part_params]
+        sql = f"SELECT book_id, SUM(total_reading_time) AS total_reading_time FROM ({sql}) totals GROUP BY book_id"
+        table = cls._meta.db_table
+        with connections[using].cursor() as cursor:
+            kind = "MATERIALIZED VIEW" if connections[using].vendor == "postgresql" else "VIEW"
+            for name in [*cls.obsolete_views, *([table] if replace else [])]:
+                cursor.execute(f"DROP {kind} IF EXISTS {name}")
+            cursor.execute(f"CREATE {kind} IF NOT EXISTS {table} AS {sql}", params)
+            if kind == "MATERIALIZED VIEW":
+                cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_book_idx ON {table} (book_id)")
+
+    @classmethod
+    def refresh(cls, using):
+        """
+        Refreshes the materialized view without blocking the reads, the view is not refreshed on other databases.
+        The cached pages of the book list were built from the view before the refresh, so they are invalidated.
+        :param using: Alias of the database.
+        :return: None
+        """
+        if connections[using].vendor == "postgresql":
+            with connections[using].cursor() as cursor:
+                cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {cls._meta.db_table}")
+        StatisticCache.invalidate_books(using)
+
+
+def add_sessions_reading_time(sessions):
+    """
+    Folds the duration of closed reading sessions into the per-(user, book) and per-book counters,
+    into the daily buckets and into the leaderboards, then invalidates the cached statistics of the users and books.
+    The durations are summed per counter first, each table is written with one upsert per batch of counters,
+    so the number of queries does not depend on the number of sessions.
+    :param sessions: Closed ReadingSession instances.
+    :return: None
+    """
+    user_book_times = defaultdict(timedelta)
+    book_times = defaultdict(timedelta)
+    day_times = defaultdict(timedelta)
+    for session in sessions:
+        reading_time = max(session.end_time - session.start_time, timedelta())
+        user_book_times[session.user_id, session.book_id] += reading_time
+        book_times[session.book_id] += reading_time
+        for day, day_reading_time in ReadingTimeBucket.split_by_day(session.start_time, session.end_time):
+            day_times[session.user_id, session.book_id, day] += day_reading_time
+
+    # The buckets and the leaderboards are incremented together, see LeaderboardEntry.rebuild.
+    with transaction.atomic():
+        ReadingStatistics.add_reading_times(user_book_times, ["user_id", "book_id"])
+        BookReadingStatistics.add_reading_times(
+            {(book_id,): reading_time for book_id, reading_time in book_times.items()}, ["book_id"]
+        )
+        ReadingTimeBucket.add_reading_times(
+            {
+                (user_id, book_id, ReadingTimeBucket.Period.DAY, day): reading_time
+                for (user_id, book_id, day), reading_time in day_times.items()
+            },
+            ["user_id", "book_id", "period", "date"],
+        )
+        LeaderboardEntry.add_day_times(day_times)
+
+    StatisticCache.invalidate_sessions(sessions)
+
+
+@receiver(reading_sessions_closed)
+def add_closed_sessions_reading_time(sender, sessions, **kwargs):
+    add_sessions_reading_time(sessions)
+
+
+@receiver(post_save, sender=ReadingSession)
+def add_created_closed_session_reading_time(sender, instance, created, **kwargs):
+    if created and instance.end_time is not None:
+        add_sessions_reading_time([instance])
@@ -1,8 +1,15 @@
 # Description: Serializers for statistic app
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 
 from auth_api.models import UserReadingStats
 from library.models import Book
+from statistic.export import ReadingSessionExporter
+from statistic.histogram import ReadingHistogram
+from statistic.models import LeaderboardEntry
 
 
 class BookReadingTimeSerializer(serializers.ModelSerializer):
@@ -17,3 +24,84 @@ class UserReadingStatsSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserReadingStats
         fields = ["statistic_time_7_days", "statistic_time_30_days"]
+
+
+class ReadingSessionExportSerializer(serializers.Serializer):
+    """
+    Serializer for the query parameters of the reading sessions export.
+    """
+
+    type = serializers.ChoiceField(choices=ReadingSessionExporter.formats, default="csv")
+    user = serializers.IntegerField(required=False)
+    date_from = serializers.DateTimeField(required=False)
+    date_to = serializers.DateTimeField(required=False)
+    gzip = serializers.BooleanField(default=False)
+
+
+class LeaderboardQuerySerializer(serializers.Serializer):
+    """
+    Serializer for the query parameters of the leaderboard.
+    """
+
+    board = serializers.ChoiceField(choices=LeaderboardEntry.Board.choices, default=LeaderboardEntry.Board.BOOKS)
+    days = serializers.IntegerField(default=7)
+    limit = serializers.IntegerField(default=10, min_value=1)
+
+    def validate_days(self, value):
+        if value not in settings.LEADERBOARD_WINDOWS:
+            raise serializers.ValidationError(f"Must be one of {', '.join(map(str, settings.LEADERBOARD_WINDOWS))}.")
+        return value
+
+    def validate_limit(self, value):
+        return min(value, settings.LEADERBOARD_MAX_LIMIT)
+
+
+class LeaderboardEntrySerializer(serializers.Serializer):
+    """
+    Serializer for a place of the leaderboard, name is the book title or the username.
+    """
+
+    rank = serializers.IntegerField()
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    total_reading_time = serializers.DurationField()
+
+
+class ReadingHistogramQuerySerializer(serializers.Serializer):
+    """
+    Serializer for the query parameters of the reading histogram, the range is limited to HISTOGRAM_MAX_BUCKETS
+    and must not start before the first day of the granularity.
+    """
+
+    granularity = serializers.ChoiceField(choices=ReadingHistogram.Granularity.choices, default="day")
+    date_from = serializers.DateField()
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault("date_to", timezone.localdate())
+        if attrs["date_to"] < attrs["date_from"]:
+            raise serializers.ValidationError({"date_to": "Must not be before date_from."})
+        first_day = ReadingHistogram.first_day(attrs["granularity"])
+        if first_day and attrs["date_from"] < first_day:
+            raise serializers.ValidationError(
+                {"date_from": f"The {attrs['granularity']} histogram is available from {first_day}."}
+            )
+        buckets = ReadingHistogram.count_buckets(attrs["granularity"], attrs["date_from"], attrs["date_to"])
+        if buckets > settings.HISTOGRAM_MAX_BUCKETS:
+            raise serializers.ValidationError(
+                f"The range has {buckets} buckets, at most {settings.HISTOGRAM_MAX_BUCKETS} are allowed."
+            )
+        return attrs
+
+
+class ReadingHistogramBucketSerializer(serializers.Serializer):
+    """
+    Serializer for a bucket of the reading histogram, start is a datetime for hours and a date otherwise.
+    """
+
+    start = serializers.SerializerMethodField()
+    total_reading_time = serializers.DurationField()
+
+    def get_start(self, obj):
+        field = serializers.DateTimeField() if isinstance(obj["start"], datetime) else serializers.DateField()
+        return field.to_representation(obj["start"])
@@ -1,73 +1,217 @@
 # Description: This file contains the tasks for updating the statistics of the users' reading time.
 
+import logging
 from datetime import timedelta
+from itertools import islice
 
-from celery import shared_task
+from celery import chord, shared_task
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Case, ExpressionWrapper, F, Sum, When, fields
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import FilteredRelation, Max, Min, Q, Sum, Value, fields
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+from auth_api.cache import UserCache
 from auth_api.models import UserReadingStats
-from library.models import ReadingSession
+from statistic.archive import ReadingSessionArchiver
+from statistic.models import BookReadingTotal, LeaderboardEntry, ReadingTimeBucket
+
+logger = logging.getLogger(__name__)
 
 
 class UserReadingStatsUpdater:
+    """
+    Set-based recompute of the window statistics stored in UserReadingStats.
+    All windows for all users are summed from the daily reading time buckets by one grouped query
+    and written back with chunked bulk upserts, so the number of queries does not depend on the number of users.
+    The users can be split into shards by id ranges, which are updated independently by several workers.
+    The windows consist of whole local calendar days, today and the N - 1 previous days, not of the last N * 24
+    hours: the reading of the first day counts in full, also the hours before the current time of the day.
+    """
+
+    WINDOWS = (7, 30)
+    last_update_key = "statistic:reading_stats:last_update"
+
     @staticmethod
-    def update_reading_stats_for_user(user, date_from):
+    def get_stats_field(days):
+        return "statistic_time_" + str(days) + "_days"
+
+    @staticmethod
+    def window_reading_time(date_from):
+        """
+        Builds the aggregate of the reading time of the buckets starting from date_from.
+        :param date_from: First day of the window.
+        :return: Aggregate expression with the total reading time, zero if there was no reading.
         """
-        Calculates the total reading time for a given user (user),
-        the duration of only a session that is partially or completely carried out in a given time interval.
-        :param user: The user for whom statistics should be calculated.
-        :param date_from: Start of the time interval for calculating statistics.
-        :return: Total reading time during the specified interval.
+        return Coalesce(
+            Sum("recent_buckets__total_reading_time", filter=Q(recent_buckets__date__gte=date_from)),
+            Value(timedelta()),
+            output_field=fields.DurationField(),
+        )
 
+    @classmethod
+    def get_reading_stats(cls, windows, today=None, id_from=None, id_to=None):
+        """
+        Grouped query with the reading time of every user for every window.
+        A window of N days consists of today and N - 1 previous days,
+        the join to the buckets is limited to the widest window.
+        :param windows: Window sizes in days.
+        :param today: Last day of all windows, the current date by default.
+        :param id_from: Optional first user id of the shard.
+        :param id_to: Optional user id after the last user id of the shard.
+        :return: Iterator of tuples (user_id, total for the first window, total for the second window, ...).
         """
-        total_reading_time = ReadingSession.objects.filter(
-            user=user, end_time__gte=date_from, end_time__isnull=False
-        ).annotate(
-            adjusted_start_time=Case(
-                When(start_time__gte=date_from, then=F("start_time")),
-                default=date_from,
-                output_field=fields.DateTimeField(),
-            ),
-            adjusted_end_time=F("end_time"),
-        ).aggregate(
-            total_time=Sum(
-                ExpressionWrapper(
-                    F("adjusted_end_time") - F("adjusted_start_time"),
-                    output_field=fields.DurationField(),
+        today = today or timezone.localdate()
+        dates_from = {days: today - timedelta(days=days - 1) for days in windows}
+        annotations = {
+            cls.get_stats_field(days): cls.window_reading_time(date_from)
+            for days, date_from in dates_from.items()
+        }
+        users = User.objects.all()
+        if id_from is not None:
+            users = users.filter(id__gte=id_from)
+        if id_to is not None:
+            users = users.filter(id__lt=id_to)
+
+        return (
+            users.annotate(
+                recent_buckets=FilteredRelation(
+                    "readingtimebucket",
+                    condition=Q(readingtimebucket__date__gte=min(dates_from.values())),
                 )
             )
-        )[
-            "total_time"
-        ] or timedelta(
-            0
+            .order_by()
+            .values("id")
+            .annotate(**annotations)
+            .values_list("id", *annotations)
+            .iterator(chunk_size=settings.READING_STATS_BATCH_SIZE)
         )
 
-        return total_reading_time
+    @classmethod
+    def update_reading_stats(cls, windows=WINDOWS, id_from=None, id_to=None):
+        """
+        Updates reading statistics for all users, or for the users of the shard, for each of the given windows.
+        Rows are upserted in chunks of READING_STATS_BATCH_SIZE, so memory stays flat.
+        :param windows: Window sizes in days, each of them must have a statistic_time_<days>_days field.
+        :param id_from: Optional first user id of the shard.
+        :param id_to: Optional user id after the last user id of the shard.
+        :return: Number of users whose statistics were written.
+        """
+        stats_fields = [cls.get_stats_field(days) for days in windows]
+        rows = cls.get_reading_stats(windows, id_from=id_from, id_to=id_to)
+        updated = 0
+
+        while chunk := list(islice(rows, settings.READING_STATS_BATCH_SIZE)):
+            UserReadingStats.objects.bulk_create(
+                [
+                    UserReadingStats(user_id=user_id, **dict(zip(stats_fields, totals)))
+                    for user_id, *totals in chunk
+                ],
+                update_conflicts=True,
+                unique_fields=["user"],
+                update_fields=stats_fields,
+            )
+            updated += len(chunk)
+
+        if updated:
+            # The bulk upserts send no signals, the cached users keep the reading stats from before.
+            UserCache.invalidate_all()
+        return updated
+
+    @staticmethod
+    def get_shards(shard_size):
+        """
+        Splits the range of the user ids into shards of shard_size ids.
+        :return: List of [id_from, id_to) pairs.
+        """
+        ids = User.objects.aggregate(first=Min("id"), last=Max("id"))
+        if ids["first"] is None:
+            return []
+        return [[id_from, id_from + shard_size] for id_from in range(ids["first"], ids["last"] + 1, shard_size)]
+
+    @staticmethod
+    def split_lanes(shards, concurrency):
+        """
+        Deals the shards round-robin to at most concurrency lanes, the shards of one lane are updated one by one.
+        """
+        return [shards[lane::concurrency] for lane in range(min(concurrency, len(shards)))]
+
+    @classmethod
+    def record_update(cls, started_at, shards, users):
+        update = {"started_at": started_at, "finished_at": timezone.now().isoformat(), "shards": shards, "users": users}
+        cache.set(cls.last_update_key, update, timeout=None)
+        logger.info("Updated reading statistics of %s users in %s shards, started at %s.", users, shards, started_at)
+        return update
+
+    @classmethod
+    def get_last_update(cls):
+        return cache.get(cls.last_update_key)
 
     @classmethod
     def update_user_reading_stats(cls, days):
         """
         Updates reading statistics for all users for the last 'days' of days.
-        For each user, the total reading time for the specified period is calculated.
         :param days: Number of days from the current date to calculate statistics.
-        :return: None
+        :return: Number of users whose statistics were written.
         """
-        date_from = timezone.now() - timedelta(days=days)
-        for user in User.objects.all():
-            total_reading_time = cls.update_reading_stats_for_user(user, date_from)
-            UserReadingStats.objects.update_or_create(
-                user=user,
-                defaults={"statistic_time_" + str(days) + "_days": total_reading_time},
-            )
+        return cls.update_reading_stats((days,))
+
+
+@shared_task
+def update_user_reading_stats():
+    """
+    Fans the update of the reading statistics out to READING_STATS_SHARD_CONCURRENCY tasks over user id shards,
+    the chord callback records the completion time and the number of updated users.
+    """
+    shards = UserReadingStatsUpdater.get_shards(settings.READING_STATS_SHARD_SIZE)
+    lanes = UserReadingStatsUpdater.split_lanes(shards, settings.READING_STATS_SHARD_CONCURRENCY)
+    callback = record_user_reading_stats_update.s(started_at=timezone.now().isoformat(), shards=len(shards))
+    if not lanes:
+        callback.delay([])
+        return
+    chord(update_user_reading_stats_shards.s(lane) for lane in lanes)(callback)
+
+
+@shared_task
+def update_user_reading_stats_shards(shards, windows=UserReadingStatsUpdater.WINDOWS):
+    return sum(UserReadingStatsUpdater.update_reading_stats(windows, id_from, id_to) for id_from, id_to in shards)
+
+
+@shared_task
+def record_user_reading_stats_update(counts, started_at, shards):
+    UserReadingStatsUpdater.record_update(started_at, shards, sum(counts))
 
 
 @shared_task
 def update_user_reading_stats_7_days():
-    UserReadingStatsUpdater.update_user_reading_stats(7)
+    return UserReadingStatsUpdater.update_user_reading_stats(7)
 
 
 @shared_task
 def update_user_reading_stats_30_days():
-    UserReadingStatsUpdater.update_user_reading_stats(30)
+    return UserReadingStatsUpdater.update_user_reading_stats(30)
+
+
+@shared_task
+def compact_reading_time_buckets():
+    return ReadingTimeBucket.compact(before=ReadingTimeBucket.daily_from())
+
+
+@shared_task
+def rebuild_leaderboards():
+    return LeaderboardEntry.rebuild()
+
+
+@shared_task
+def refresh_book_reading_totals():
+    if settings.BOOK_READING_TIME_SOURCE == "materialized":
+        BookReadingTotal.refresh(DEFAULT_DB_ALIAS)
+
+
+@shared_task
+def archive_reading_sessions():
+    return ReadingSessionArchiver(
+        settings.READING_SESSION_ARCHIVE_MONTHS, settings.READING_SESSION_ARCHIVE_BATCH_SIZE
+    ).archive()
@@ -1,14 +1,27 @@
 # Description: Urls for statistic app
 from django.urls import path
 
-from statistic.views import BookReadingTimeListView, BookReadingTimeRetrieveView, UserBookReadingTimeListView
+from statistic.views import (
+    BookReadingTimeListView,
+    BookReadingTimeRetrieveView,
+    LeaderboardView,
+    ReadingHistogramView,
+    ReadingSessionExportView,
+    StatisticCacheView,
+    UserBookReadingTimeListView,
+)
 
 urlpatterns = [
     path("users/", UserBookReadingTimeListView.as_view(), name="users-statistic"),
+    path("users/histogram/", ReadingHistogramView.as_view(), name="users-histogram"),
     path("books/", BookReadingTimeListView.as_view(), name="books-statistic"),
     path(
         "books/<int:pk>",
         BookReadingTimeRetrieveView.as_view(),
         name="books-retrieve-statistic",
     ),
+    path("books/<int:pk>/histogram/", ReadingHistogramView.as_view(), name="books-histogram"),
+    path("cache/", StatisticCacheView.as_view(), name="statistic-cache"),
+    path("export/", ReadingSessionExportView.as_view(), name="statistic-export"),
+    path("leaderboard/", LeaderboardView.as_view(), name="statistic-leaderboard"),
 ]
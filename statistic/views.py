@@ -1,14 +1,33 @@
+from abc import ABC, abstractmethod
 from datetime import timedelta
 
-from django.db.models import DurationField, ExpressionWrapper, F, Q, Sum, Value
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import DurationField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
 from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework.generics import ListAPIView, RetrieveAPIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from library.models import Book
+from library.pagination import FastListMixin, IdCursorPagination
 
-from .serializers import BookReadingTimeSerializer, UserReadingStatsSerializer
+from .cache import StatisticCache
+from .export import ReadingSessionExporter
+from .histogram import ReadingHistogram
+from .models import LeaderboardEntry, ReadingSessionSummary
+from .serializers import (
+    BookReadingTimeSerializer,
+    LeaderboardEntrySerializer,
+    LeaderboardQuerySerializer,
+    ReadingHistogramBucketSerializer,
+    ReadingHistogramQuerySerializer,
+    ReadingSessionExportSerializer,
+    UserReadingStatsSerializer,
+)
 
 
 class BaseReadingTimeView:
@@ -18,13 +37,17 @@ class BaseReadingTimeView:
     in several book representation classes.
     Methods:
         :static aggregate_reading_time()
+        :static counted_reading_time()
+        :static materialized_reading_time()
+        :static book_reading_time()
     """
 
     @staticmethod
     def aggregate_reading_time(queryset, user=None):
         """
         Method for aggregate reading time.
-        This method annotates each book in the queryset with the total reading time based on related reading sessions.
+        This method annotates each book in the queryset with the total reading time based on related reading sessions
+        and on the archived session summaries.
         It includes an option to filter the reading sessions by a specific user.
 
         :param queryset:  A queryset of Book instances to be annotated.
@@ -35,41 +58,129 @@ class BaseReadingTimeView:
                 Books with no reading time (zero duration) are excluded.
         """
         filter_kwargs = {"readingsession__end_time__isnull": False}
+        archived = ReadingSessionSummary.objects.filter(book=OuterRef("pk"))
         if user:
             filter_kwargs["readingsession__user"] = user
+            archived = archived.filter(user=user)
 
         aggregated_queryset = queryset.annotate(
-            total_reading_time=Sum(
+            total_reading_time=ExpressionWrapper(
                 Coalesce(
-                    ExpressionWrapper(
-                        F("readingsession__end_time") - F("readingsession__start_time"),
-                        output_field=DurationField(),
+                    Sum(
+                        ExpressionWrapper(
+                            F("readingsession__end_time") - F("readingsession__start_time"),
+                            output_field=DurationField(),
+                        ),
+                        filter=Q(**filter_kwargs),
+                    ),
+                    Value(timedelta()),
+                    output_field=DurationField(),
+                )
+                + Coalesce(
+                    Subquery(
+                        archived.order_by().values("book").annotate(total=Sum("total_reading_time")).values("total")
                     ),
                     Value(timedelta()),
                     output_field=DurationField(),
                 ),
-                filter=Q(**filter_kwargs),
+                output_field=DurationField(),
             )
         ).distinct()
 
         return aggregated_queryset.filter(total_reading_time__gt=timedelta(0))
 
+    @staticmethod
+    def counted_reading_time(queryset, user=None):
+        """
+        Method for reading time from the running counters.
+        This method annotates each book in the queryset with the precomputed total reading time,
+        the counters are incremented when reading sessions are closed, so no reading sessions are scanned.
+
+        :param queryset: A queryset of Book instances to be annotated.
+        :param user: An optional User instance. If provided, the per-user counters are used.
+        :return: The annotated queryset with each book having an additional 'total_reading_time' attribute.
+                Books with no reading time (zero duration) are excluded.
+        """
+        if user:
+            # Both conditions in one filter(), so the counter is read from the join of the user's row.
+            counter = "readingstatistics__total_reading_time"
+            queryset = queryset.filter(readingstatistics__user=user, **{counter + "__gt": timedelta(0)})
+        else:
+            counter = "reading_statistics__total_reading_time"
+            queryset = queryset.filter(**{counter + "__gt": timedelta(0)})
+
+        return queryset.annotate(total_reading_time=F(counter))
+
+    @staticmethod
+    def materialized_reading_time(queryset):
+        """
+        Method for reading time from the BookReadingTotal view.
+        This method annotates each book in the queryset with the total reading time joined from the view by the book id,
+        on PostgreSQL the totals are as fresh as the last refresh of the materialized view.
+
+        :param queryset: A queryset of Book instances to be annotated.
+        :return: The annotated queryset with each book having an additional 'total_reading_time' attribute.
+                Books with no reading time (zero duration) are excluded.
+        """
+        counter = "reading_total__total_reading_time"
+        return queryset.filter(**{counter + "__gt": timedelta(0)}).annotate(total_reading_time=F(counter))
+
+    @classmethod
+    def book_reading_time(cls, queryset):
+        """
+        Annotates the books with the total reading time of all users from the source chosen by
+        the BOOK_READING_TIME_SOURCE setting: "live", "counters" or "materialized".
+        """
+        sources = {
+            "live": cls.aggregate_reading_time,
+            "counters": cls.counted_reading_time,
+            "materialized": cls.materialized_reading_time,
+        }
+        return sources[settings.BOOK_READING_TIME_SOURCE](queryset)
+
 
-class BookReadingTimeListView(BaseReadingTimeView, ListAPIView):
+class CachedResponseMixin(ABC):
     """
-    View for list books with total reading time.
+    Mixin for statistic views, the response data of GET requests is kept in StatisticCache.
+    Methods:
+        get_cache_key() - must be implemented by the view.
+    """
+
+    @abstractmethod
+    def get_cache_key(self):
+        """
+        :return: StatisticCache key of the response data, it must cover everything the data depends on,
+                 e.g. the absolute URL of a page with pagination links.
+        """
+
+    def get(self, request, *args, **kwargs):
+        build_response = super().get
+        data = StatisticCache.get_or_set(
+            self.get_cache_key(), lambda: build_response(request, *args, **kwargs).data
+        )
+        return Response(data)
+
+
+class BookReadingTimeListView(CachedResponseMixin, FastListMixin, BaseReadingTimeView, ListAPIView):
+    """
+    View for list books with total reading time, paginated by the book id.
     Usage example:
-    GET api/v1/statistic/books/
+    GET api/v1/statistic/books/?page_size=50
     """
 
     serializer_class = BookReadingTimeSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = IdCursorPagination
 
     def get_queryset(self):
-        return self.aggregate_reading_time(Book.objects.all())
+        return self.book_reading_time(Book.objects.all())
+
+    def get_cache_key(self):
+        # The pagination links are absolute, so the pages are cached per host and scheme.
+        return StatisticCache.books_key(self.request.build_absolute_uri())
 
 
-class BookReadingTimeRetrieveView(BaseReadingTimeView, RetrieveAPIView):
+class BookReadingTimeRetrieveView(CachedResponseMixin, BaseReadingTimeView, RetrieveAPIView):
     """
     View for retrieve book with total reading time.
     :param pk: Book id.
@@ -82,10 +193,13 @@ class BookReadingTimeRetrieveView(BaseReadingTimeView, RetrieveAPIView):
 
     def get_queryset(self):
         book_id = self.kwargs.get("pk")
-        return self.aggregate_reading_time(Book.objects.filter(id=book_id))
+        return self.book_reading_time(Book.objects.filter(id=book_id))
 
+    def get_cache_key(self):
+        return StatisticCache.book_key(self.kwargs.get("pk"))
 
-class UserBookReadingTimeListView(BaseReadingTimeView, ListAPIView):
+
+class UserBookReadingTimeListView(CachedResponseMixin, BaseReadingTimeView, ListAPIView):
     """
     View for list books with total reading time for user.
     Usage example:
@@ -94,9 +208,12 @@ class UserBookReadingTimeListView(BaseReadingTimeView, ListAPIView):
 
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, *args, **kwargs):
+    def get_cache_key(self):
+        return StatisticCache.user_key(self.request.user.pk)
+
+    def list(self, request, *args, **kwargs):
         user = request.user
-        books_queryset = self.aggregate_reading_time(Book.objects.all(), user=user)
+        books_queryset = self.counted_reading_time(Book.objects.all(), user=user)
 
         books_serializer = BookReadingTimeSerializer(books_queryset, many=True)
         all_statistics_serializer = UserReadingStatsSerializer(user.reading_stats)
@@ -107,3 +224,112 @@ class UserBookReadingTimeListView(BaseReadingTimeView, ListAPIView):
             "books": books_serializer.data,
         }
         return Response(response_data)
+
+
+class StatisticCacheView(APIView):
+    """
+    View for the hit and miss counters of the statistic cache.
+    Usage example:
+    GET api/v1/statistic/cache/
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(StatisticCache.get_counters())
+
+
+class ReadingSessionExportView(APIView):
+    """
+    View for the streaming export of reading sessions as CSV or NDJSON, optionally gzipped.
+    Users export their own sessions, admins export the sessions of all users or of the given user.
+    Usage example:
+    GET api/v1/statistic/export/?type=ndjson&date_from=2024-01-01T00:00:00Z&gzip=true
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        serializer = ReadingSessionExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        user_id = params.get("user") if request.user.is_staff else request.user.pk
+        exporter = ReadingSessionExporter(
+            export_format=params["type"],
+            user_id=user_id,
+            date_from=params.get("date_from"),
+            date_to=params.get("date_to"),
+        )
+
+        filename = f"reading_sessions.{params['type']}"
+        if params["gzip"]:
+            response = StreamingHttpResponse(exporter.gzip_lines(), content_type="application/gzip")
+            filename += ".gz"
+        else:
+            response = StreamingHttpResponse(exporter.lines(), content_type=exporter.content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class LeaderboardView(APIView):
+    """
+    View for the top books or readers by reading time over the last 1, 7 or 30 days.
+    Usage example:
+    GET api/v1/statistic/leaderboard/?board=readers&days=30&limit=10
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        serializer = LeaderboardQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        board, days, limit = (serializer.validated_data[name] for name in ("board", "days", "limit"))
+
+        top = LeaderboardEntry.top(board, days, limit)
+        subject_ids = [subject_id for subject_id, _ in top]
+        if board == LeaderboardEntry.Board.BOOKS:
+            names = dict(Book.objects.filter(id__in=subject_ids).values_list("id", "title"))
+        else:
+            names = dict(User.objects.filter(id__in=subject_ids).values_list("id", "username"))
+
+        entries = [
+            {"rank": rank, "id": subject_id, "name": names.get(subject_id, ""), "total_reading_time": total}
+            for rank, (subject_id, total) in enumerate(top, start=1)
+        ]
+        return Response(
+            {"board": board, "days": days, "results": LeaderboardEntrySerializer(entries, many=True).data}
+        )
+
+
+class ReadingHistogramView(APIView):
+    """
+    View for the reading time of the user or of the book by hour, day or month.
+    :param pk: Book id, if not provided the histogram of the current user is returned.
+    Usage example:
+    GET api/v1/statistic/users/histogram/?granularity=day&date_from=2024-01-01&date_to=2024-01-31
+    GET api/v1/statistic/books/1/histogram/?granularity=month&date_from=2022-01-01
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        serializer = ReadingHistogramQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        if "pk" in kwargs:
+            get_object_or_404(Book, pk=kwargs["pk"])
+            filters = {"book_id": kwargs["pk"]}
+        else:
+            filters = {"user_id": request.user.pk}
+        histogram = ReadingHistogram(params["granularity"], params["date_from"], params["date_to"], **filters)
+
+        return Response(
+            {
+                "granularity": histogram.granularity,
+                "date_from": histogram.date_from,
+                "date_to": histogram.date_to,
+                "results": ReadingHistogramBucketSerializer(histogram.series(), many=True).data,
+            }
+        )
@@ -0,0 +1,105 @@
+import io
+import json
+import random
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+
+from auth_api.models import UserReadingStats
+from library.models import Book, ReadingSession
+from statistic.models import LeaderboardEntry
+from statistic.tasks import UserReadingStatsUpdater
+
+BASELINES_PATH = Path(__file__).with_name("baselines.json")
+
+# Data volumes of the benchmarks, users x books x closed sessions.
+SCALES = {
+    "small": {"users": 20, "books": 200, "sessions": 2_000},
+    "medium": {"users": 200, "books": 2_000, "sessions": 20_000},
+    "large": {"users": 2_000, "books": 20_000, "sessions": 200_000},
+}
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+PASSWORD = "benchmark-password"
+PREFIX = "benchmark_"
+
+
+def pytest_generate_tests(metafunc):
+    if "scale" in metafunc.fixturenames:
+        metafunc.parametrize("scale", metafunc.config.getoption("--benchmark-scale") or ["small"], scope="module")
+
+
+def seed(users, books, sessions):
+    """
+    Creates users, books and closed sessions of the last 60 days, then rebuilds the aggregates from them.
+    The first user is staff, so the admin routes can be benchmarked.
+    :return: Dict with the created users and books.
+    """
+    password = make_password(PASSWORD)
+    created_users = User.objects.bulk_create(
+        User(username=f"{PREFIX}{index}", password=password, is_staff=index == 0) for index in range(users)
+    )
+    UserReadingStats.objects.bulk_create(UserReadingStats(user=user) for user in created_users)
+    created_books = Book.objects.bulk_create(
+        (
+            Book(
+                title=f"{PREFIX}book {index}",
+                author=f"Author {index % 50}",
+                year=1900 + index % 120,
+                short_description=f"A story about the {('dragon', 'river', 'garden')[index % 3]} number {index}",
+            )
+            for index in range(books)
+        ),
+        batch_size=10_000,
+    )
+
+    generator = random.Random(0)
+    now = timezone.now()
+    session_rows = []
+    for _ in range(sessions):
+        start_time = now - timedelta(minutes=generator.randrange(60 * 24 * 60))
+        session_rows.append(
+            ReadingSession(
+                user=generator.choice(created_users),
+                book=generator.choice(created_books),
+                start_time=start_time,
+                end_time=start_time + timedelta(minutes=generator.randrange(5, 120)),
+            )
+        )
+    ReadingSession.objects.bulk_create(session_rows, batch_size=10_000)
+
+    call_command("rebuild_reading_statistics", stdout=io.StringIO())
+    UserReadingStatsUpdater.update_reading_stats()
+    return {"users": created_users, "books": created_books}
+
+
+@pytest.fixture(scope="module")
+def seeded(scale, django_db_setup, django_db_blocker):
+    """
+    Seeds the data volume once per module and scale, the requests of every benchmark are rolled back.
+    The rebuild of the aggregates and the signals of the deleted users use the cache,
+    which is the local memory cache as in all tests.
+    """
+    with django_db_blocker.unblock(), override_settings(CACHES=LOCMEM_CACHES):
+        data = seed(**SCALES[scale])
+    yield data
+    with django_db_blocker.unblock(), override_settings(CACHES=LOCMEM_CACHES):
+        User.objects.filter(username__startswith=PREFIX).delete()
+        Book.objects.filter(title__startswith=PREFIX).delete()
+        LeaderboardEntry.objects.all().delete()
+
+
+@pytest.fixture(scope="session")
+def baselines(request):
+    """
+    Stored query counts and latencies by scale and route, updated with --benchmark-update.
+    """
+    stored = json.loads(BASELINES_PATH.read_text()) if BASELINES_PATH.exists() else {}
+    yield stored
+    if request.config.getoption("--benchmark-update"):
+        BASELINES_PATH.write_text(json.dumps(stored, indent=2, sort_keys=True) + "\n")
@@ -0,0 +1,206 @@
+import statistics
+from datetime import timedelta
+from time import perf_counter
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from library.models import ReadingSession
+
+from .conftest import PASSWORD, PREFIX
+
+pytestmark = pytest.mark.benchmark
+
+
+def start_session(user, book):
+    ReadingSession.objects.start(user.pk, book.pk)
+
+
+def bulk_sessions(iteration, book):
+    start_time = timezone.now() - timedelta(days=400 + iteration)
+    return [
+        {
+            "book": book.pk,
+            "start_time": (start_time + timedelta(hours=hour)).isoformat(),
+            "end_time": (start_time + timedelta(hours=hour, minutes=30)).isoformat(),
+        }
+        for hour in range(10)
+    ]
+
+
+def get_routes(data):
+    """
+    Requests of every route, keyed by the route name.
+    Each value is (method, url or callable(iteration) -> url, payload callable(iteration) or None,
+    callable(iteration) run before the request or None, whether the statistic cache is cleared before the request).
+    """
+    user, book = data["users"][0], data["books"][0]
+    today = timezone.localdate()
+    refresh = str(RefreshToken.for_user(user))
+    return {
+        "sign-up": (
+            "post",
+            reverse("sign-up"),
+            lambda iteration: {
+                "username": f"{PREFIX}new_{iteration}",
+                "email": f"{PREFIX}new_{iteration}@example.com",
+                "password": PASSWORD,
+                "first_name": "First",
+                "last_name": "Last",
+            },
+            None,
+            False,
+        ),
+        "login": ("post", reverse("login"), lambda _: {"username": user.username, "password": PASSWORD}, None, False),
+        "refresh-token": ("post", reverse("refresh-token"), lambda _: {"refresh": refresh}, None, False),
+        "books": ("get", reverse("books"), None, None, False),
+        "book-detail": ("get", reverse("book-detail", args=[book.pk]), None, None, False),
+        "start-reading-session": (
+            "post",
+            lambda iteration: reverse("start-reading-session", args=[data["books"][iteration % 2].pk]),
+            None,
+            None,
+            False,
+        ),
+        "bulk-reading-sessions": (
+            "post",
+            reverse("bulk-reading-sessions"),
+            lambda iteration: {"sessions": bulk_sessions(iteration, book)},
+            None,
+            False,
+        ),
+        "reading-session-heartbeat": ("post", reverse("reading-session-heartbeat"), None, None, False),
+        "end-all-reading-sessions": (
+            "patch",
+            reverse("end-all-reading-sessions"),
+            None,
+            lambda _: start_session(user, book),
+            False,
+        ),
+        "end-reading-session": (
+            "patch",
+            reverse("end-reading-session", args=[book.pk]),
+            None,
+            lambda _: start_session(user, book),
+            False,
+        ),
+        "users-statistic": ("get", reverse("users-statistic"), None, None, True),
+        "users-histogram": (
+            "get",
+            f"{reverse('users-histogram')}?granularity=day&date_from={today - timedelta(days=59)}",
+            None,
+            None,
+            False,
+        ),
+        "books-statistic": ("get", reverse("books-statistic"), None, None, True),
+        "books-retrieve-statistic": ("get", reverse("books-retrieve-statistic", args=[book.pk]), None, None, True),
+        "books-histogram": (
+            "get",
+            f"{reverse('books-histogram', args=[book.pk])}?granularity=hour&date_from={today - timedelta(days=6)}",
+            None,
+            None,
+            False,
+        ),
+        "statistic-cache": ("get", reverse("statistic-cache"), None, None, False),
+        "statistic-export": ("get", f"{reverse('statistic-export')}?user={user.pk}", None, None, False),
+        "statistic-leaderboard": (
+            "get",
+            f"{reverse('statistic-leaderboard')}?board=readers&days=30",
+            None,
+            None,
+            False,
+        ),
+    }
+
+
+ROUTE_NAMES = [
+    "sign-up",
+    "login",
+    "refresh-token",
+    "books",
+    "book-detail",
+    "start-reading-session",
+    "bulk-reading-sessions",
+    "reading-session-heartbeat",
+    "end-all-reading-sessions",
+    "end-reading-session",
+    "users-statistic",
+    "users-histogram",
+    "books-statistic",
+    "books-retrieve-statistic",
+    "books-histogram",
+    "statistic-cache",
+    "statistic-export",
+    "statistic-leaderboard",
+]
+
+
+def test_every_route_is_benchmarked():
+    names = set()
+    for pattern in get_resolver().url_patterns:
+        if isinstance(pattern, URLResolver) and pattern.pattern.describe().startswith("'api/"):
+            names.update(route.name for route in pattern.url_patterns)
+
+    assert names == set(ROUTE_NAMES)
+
+
+def measure(client, route, iterations):
+    """
+    Sends one warm-up and then the measured requests of the route.
+    :return: Tuple (maximum number of queries of a request, p50 latency in ms, p95 latency in ms).
+    """
+    method, url, payload, prepare, cold = route
+    queries, latencies = [], []
+    for iteration in range(iterations + 1):
+        if prepare:
+            prepare(iteration)
+        if cold:
+            cache.clear()
+        request = getattr(client, method)
+        request_url = url(iteration) if callable(url) else url
+        with CaptureQueriesContext(connection) as context:
+            started = perf_counter()
+            response = request(request_url, payload(iteration) if payload else None, format="json")
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = (perf_counter() - started) * 1000
+
+        assert response.status_code < 400, response.content
+        if iteration:
+            latencies.append(elapsed)
+            queries.append(sum("SAVEPOINT" not in query["sql"] for query in context.captured_queries))
+
+    quantiles = statistics.quantiles(latencies, n=20)
+    return max(queries), round(quantiles[9], 3), round(quantiles[18], 3)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("name", ROUTE_NAMES)
+def test_route_benchmark(name, scale, seeded, baselines, request):
+    user = seeded["users"][0]
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+    config = request.config
+
+    queries, p50, p95 = measure(client, get_routes(seeded)[name], config.getoption("--benchmark-iterations"))
+
+    if config.getoption("--benchmark-update"):
+        print(f"{scale} {name}: {queries} queries, p50 {p50} ms, p95 {p95} ms")
+        baselines.setdefault(scale, {})[name] = {"queries": queries, "p50_ms": p50, "p95_ms": p95}
+        return
+
+    baseline = baselines.get(scale, {}).get(name)
+    if baseline is None:
+        pytest.fail(f"No baseline for {name} at scale {scale}, run with --benchmark-update to store it.")
+    # The latency depends on the machine and its load, it is reported next to the baseline but not asserted.
+    print(
+        f"{scale} {name}: {queries} queries, p50 {p50} ms, p95 {p95} ms "
+        f"(baseline p50 {baseline['p50_ms']} ms, p95 {baseline['p95_ms']} ms)"
+    )
+    assert queries <= baseline["queries"], f"{name}: {queries} queries, baseline {baseline['queries']}"
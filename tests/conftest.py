@@ -4,25 +4,52 @@ import django
 import pytest
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.urls import reverse
 from django.utils import timezone
 from faker import Faker
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import AccessToken
 
+from auth_api.cache import UserCache
 from auth_api.models import UserReadingStats
 from library.models import Book, ReadingSession
 
 
-def pytest_configure():
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmark", "API benchmarks, see tests/benchmarks")
+    group.addoption("--benchmark", action="store_true", help="Run the API benchmarks.")
+    group.addoption("--benchmark-update", action="store_true", help="Store the measured results as the baselines.")
+    group.addoption("--benchmark-scale", action="append", help="Data volume to seed, small by default, repeatable.")
+    group.addoption("--benchmark-iterations", type=int, default=20, help="Measured requests per route.")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: API benchmark, runs only with --benchmark")
     if not settings.configured:
         settings.configure(DJANGO_SETTINGS_MODULE="rtas_backend.settings")
     django.setup()
 
 
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="Benchmarks run only with --benchmark.")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
 fake = Faker()
 
 
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    cache.clear()
+    UserCache.clear_local()
+
+
 @pytest.fixture
 def new_user_payload():
     return {
@@ -1,5 +1,8 @@
+from datetime import timedelta
+
 import pytest
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework import status
 
@@ -66,3 +69,38 @@ def test_signup_password_hashing(client, new_user_payload):
 
     user = User.objects.get(username=new_user_payload["username"])
     assert user.check_password(new_user_payload["password"])
+
+
+@pytest.mark.django_db
+def test_authenticated_user_is_cached(auth_client, create_user, django_assert_num_queries):
+    url = reverse("reading-session-heartbeat")
+    with django_assert_num_queries(1):
+        auth_client.post(url)
+
+    with django_assert_num_queries(0):
+        response = auth_client.post(url)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    create_user.is_active = False
+    create_user.save()
+    response = auth_client.post(url)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_cached_user_reading_stats_are_preloaded(auth_client, create_user, django_assert_num_queries):
+    url = reverse("users-statistic")
+    auth_client.get(url)
+    cache.clear()
+
+    # Only the reading time of the books, the user and its reading stats come from the local cache.
+    with django_assert_num_queries(1):
+        response = auth_client.get(url)
+    assert response.data["username"] == create_user.username
+
+    UserReadingStats.objects.filter(user=create_user).update(statistic_time_7_days=timedelta(hours=1))
+    create_user.reading_stats.refresh_from_db()
+    create_user.reading_stats.save()
+    cache.clear()
+    response = auth_client.get(url)
+    assert response.data["statistics"]["statistic_time_7_days"] == "01:00:00"
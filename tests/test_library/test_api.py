@@ -1,15 +1,26 @@
+import threading
+from datetime import timedelta
+
 import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.fields import DurationField
+from rest_framework.test import APIClient
 
-from library.models import ReadingSession
+from library.heartbeats import HeartbeatBuffer
+from library.models import Book, ReadingSession
+from statistic.models import ReadingStatistics, ReadingTimeBucket
 
 
 @pytest.mark.django_db
 def test_book_list_access_for_authenticated_user(auth_client):
     url = reverse("books")
     response = auth_client.get(url)
-    data = response.data
+    data = response.data["results"]
 
     assert response.status_code == status.HTTP_200_OK
     assert isinstance(data, list)
@@ -131,3 +142,260 @@ def test_end_reading_session_success(
     reading_session = ReadingSession.objects.get(book=book, user=user)
     assert reading_session.status is False
     assert reading_session.end_time is not None
+
+
+@pytest.mark.django_db
+def test_start_reading_session_switches_book(auth_client, create_user, create_book, start_reading_session):
+    other_book = Book.objects.create(title="Other", author="Author", year=2000, short_description="...")
+    start_reading_session(create_book)
+    response = start_reading_session(other_book)
+
+    assert response.status_code == status.HTTP_201_CREATED
+    active_session = ReadingSession.objects.get(user=create_user, status=True)
+    assert active_session.book == other_book
+
+
+@pytest.mark.django_db
+def test_start_reading_session_nonexistent_book(auth_client, create_reading_session):
+    url = reverse("start-reading-session", kwargs={"book_id": 0})
+    response = auth_client.post(url)
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert ReadingSession.objects.filter(pk=create_reading_session.pk, status=True).exists()
+
+
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="Needs concurrent writers, SQLite locks the table.")
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_start_and_end_keep_one_active_session(create_user, create_book):
+    other_book = Book.objects.create(title="Other", author="Author", year=2000, short_description="...")
+    books = [create_book, other_book]
+    errors = []
+
+    def hammer(worker):
+        client = APIClient()
+        client.force_authenticate(create_user)
+        try:
+            for iteration in range(10):
+                book = books[(worker + iteration) % len(books)]
+                response = client.post(reverse("start-reading-session", kwargs={"book_id": book.id}))
+                if response.status_code != status.HTTP_201_CREATED:
+                    errors.append(response.status_code)
+                client.patch(reverse("end-reading-session", kwargs={"book_id": book.id}))
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=hammer, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert ReadingSession.objects.filter(user=create_user, status=True).count() <= 1
+    assert ReadingSession.objects.filter(user=create_user).count() == 80
+
+
+@pytest.mark.django_db
+def test_end_reading_session_returns_duration(auth_client, create_book, create_user, start_reading_session):
+    start_reading_session(create_book)
+
+    end_session_url = reverse("end-reading-session", kwargs={"book_id": create_book.id})
+    with CaptureQueriesContext(connection) as context:
+        response = auth_client.patch(end_session_url)
+
+    assert response.status_code == status.HTTP_200_OK
+    reading_session = ReadingSession.objects.get(book=create_book, user=create_user)
+    assert response.data["session"]["book"] == create_book.id
+    assert response.data["session"]["duration"] == DurationField().to_representation(reading_session.duration)
+
+    session_statements = [query for query in context.captured_queries if "library_readingsession" in query["sql"]]
+    assert len(session_statements) == 1
+
+
+@pytest.mark.django_db
+def test_end_all_reading_sessions(auth_client, create_reading_session):
+    url = reverse("end-all-reading-sessions")
+
+    response = auth_client.patch(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["closed"] == 1
+
+    response = auth_client.patch(url)
+    assert response.data["closed"] == 0
+    assert not ReadingSession.objects.filter(status=True).exists()
+
+
+@pytest.mark.django_db
+def test_book_list_cursor_pagination(auth_client):
+    books = Book.objects.bulk_create(
+        Book(title=f"Book {index}", author="Author", year=2000, short_description="...") for index in range(5)
+    )
+
+    response = auth_client.get(reverse("books"), {"page_size": 2})
+    assert [book["id"] for book in response.data["results"]] == [book.id for book in books[:2]]
+    assert response.data["previous"] is None
+
+    ids = [book["id"] for book in response.data["results"]]
+    while response.data["next"]:
+        response = auth_client.get(response.data["next"])
+        ids.extend(book["id"] for book in response.data["results"])
+    assert ids == sorted(book.id for book in books)
+
+
+@pytest.mark.django_db
+def test_book_retrieve_last_read_date_constant_queries(
+    auth_client, create_book, create_user, django_assert_num_queries
+):
+    url = reverse("book-detail", args=[create_book.id])
+    with django_assert_num_queries(2):
+        auth_client.get(url)
+
+    now = timezone.now()
+    end_times = [now - timedelta(hours=hours) for hours in (3, 1, 2)]
+    for end_time in end_times:
+        ReadingSession.objects.create(user=create_user, book=create_book, end_time=end_time)
+    ReadingSession.objects.create(user=create_user, book=create_book, status=True)
+
+    # The authenticated user is cached by now, only the book is queried.
+    with django_assert_num_queries(1):
+        response = auth_client.get(url)
+    assert response.data["last_read_date"] == max(end_times)
+
+
+@pytest.mark.django_db
+def test_book_retrieve_last_read_date_of_the_user(auth_client, create_book, create_user):
+    now = timezone.now()
+    ReadingSession.objects.create(user=create_user, book=create_book, end_time=now - timedelta(hours=2))
+    other_user = User.objects.create_user(username="other", password="password")
+    ReadingSession.objects.create(user=other_user, book=create_book, end_time=now)
+
+    response = auth_client.get(reverse("book-detail", args=[create_book.id]))
+
+    assert response.data["last_read_date"] == now - timedelta(hours=2)
+
+
+@pytest.mark.django_db
+def test_book_list_fast_path_renders_same_bytes(auth_client, create_book, settings):
+    Book.objects.create(
+        title="Война и мир \"quoted\"",
+        author="Лев Толстой",
+        year=1869,
+        short_description="tab\t\\ line\u2028separator",
+    )
+    url = reverse("books")
+
+    response = auth_client.get(url, {"page_size": 1})
+    settings.FAST_LIST_SERIALIZATION = True
+    fast_response = auth_client.get(url, {"page_size": 1})
+
+    assert fast_response.status_code == status.HTTP_200_OK
+    assert fast_response.content == response.content
+    assert auth_client.get(response.data["next"]).content == auth_client.get(fast_response.json()["next"]).content
+
+
+@pytest.mark.django_db
+def test_bulk_reading_sessions(auth_client, create_user, create_book):
+    now = timezone.now().replace(microsecond=0)
+    ReadingSession.objects.create(
+        user=create_user, book=create_book, start_time=now - timedelta(hours=10), end_time=now - timedelta(hours=9)
+    )
+    ReadingSession.objects.create(user=create_user, book=create_book, start_time=now - timedelta(hours=1), status=True)
+
+    def session(start_hours, end_hours, book=create_book.id):
+        return {
+            "book": book,
+            "start_time": (now - timedelta(hours=start_hours)).isoformat(),
+            "end_time": (now - timedelta(hours=end_hours)).isoformat(),
+        }
+
+    payload = [
+        session(5, 4),
+        session(12, 11),
+        session(9.5, 8),  # overlaps the stored session
+        session(4.5, 3),  # overlaps the first session of the batch
+        session(2, 0.5),  # overlaps the active session
+        session(3, 3),
+        session(8, 7, book=0),
+        {"book": create_book.id},
+        session(9, 8),  # touches the stored session
+    ]
+    response = auth_client.post(reverse("bulk-reading-sessions"), {"sessions": payload}, format="json")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [result["status"] for result in response.data["results"]] == [
+        "created", "created", "rejected", "rejected", "rejected", "rejected", "rejected", "rejected", "created",
+    ]
+    assert response.data["created"] == 3
+    assert response.data["rejected"] == 6
+    assert "book" in response.data["results"][6]["errors"]
+    assert "start_time" in response.data["results"][7]["errors"]
+
+    created_ids = [result["id"] for result in response.data["results"] if result["status"] == "created"]
+    created_sessions = ReadingSession.objects.filter(id__in=created_ids)
+    assert {session.end_time - session.start_time for session in created_sessions} == {timedelta(hours=1)}
+    assert ReadingStatistics.objects.get(user=create_user, book=create_book).total_reading_time == timedelta(hours=4)
+
+
+@pytest.mark.django_db
+def test_bulk_reading_sessions_constant_queries(auth_client, create_user, create_book):
+    now = timezone.now()
+    url = reverse("bulk-reading-sessions")
+
+    def post(days):
+        payload = [
+            {
+                "book": create_book.id,
+                "start_time": (now - timedelta(days=day)).isoformat(),
+                "end_time": (now - timedelta(days=day, hours=-1)).isoformat(),
+            }
+            for day in days
+        ]
+        with CaptureQueriesContext(connection) as context:
+            response = auth_client.post(url, {"sessions": payload}, format="json")
+        assert response.data["created"] == len(payload)
+        return len(context.captured_queries)
+
+    assert post(range(1, 11)) == post(range(11, 211))
+    assert ReadingStatistics.objects.get(user=create_user, book=create_book).total_reading_time == timedelta(hours=210)
+    assert ReadingTimeBucket.objects.filter(user=create_user).count() >= 210
+
+
+@pytest.mark.django_db
+def test_bulk_reading_sessions_limit(auth_client, create_book, settings):
+    settings.BULK_SESSIONS_MAX_ITEMS = 1
+    url = reverse("bulk-reading-sessions")
+
+    assert auth_client.post(url, [{}, {}], format="json").status_code == status.HTTP_400_BAD_REQUEST
+    assert auth_client.post(url, [], format="json").status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_book_list_search_and_filters(auth_client, create_book):
+    other_book = Book.objects.create(title="Dune", author="Frank Herbert", year=1965, short_description="Desert planet")
+    url = reverse("books")
+
+    def found(**params):
+        return [book["id"] for book in auth_client.get(url, params).data["results"]]
+
+    assert found(q="potter") == [create_book.id]
+    assert found(q="desert") == [other_book.id]
+    assert found(author="Frank Herbert") == [other_book.id]
+    assert found(year=1997) == [create_book.id]
+    assert found(q="potter", year=1965) == []
+    assert auth_client.get(url, {"year": "unknown"}).status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_reading_session_heartbeat(auth_client, create_user, create_reading_session, django_assert_num_queries):
+    url = reverse("reading-session-heartbeat")
+    auth_client.post(url)
+
+    with django_assert_num_queries(0):
+        response = auth_client.post(url)
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    HeartbeatBuffer.flush()
+    create_reading_session.refresh_from_db()
+    assert create_reading_session.last_seen is not None
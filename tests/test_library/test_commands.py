@@ -0,0 +1,116 @@
+import json
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.utils import timezone
+
+from library.heartbeats import HeartbeatBuffer
+from library.models import Book, ReadingSession
+from library.partitions import ReadingSessionPartitions
+from statistic.models import BookReadingTotal
+
+
+@pytest.mark.django_db
+def test_import_books_jsonl_is_idempotent(tmp_path):
+    path = tmp_path / "catalog.jsonl"
+    rows = [
+        {"title": "Dune", "author": "Frank Herbert", "year": 1965, "short_description": "Desert planet."},
+        {"title": "Dune", "author": "Frank Herbert", "year": 1965, "short_description": "Arrakis."},
+        {"title": "Emma", "author": "Jane Austen", "year": 1815, "short_description": "Matchmaking."},
+        {"title": "T" * 51, "author": "Author", "year": 2000, "short_description": "Too long."},
+        {"title": "No year", "author": "Author", "short_description": "..."},
+    ]
+    path.write_text("\n".join(json.dumps(row) for row in rows) + "\nnot json\n")
+
+    call_command("import_books", str(path), "--batch-size", "2")
+    call_command("import_books", str(path), "--batch-size", "2")
+
+    assert Book.objects.count() == 2
+    assert Book.objects.get(title="Dune").short_description == "Arrakis."
+
+
+@pytest.mark.django_db
+def test_import_books_csv_updates_descriptions(tmp_path, create_book, capsys):
+    path = tmp_path / "catalog.csv"
+    path.write_text(
+        "title,author,year,short_description,full_description\n"
+        f"\"{create_book.title}\",{create_book.author},{create_book.year},Updated,\n"
+    )
+
+    call_command("import_books", str(path))
+
+    create_book.refresh_from_db()
+    assert create_book.short_description == "Updated"
+    assert create_book.full_description is None
+    assert "Imported 1 books" in capsys.readouterr().out
+
+
+@pytest.mark.skipif(connection.vendor == "postgresql", reason="Converts the table on PostgreSQL.")
+@pytest.mark.django_db
+def test_partition_reading_sessions_requires_postgresql():
+    with pytest.raises(CommandError, match="PostgreSQL"):
+        call_command("partition_reading_sessions", "--convert")
+
+
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="Partitioning is PostgreSQL only.")
+@pytest.mark.django_db
+def test_partitioned_reading_sessions(create_user, create_book, capsys):
+    now = timezone.now()
+    old_session = ReadingSession.objects.create(
+        user=create_user, book=create_book, start_time=now - timedelta(days=400), end_time=now - timedelta(days=399)
+    )
+    ReadingSession.objects.create(
+        user=create_user, book=create_book, start_time=now - timedelta(minutes=5), status=True
+    )
+
+    call_command("partition_reading_sessions", "--convert", "--months-ahead", "2")
+
+    assert "copied 2 sessions" in capsys.readouterr().out
+    assert ReadingSession.objects.is_partitioned() is True
+    partitions = [name for name, _ in ReadingSessionPartitions.get_partitions()]
+    old_partition = ReadingSessionPartitions.partition_name(old_session.start_time)
+    assert partitions[0] == old_partition
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT id FROM {old_partition}")
+        assert cursor.fetchall() == [(old_session.id,)]
+
+    started = ReadingSession.objects.start(create_user.id, create_book.id)
+    assert started.id > old_session.id
+    assert ReadingSession.objects.filter(user=create_user, status=True).get() == started
+
+    seen_at = timezone.now()
+    HeartbeatBuffer.record(create_user.id, seen_at)
+    assert HeartbeatBuffer.flush() == 1
+    started.refresh_from_db()
+    assert started.last_seen == seen_at
+
+    assert [session.id for session in ReadingSession.objects.close_active(create_user.id)] == [started.id]
+
+    other_user = User.objects.create_user(username="stale", password="password")
+    ReadingSession.objects.create(user=other_user, book=create_book, start_time=now - timedelta(hours=3), status=True)
+    assert ReadingSession.objects.close_stale(timedelta(hours=1), timedelta(hours=2), batch_size=10) == 1
+
+    completed = ReadingSession.objects.record_completed(
+        other_user.id, [{"book_id": create_book.id, "start_time": now - timedelta(days=40), "end_time": now}]
+    )
+    assert completed[0].id is not None
+
+    # Sessions before the first partition and of detached months are stored in the DEFAULT partition.
+    assert ReadingSessionPartitions.detach_partitions(ReadingSessionPartitions.month_start(now - timedelta(days=300)))
+    old_sessions = ReadingSession.objects.record_completed(
+        other_user.id,
+        [
+            {"book_id": create_book.id, "start_time": now - timedelta(days=600), "end_time": now - timedelta(days=599)},
+            {"book_id": create_book.id, "start_time": now - timedelta(days=401), "end_time": now - timedelta(days=400)},
+        ],
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT id FROM {ReadingSessionPartitions.default_partition} ORDER BY id")
+        assert cursor.fetchall() == [(session.id,) for session in old_sessions]
+    assert not ReadingSession.objects.filter(status=True).exists()
+    assert ReadingSession.objects.count() == 6
+    # The view of the per-book totals is recreated on the partitioned table.
+    assert BookReadingTotal.objects.get(book=create_book).total_reading_time == timedelta(days=1)
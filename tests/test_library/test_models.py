@@ -1,6 +1,11 @@
+from datetime import datetime, timezone as dt_timezone
+
 import pytest
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 
-from library.models import Book, ReadingSession
+from library.models import Book, ReadingSession, ReadingSessionManager
+from library.partitions import ReadingSessionPartitions
 
 
 @pytest.mark.django_db
@@ -32,3 +37,75 @@ def test_reading_session_str(create_reading_session):
     session = create_reading_session
     expected_str = f"{session.user.username} - {session.book.title}"
     assert str(session) == expected_str
+
+
+@pytest.mark.django_db
+def test_only_one_active_reading_session_per_user(create_reading_session):
+    session = create_reading_session
+
+    ReadingSession.objects.create(user=session.user, book=session.book, status=False)
+    with pytest.raises(IntegrityError):
+        ReadingSession.objects.create(user=session.user, book=session.book, status=True)
+
+
+@pytest.mark.django_db
+def test_start_switches_active_session_in_two_statements(create_reading_session, create_book):
+    previous = create_reading_session
+    other_book = Book.objects.create(title="Other", author="Author", year=2000, short_description="...")
+
+    with CaptureQueriesContext(connection) as context:
+        session = ReadingSession.objects.start(previous.user_id, other_book.id)
+
+    statements = [query["sql"] for query in context.captured_queries if "SAVEPOINT" not in query["sql"]]
+    assert [sql.split()[0] for sql in statements[:2]] == ["UPDATE", "INSERT"]
+
+    previous.refresh_from_db()
+    assert previous.status is False
+    assert previous.end_time == session.start_time
+    assert session.book_id == other_book.id
+    assert ReadingSession.objects.filter(user=previous.user, status=True).get() == session
+
+
+@pytest.mark.django_db
+def test_start_nonexistent_book_keeps_active_session(create_reading_session):
+    assert ReadingSession.objects.start(create_reading_session.user_id, 0) is None
+
+    create_reading_session.refresh_from_db()
+    assert create_reading_session.status is True
+
+
+@pytest.mark.django_db
+def test_close_active_returns_closed_sessions(create_reading_session):
+    closed_sessions = ReadingSession.objects.close_active(create_reading_session.user_id)
+
+    assert [session.pk for session in closed_sessions] == [create_reading_session.pk]
+    assert closed_sessions[0].end_time is not None
+    assert ReadingSession.objects.close_active(create_reading_session.user_id) == []
+
+
+@pytest.mark.django_db
+def test_start_locks_user_when_partitioned(create_reading_session, create_book, monkeypatch):
+    monkeypatch.setattr(ReadingSessionManager, "is_partitioned", lambda manager: True)
+    previous = create_reading_session
+
+    with CaptureQueriesContext(connection) as context:
+        session = ReadingSession.objects.start(previous.user_id, create_book.id)
+
+    statements = [query["sql"] for query in context.captured_queries if "SAVEPOINT" not in query["sql"]]
+    assert [sql.split()[0] for sql in statements[:3]] == ["SELECT", "UPDATE", "INSERT"]
+    assert ReadingSession.objects.filter(user=previous.user, status=True).get() == session
+
+
+def test_partition_months():
+    month = ReadingSessionPartitions.month_start(datetime(2024, 12, 31, 23, 59, tzinfo=dt_timezone.utc))
+
+    assert month == datetime(2024, 12, 1, tzinfo=dt_timezone.utc)
+    assert ReadingSessionPartitions.add_months(month, 1) == datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+    assert ReadingSessionPartitions.add_months(month, -12) == datetime(2023, 12, 1, tzinfo=dt_timezone.utc)
+    assert ReadingSessionPartitions.partition_name(month) == "library_readingsession_y2024m12"
+
+
+@pytest.mark.django_db
+def test_partitions_maintenance_is_noop_when_not_partitioned():
+    assert ReadingSession.objects.is_partitioned() is False
+    assert ReadingSessionPartitions.maintain(3, 12) == (0, [])
@@ -1,4 +1,5 @@
 import pytest
+from django.test import RequestFactory
 
 from library.serializers import BookListSerializer, BookRetrieveSerializer, StartReadingSessionSerializer
 
@@ -23,7 +24,9 @@ def test_book_retrieve_serializer_with_reading_session(
 ):
     reading_session = create_reading_session
     book = create_book
-    serializer = BookRetrieveSerializer(book)
+    request = RequestFactory().get("/")
+    request.user = create_user
+    serializer = BookRetrieveSerializer(book, context={"request": request})
     data = serializer.data
 
     assert set(data.keys()) == {
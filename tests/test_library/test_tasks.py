@@ -0,0 +1,157 @@
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+
+from library.heartbeats import HeartbeatBuffer
+from library.models import ReadingSession
+from library.tasks import close_stale_reading_sessions, flush_heartbeats
+from statistic.models import BookReadingStatistics
+
+
+@pytest.mark.django_db
+def test_close_stale_reading_sessions(create_book, settings):
+    settings.STALE_SESSION_IDLE_LIMIT = timedelta(hours=12)
+    settings.STALE_SESSION_MAX_DURATION = timedelta(hours=2)
+    settings.STALE_SESSION_BATCH_SIZE = 2
+    now = timezone.now()
+    stale_sessions = [
+        ReadingSession.objects.create(
+            user=User.objects.create(username=f"stale_{index}"),
+            book=create_book,
+            start_time=now - timedelta(days=index + 1),
+            status=True,
+        )
+        for index in range(5)
+    ]
+    fresh_session = ReadingSession.objects.create(
+        user=User.objects.create(username="fresh"), book=create_book, start_time=now - timedelta(hours=1), status=True
+    )
+
+    assert close_stale_reading_sessions() == 5
+
+    for session in stale_sessions:
+        session.refresh_from_db()
+        assert session.status is False
+        assert session.duration == timedelta(hours=2)
+    assert ReadingSession.objects.get(pk=fresh_session.pk).status is True
+    assert BookReadingStatistics.objects.get(book=create_book).total_reading_time == timedelta(hours=10)
+    assert close_stale_reading_sessions() == 0
+
+
+@pytest.mark.django_db
+def test_close_stale_reading_session_at_last_heartbeat(create_user, create_book, settings):
+    settings.STALE_SESSION_IDLE_LIMIT = timedelta(hours=12)
+    now = timezone.now()
+    session = ReadingSession.objects.create(
+        user=create_user,
+        book=create_book,
+        start_time=now - timedelta(days=2),
+        last_seen=now - timedelta(days=2) + timedelta(minutes=40),
+        status=True,
+    )
+    recently_seen = ReadingSession.objects.create(
+        user=User.objects.create(username="reader"),
+        book=create_book,
+        start_time=now - timedelta(days=2),
+        last_seen=now - timedelta(hours=1),
+        status=True,
+    )
+
+    assert close_stale_reading_sessions() == 1
+
+    session.refresh_from_db()
+    assert session.end_time == session.last_seen
+    assert ReadingSession.objects.get(pk=recently_seen.pk).status is True
+
+
+@pytest.mark.django_db
+def test_flush_heartbeats(create_user, create_book, django_assert_num_queries, settings):
+    settings.HEARTBEAT_FLUSH_BATCH_SIZE = 2
+    users = [create_user, *(User.objects.create(username=f"reader_{index}") for index in range(3))]
+    now = timezone.now()
+    sessions = [
+        ReadingSession.objects.create(user=user, book=create_book, start_time=now - timedelta(hours=1), status=True)
+        for user in users
+    ]
+    for seconds in range(3):
+        for user in users:
+            HeartbeatBuffer.record(user.pk, now + timedelta(seconds=seconds))
+    HeartbeatBuffer.record(users[0].pk, now - timedelta(hours=2))
+
+    with django_assert_num_queries(2):
+        assert flush_heartbeats() == 4
+
+    for session in sessions[1:]:
+        session.refresh_from_db()
+        assert session.last_seen == now + timedelta(seconds=2)
+    sessions[0].refresh_from_db()
+    assert sessions[0].last_seen is None
+    assert flush_heartbeats() == 0
+
+
+@pytest.mark.django_db
+def test_flush_heartbeats_logs_user_again_after_lost_entry(create_user, create_book):
+    now = timezone.now()
+    session = ReadingSession.objects.create(
+        user=create_user, book=create_book, start_time=now - timedelta(hours=1), status=True
+    )
+    HeartbeatBuffer.record(create_user.pk, now)
+    cache.delete(HeartbeatBuffer.dirty_key(1))
+    for seconds in range(1, 6):
+        HeartbeatBuffer.record(create_user.pk, now + timedelta(seconds=seconds))
+    assert flush_heartbeats() == 0
+
+    # The pending flag expires HEARTBEAT_TIMEOUT after the lost entry.
+    cache.delete(HeartbeatBuffer.pending_key(create_user.pk))
+    later = now + timedelta(seconds=301)
+    HeartbeatBuffer.record(create_user.pk, later)
+
+    assert flush_heartbeats() == 1
+    session.refresh_from_db()
+    assert session.last_seen == later
+
+
+@pytest.mark.django_db
+def test_flush_heartbeats_keeps_heartbeat_during_flush(create_user, create_book, mocker):
+    now = timezone.now()
+    session = ReadingSession.objects.create(
+        user=create_user, book=create_book, start_time=now - timedelta(hours=1), status=True
+    )
+    HeartbeatBuffer.record(create_user.pk, now)
+    write = HeartbeatBuffer.write
+
+    def write_during_heartbeat(last_seen):
+        HeartbeatBuffer.record(create_user.pk, now + timedelta(seconds=10))
+        write(last_seen)
+
+    mocker.patch.object(HeartbeatBuffer, "write", side_effect=write_during_heartbeat)
+    assert flush_heartbeats() == 1
+    mocker.stopall()
+
+    assert flush_heartbeats() == 1
+    session.refresh_from_db()
+    assert session.last_seen == now + timedelta(seconds=10)
+
+
+@pytest.mark.django_db
+def test_flush_heartbeats_after_evicted_sequence(create_user, create_book):
+    now = timezone.now()
+    session = ReadingSession.objects.create(
+        user=create_user, book=create_book, start_time=now - timedelta(hours=1), status=True
+    )
+    for seconds in range(3):
+        cache.delete(HeartbeatBuffer.pending_key(create_user.pk))
+        HeartbeatBuffer.record(create_user.pk, now + timedelta(seconds=seconds))
+    assert flush_heartbeats() == 1
+
+    cache.delete(HeartbeatBuffer.sequence_key)
+    HeartbeatBuffer.record(create_user.pk, now + timedelta(seconds=10))
+    # A flush that ran during the eviction stored the position of the previous sequence.
+    cache.set(HeartbeatBuffer.flushed_key, 3, timeout=None)
+
+    assert flush_heartbeats() == 1
+    session.refresh_from_db()
+    assert session.last_seen == now + timedelta(seconds=10)
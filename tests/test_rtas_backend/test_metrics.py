@@ -0,0 +1,80 @@
+from statistics import median
+from time import perf_counter
+
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+from prometheus_client import REGISTRY
+
+from rtas_backend.metrics import MetricsMiddleware
+from statistic.tasks import rebuild_leaderboards
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.django_db
+def test_request_metrics(auth_client, create_book, settings):
+    settings.METRICS_ENABLED = True
+    requests_before = sample("http_request_duration_seconds_count", view="books", method="GET", status="200")
+    queries_before = sample("http_request_db_queries_sum", view="books")
+    serializers_before = sample("serializer_duration_seconds_count", serializer="BookListSerializer")
+
+    auth_client.get(reverse("books"))
+
+    assert sample("http_request_duration_seconds_count", view="books", method="GET", status="200") == (
+        requests_before + 1
+    )
+    assert sample("http_request_db_queries_sum", view="books") > queries_before
+    assert sample("serializer_duration_seconds_count", serializer="BookListSerializer") == serializers_before + 1
+
+    response = auth_client.get(reverse("metrics"))
+    assert response.status_code == 200
+    assert b'http_request_db_duration_seconds_count{view="books"}' in response.content
+
+
+def test_metrics_disabled(client, settings):
+    settings.METRICS_ENABLED = False
+
+    assert client.get(reverse("metrics")).status_code == 404
+
+
+def test_metrics_allowed_ips_only(client, settings):
+    settings.METRICS_ENABLED = True
+    settings.METRICS_ALLOWED_IPS = ["127.0.0.1", "10.0.0.0/24"]
+
+    assert client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.7").status_code == 200
+    assert client.get(reverse("metrics"), REMOTE_ADDR="10.0.1.7").status_code == 403
+
+
+@pytest.mark.benchmark
+def test_middleware_overhead(settings):
+    settings.METRICS_ENABLED = True
+    response = HttpResponse()
+    middleware = MetricsMiddleware(lambda request: response)
+    request = RequestFactory().get(reverse("books"))
+    request.resolver_match = resolve(request.path)
+
+    timings = []
+    for _ in range(2000):
+        started = perf_counter()
+        middleware(request)
+        timings.append(perf_counter() - started)
+
+    assert median(timings) < 50e-6
+
+
+@pytest.mark.django_db
+def test_task_metrics(settings):
+    settings.METRICS_ENABLED = True
+    runs_before = sample(
+        "celery_task_duration_seconds_count", task="statistic.tasks.rebuild_leaderboards", state="SUCCESS"
+    )
+
+    rebuild_leaderboards.apply()
+
+    assert sample(
+        "celery_task_duration_seconds_count", task="statistic.tasks.rebuild_leaderboards", state="SUCCESS"
+    ) == runs_before + 1
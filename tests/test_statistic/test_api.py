@@ -1,6 +1,25 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, time, timedelta
+
 import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.views import APIView
+
+from library.models import Book, ReadingSession
+
+from statistic.cache import StatisticCache
+from statistic.models import BookReadingStatistics, ReadingSessionSummary, ReadingStatistics, ReadingTimeBucket
+from statistic.tasks import refresh_book_reading_totals
+from statistic.views import CachedResponseMixin
 
 
 @pytest.mark.django_db
@@ -9,7 +28,7 @@ def test_book_reading_time_list_view_authenticated_user(
 ):
     url = reverse("books-statistic")
     response = auth_client.get(url)
-    data = response.data
+    data = response.data["results"]
 
     assert response.status_code == status.HTTP_200_OK
     assert isinstance(data, list)
@@ -93,3 +112,334 @@ def test_user_book_reading_time_list_view_unauthenticated_user(client):
     response = client.get(url)
 
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_end_reading_session_increments_counters(
+    auth_client, create_user, create_book, start_reading_session
+):
+    start_reading_session(create_book)
+    auth_client.patch(reverse("end-reading-session", kwargs={"book_id": create_book.id}))
+    start_reading_session(create_book)
+    auth_client.patch(reverse("end-reading-session", kwargs={"book_id": create_book.id}))
+
+    user_stat = ReadingStatistics.objects.get(user=create_user, book=create_book)
+    book_stat = BookReadingStatistics.objects.get(book=create_book)
+    assert user_stat.total_reading_time > timedelta(0)
+    assert book_stat.total_reading_time == user_stat.total_reading_time
+
+
+@pytest.mark.django_db
+def test_statistic_views_read_counters(auth_client, create_user, create_book):
+    ReadingStatistics.objects.create(user=create_user, book=create_book, total_reading_time=timedelta(hours=2))
+    BookReadingStatistics.objects.create(book=create_book, total_reading_time=timedelta(hours=3))
+
+    response = auth_client.get(reverse("books-retrieve-statistic", kwargs={"pk": create_book.id}))
+    assert response.data["total_reading_time"] == "03:00:00"
+
+    response = auth_client.get(reverse("users-statistic"))
+    assert response.data["books"][0]["total_reading_time"] == "02:00:00"
+
+
+@pytest.mark.django_db
+def test_user_statistic_counters_of_the_user_only(auth_client, create_user, create_book):
+    other_user = User.objects.create_user(username="other", password="password")
+    ReadingStatistics.objects.create(user=create_user, book=create_book, total_reading_time=timedelta(hours=2))
+    ReadingStatistics.objects.create(user=other_user, book=create_book, total_reading_time=timedelta(hours=7))
+
+    response = auth_client.get(reverse("users-statistic"))
+
+    assert [book["total_reading_time"] for book in response.data["books"]] == ["02:00:00"]
+
+
+@pytest.mark.django_db
+def test_statistic_cache_hit_and_invalidation(
+    auth_client, create_user, create_book, start_reading_session, django_capture_on_commit_callbacks
+):
+    url = reverse("books-retrieve-statistic", kwargs={"pk": create_book.id})
+    BookReadingStatistics.objects.create(book=create_book, total_reading_time=timedelta(hours=1))
+
+    assert auth_client.get(url).data["total_reading_time"] == "01:00:00"
+    BookReadingStatistics.objects.filter(book=create_book).update(total_reading_time=timedelta(hours=5))
+    assert auth_client.get(url).data["total_reading_time"] == "01:00:00"
+    assert StatisticCache.get_counters() == {"hits": 1, "misses": 1}
+
+    start_reading_session(create_book)
+    with django_capture_on_commit_callbacks(execute=True):
+        auth_client.patch(reverse("end-reading-session", kwargs={"book_id": create_book.id}))
+
+    assert auth_client.get(url).data["total_reading_time"].startswith("05:00:00")
+    assert StatisticCache.get_counters() == {"hits": 1, "misses": 2}
+
+
+@pytest.mark.django_db
+def test_statistic_cache_counters_admin_only(auth_client, create_user):
+    url = reverse("statistic-cache")
+    assert auth_client.get(url).status_code == status.HTTP_403_FORBIDDEN
+
+    create_user.is_staff = True
+    create_user.save()
+    response = auth_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data == {"hits": 0, "misses": 0}
+
+
+@pytest.mark.django_db
+def test_book_reading_time_list_pages_invalidated(
+    auth_client, create_user, create_book, start_reading_session, django_capture_on_commit_callbacks
+):
+    url = reverse("books-statistic")
+    BookReadingStatistics.objects.create(book=create_book, total_reading_time=timedelta(hours=1))
+
+    assert auth_client.get(url, {"page_size": 1}).data["results"][0]["total_reading_time"] == "01:00:00"
+
+    start_reading_session(create_book)
+    BookReadingStatistics.objects.filter(book=create_book).update(total_reading_time=timedelta(hours=5))
+    with django_capture_on_commit_callbacks(execute=True):
+        auth_client.patch(reverse("end-reading-session", kwargs={"book_id": create_book.id}))
+
+    response = auth_client.get(url, {"page_size": 1})
+    assert response.data["results"][0]["total_reading_time"].startswith("05:00:00")
+
+
+@pytest.mark.django_db
+def test_book_reading_time_list_pages_cached_per_host(auth_client, create_book, settings):
+    settings.ALLOWED_HOSTS = ["a.example", "b.example"]
+    other_book = Book.objects.create(title="Other", author="Author", year=2000, short_description="...")
+    for book in (create_book, other_book):
+        BookReadingStatistics.objects.create(book=book, total_reading_time=timedelta(hours=1))
+    url = reverse("books-statistic")
+
+    for host in settings.ALLOWED_HOSTS:
+        response = auth_client.get(url, {"page_size": 1}, HTTP_HOST=host)
+        assert response.data["next"].startswith(f"http://{host}/")
+
+
+def test_cached_response_views_must_define_cache_key():
+    class View(CachedResponseMixin, APIView):
+        pass
+
+    with pytest.raises(TypeError, match="get_cache_key"):
+        View()
+
+
+@pytest.mark.django_db
+def test_book_reading_time_list_pages_invalidated_by_view_refresh(
+    auth_client, create_user, create_book, settings, django_capture_on_commit_callbacks
+):
+    settings.BOOK_READING_TIME_SOURCE = "materialized"
+    url = reverse("books-statistic")
+    start_time = timezone.now() - timedelta(hours=5)
+    ReadingSession.objects.create(
+        user=create_user, book=create_book, start_time=start_time, end_time=start_time + timedelta(hours=1)
+    )
+    assert auth_client.get(url).data["results"][0]["total_reading_time"] == "01:00:00"
+
+    ReadingSession.objects.create(
+        user=create_user, book=create_book, start_time=start_time, end_time=start_time + timedelta(hours=2)
+    )
+    assert auth_client.get(url).data["results"][0]["total_reading_time"] == "01:00:00"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        refresh_book_reading_totals()
+
+    assert auth_client.get(url).data["results"][0]["total_reading_time"] == "03:00:00"
+
+
+@pytest.mark.django_db
+def test_book_reading_time_retrieve_invalidated_by_view_refresh(
+    auth_client, create_user, create_book, settings, django_capture_on_commit_callbacks
+):
+    settings.BOOK_READING_TIME_SOURCE = "materialized"
+    url = reverse("books-retrieve-statistic", kwargs={"pk": create_book.id})
+    start_time = timezone.now() - timedelta(hours=5)
+    ReadingSession.objects.create(
+        user=create_user, book=create_book, start_time=start_time, end_time=start_time + timedelta(hours=1)
+    )
+    assert auth_client.get(url).data["total_reading_time"] == "01:00:00"
+
+    ReadingSession.objects.filter(book=create_book).update(end_time=start_time + timedelta(hours=2))
+    assert auth_client.get(url).data["total_reading_time"] == "01:00:00"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        refresh_book_reading_totals()
+
+    assert auth_client.get(url).data["total_reading_time"] == "02:00:00"
+
+
+@pytest.mark.django_db
+def test_book_reading_time_list_fast_path_renders_same_bytes(auth_client, create_book, settings):
+    other_book = Book.objects.create(title="Другая книга", author="Автор", year=2000, short_description="...")
+    BookReadingStatistics.objects.create(book=create_book, total_reading_time=timedelta(days=2, microseconds=15))
+    BookReadingStatistics.objects.create(book=other_book, total_reading_time=timedelta(minutes=3))
+    url = reverse("books-statistic")
+
+    response = auth_client.get(url)
+    cache.clear()
+    settings.FAST_LIST_SERIALIZATION = True
+    fast_response = auth_client.get(url)
+
+    assert fast_response.content == response.content
+    assert fast_response.json()["results"][0]["total_reading_time"] == "2 00:00:00.000015"
+
+
+@pytest.mark.django_db
+def test_book_reading_time_sources_agree(auth_client, create_user, create_book, settings):
+    other_book = Book.objects.create(title="Другая книга", author="Автор", year=2000, short_description="...")
+    Book.objects.create(title="Unread", author="Автор", year=2001, short_description="...")
+    start_time = timezone.now() - timedelta(days=3)
+    for book, hours in ((create_book, 1), (create_book, 2), (other_book, 4)):
+        ReadingSession.objects.create(
+            user=create_user, book=book, start_time=start_time, end_time=start_time + timedelta(hours=hours)
+        )
+    ReadingSession.objects.create(user=create_user, book=other_book, start_time=start_time, status=True)
+    url = reverse("books-statistic")
+
+    responses = []
+    for source in ("live", "counters", "materialized"):
+        settings.BOOK_READING_TIME_SOURCE = source
+        cache.clear()
+        responses.append(auth_client.get(url).json()["results"])
+
+    assert responses[0] == responses[1] == responses[2]
+    assert [(book["id"], book["total_reading_time"]) for book in responses[2]] == [
+        (create_book.id, "03:00:00"),
+        (other_book.id, "04:00:00"),
+    ]
+
+
+@pytest.mark.django_db
+def test_reading_session_export(auth_client, create_user, create_book, reading_session):
+    other_user = User.objects.create_user(username="other", password="password")
+    ReadingSession.objects.create(user=other_user, book=create_book, end_time=reading_session.end_time)
+    url = reverse("statistic-export")
+
+    response = auth_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "text/csv"
+    rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+    assert [row["id"] for row in rows] == [str(reading_session.id)]
+    assert rows[0]["book_title"] == create_book.title
+    assert rows[0]["start_time"] == reading_session.start_time.isoformat()
+
+    response = auth_client.get(url, {"type": "ndjson", "gzip": "true"})
+    assert response["Content-Disposition"] == 'attachment; filename="reading_sessions.ndjson.gz"'
+    lines = gzip.decompress(b"".join(response.streaming_content)).splitlines()
+    assert [json.loads(line)["username"] for line in lines] == [create_user.username]
+
+    date_from = (reading_session.start_time + timedelta(seconds=1)).isoformat()
+    response = auth_client.get(url, {"type": "ndjson", "date_from": date_from})
+    assert b"".join(response.streaming_content) == b""
+
+
+@pytest.mark.django_db
+def test_reading_session_export_invalid_params(auth_client):
+    response = auth_client.get(reverse("statistic-export"), {"type": "xml"})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_leaderboard(auth_client, create_user, create_book):
+    other_user = User.objects.create_user(username="other", password="password")
+    other_book = Book.objects.create(title="Dune", author="Frank Herbert", year=1965, short_description="...")
+    now = timezone.localtime().replace(hour=12)
+    for user, book, hours in ((create_user, create_book, 1), (other_user, other_book, 2), (other_user, create_book, 2)):
+        ReadingSession.objects.create(user=user, book=book, start_time=now - timedelta(hours=hours), end_time=now)
+    ReadingSession.objects.create(
+        user=create_user, book=other_book, start_time=now - timedelta(days=3, hours=5), end_time=now - timedelta(days=3)
+    )
+    url = reverse("statistic-leaderboard")
+
+    response = auth_client.get(url, {"board": "books", "days": 1})
+    assert response.status_code == status.HTTP_200_OK
+    assert [(entry["rank"], entry["name"]) for entry in response.data["results"]] == [
+        (1, create_book.title), (2, other_book.title)
+    ]
+    assert response.data["results"][0]["total_reading_time"] == "03:00:00"
+
+    response = auth_client.get(url, {"board": "readers", "days": 7, "limit": 1})
+    assert [(entry["id"], entry["total_reading_time"]) for entry in response.data["results"]] == [
+        (create_user.id, "06:00:00")
+    ]
+
+    assert auth_client.get(url, {"days": 2}).status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_reading_histogram_splits_sessions(auth_client, create_user, create_book):
+    midnight = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    ReadingSession.objects.create(
+        user=create_user,
+        book=create_book,
+        start_time=midnight - timedelta(minutes=30),
+        end_time=midnight + timedelta(minutes=45),
+    )
+    ReadingSession.objects.create(
+        user=create_user,
+        book=create_book,
+        start_time=midnight + timedelta(hours=10, minutes=5),
+        end_time=midnight + timedelta(hours=10, minutes=20),
+    )
+    today = midnight.date()
+    yesterday = today - timedelta(days=1)
+    url = reverse("users-histogram")
+
+    response = auth_client.get(url, {"granularity": "day", "date_from": yesterday, "date_to": today})
+    assert response.status_code == status.HTTP_200_OK
+    assert [(bucket["start"], bucket["total_reading_time"]) for bucket in response.data["results"]] == [
+        (str(yesterday), "00:30:00"), (str(today), "01:00:00")
+    ]
+
+    response = auth_client.get(url, {"granularity": "hour", "date_from": yesterday, "date_to": today})
+    totals = [bucket["total_reading_time"] for bucket in response.data["results"]]
+    assert len(totals) == 48
+    assert (totals[23], totals[24], totals[34]) == ("00:30:00", "00:45:00", "00:15:00")
+    assert set(totals[:23] + totals[25:34] + totals[35:]) == {"00:00:00"}
+
+    response = auth_client.get(reverse("books-histogram", args=[create_book.id]), {"date_from": today})
+    assert response.data["results"] == [{"start": str(today), "total_reading_time": "01:00:00"}]
+
+
+@pytest.mark.django_db
+def test_reading_histogram_compacted_days(auth_client, create_user, create_book, settings):
+    settings.READING_TIME_BUCKETS_DAILY_HORIZON = 10
+    day = timezone.localdate() - timedelta(days=100)
+    start_time = timezone.make_aware(datetime.combine(day, time(hour=10)))
+    ReadingSession.objects.create(
+        user=create_user, book=create_book, start_time=start_time, end_time=start_time + timedelta(hours=2)
+    )
+    ReadingTimeBucket.compact(before=timezone.localdate().replace(day=1) - timedelta(days=31))
+    url = reverse("users-histogram")
+
+    response = auth_client.get(url, {"date_from": day, "date_to": day + timedelta(days=1)})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "date_from" in response.data
+
+    response = auth_client.get(url, {"granularity": "month", "date_from": day, "date_to": day})
+    assert response.data["results"] == [{"start": str(day.replace(day=1)), "total_reading_time": "02:00:00"}]
+
+
+@pytest.mark.django_db
+def test_reading_histogram_hours_only_after_archive_cutoff(auth_client, create_book, settings):
+    settings.READING_SESSION_ARCHIVE_MONTHS = 12
+    url = reverse("books-histogram", args=[create_book.id])
+    today = timezone.localdate()
+
+    for date_from, status_code in ((today - timedelta(days=30), 200), (today - timedelta(days=400), 400)):
+        with CaptureQueriesContext(connection) as context:
+            response = auth_client.get(url, {"granularity": "hour", "date_from": date_from, "date_to": date_from})
+        assert response.status_code == status_code
+        assert not any(ReadingSessionSummary._meta.db_table in query["sql"] for query in context.captured_queries)
+
+
+@pytest.mark.django_db
+def test_reading_histogram_invalid_range(auth_client, settings):
+    settings.HISTOGRAM_MAX_BUCKETS = 48
+    url = reverse("users-histogram")
+
+    response = auth_client.get(url, {"date_from": "2024-01-02", "date_to": "2024-01-01"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = auth_client.get(url, {"granularity": "hour", "date_from": "2024-01-01", "date_to": "2024-01-03"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,97 @@
+import gzip
+from datetime import timedelta
+
+import pytest
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from library.models import Book, ReadingSession
+from statistic.models import BookReadingStatistics, ReadingSessionSummary, ReadingStatistics, ReadingTimeBucket
+
+
+@pytest.mark.django_db
+def test_rebuild_reading_statistics(reading_session):
+    ReadingStatistics.objects.all().update(total_reading_time=timedelta(days=1))
+    BookReadingStatistics.objects.all().delete()
+    ReadingTimeBucket.objects.all().delete()
+
+    call_command("rebuild_reading_statistics")
+
+    expected = reading_session.end_time - reading_session.start_time
+    assert ReadingStatistics.objects.get(user=reading_session.user).total_reading_time == expected
+    assert BookReadingStatistics.objects.get(book=reading_session.book).total_reading_time == expected
+    assert ReadingTimeBucket.get_reading_time(reading_session.start_time.date(), user=reading_session.user) == expected
+
+
+@pytest.mark.django_db
+def test_export_reading_sessions(reading_session, tmp_path):
+    output = tmp_path / "sessions.csv.gz"
+
+    call_command("export_reading_sessions", "--gzip", "--output", str(output), "--user", str(reading_session.user_id))
+
+    header, row = gzip.decompress(output.read_bytes()).decode().splitlines()
+    assert header.startswith("id,user_id,username")
+    assert row.startswith(f"{reading_session.id},{reading_session.user_id},")
+
+
+@pytest.mark.django_db
+def test_archive_reading_sessions_keeps_totals(auth_client, create_user, create_book, settings):
+    settings.READING_SESSION_ARCHIVE_BATCH_SIZE = 2
+    other_book = Book.objects.create(title="Other", author="Author", year=2000, short_description="...")
+    old_start = timezone.now().replace(hour=22, minute=30, second=0, microsecond=0) - timedelta(days=400)
+    for book, hours in ((create_book, 1), (create_book, 3), (other_book, 2)):
+        ReadingSession.objects.create(
+            user=create_user, book=book, start_time=old_start, end_time=old_start + timedelta(hours=hours)
+        )
+    recent = ReadingSession.objects.create(
+        user=create_user, book=create_book, start_time=timezone.now() - timedelta(hours=1), end_time=timezone.now()
+    )
+    old_day = old_start.date()
+    requests = [
+        (reverse("books-statistic"), {}),
+        (reverse("books-retrieve-statistic", kwargs={"pk": create_book.id}), {}),
+        (reverse("users-statistic"), {}),
+        (reverse("users-histogram"), {"granularity": "month", "date_from": old_day}),
+        (reverse("books-histogram", args=[create_book.id]), {"granularity": "month", "date_from": old_day}),
+    ]
+
+    def responses():
+        results = []
+        for source in ("live", "counters", "materialized"):
+            settings.BOOK_READING_TIME_SOURCE = source
+            cache.clear()
+            results.extend(auth_client.get(url, params).json() for url, params in requests)
+        return results
+
+    before = responses()
+    assert before[3]["results"][0]["total_reading_time"] != "00:00:00"
+    call_command("archive_reading_sessions", "--months", "12")
+
+    assert list(ReadingSession.objects.values_list("id", flat=True)) == [recent.id]
+    summary = ReadingSessionSummary.objects.get(user=create_user, book=create_book)
+    assert (summary.session_count, summary.total_reading_time) == (2, timedelta(hours=4))
+    assert responses() == before
+    call_command("verify_reading_session_archive")
+
+    BookReadingStatistics.objects.filter(book=other_book).update(total_reading_time=timedelta(hours=5))
+    with pytest.raises(CommandError, match="1 mismatches"):
+        call_command("verify_reading_session_archive")
+
+
+@pytest.mark.django_db
+def test_rebuild_reading_statistics_includes_archived_sessions(reading_session):
+    start_time = reading_session.start_time - timedelta(days=400)
+    ReadingSession.objects.filter(id=reading_session.id).update(
+        start_time=start_time, end_time=start_time + timedelta(hours=2)
+    )
+    call_command("archive_reading_sessions", "--months", "12")
+
+    call_command("rebuild_reading_statistics")
+
+    assert not ReadingSession.objects.exists()
+    assert ReadingStatistics.objects.get(user=reading_session.user).total_reading_time == timedelta(hours=2)
+    assert BookReadingStatistics.objects.get(book=reading_session.book).total_reading_time == timedelta(hours=2)
+    month = start_time.date().replace(day=1)
+    assert ReadingTimeBucket.get_reading_time(month, user=reading_session.user) == timedelta(hours=2)
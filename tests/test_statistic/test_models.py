@@ -1,8 +1,17 @@
-from datetime import timedelta
+from datetime import date, datetime, timedelta, timezone
 
 import pytest
+from django.db import IntegrityError, connection
+from django.utils.timezone import localdate
 
-from statistic.models import ReadingStatistics
+from statistic.apps import create_book_reading_totals_view
+from statistic.models import (
+    BookReadingStatistics,
+    BookReadingTotal,
+    ReadingSessionSummary,
+    ReadingStatistics,
+    ReadingTimeBucket,
+)
 
 
 @pytest.mark.django_db
@@ -17,5 +26,101 @@ def test_reading_statistics_model(create_book, create_user):
     assert reading_stat.book == book
     assert reading_stat.total_reading_time == timedelta(hours=1)
 
+    reading_stat.delete()
     new_reading_stat = ReadingStatistics.objects.create(user=user, book=book)
     assert new_reading_stat.total_reading_time == timedelta()
+
+
+@pytest.mark.django_db
+def test_reading_statistics_unique_per_user_and_book(create_book, create_user):
+    ReadingStatistics.objects.create(user=create_user, book=create_book)
+
+    with pytest.raises(IntegrityError):
+        ReadingStatistics.objects.create(user=create_user, book=create_book)
+
+
+@pytest.mark.django_db
+def test_add_reading_time_creates_and_increments(create_book, create_user):
+    ReadingStatistics.add_reading_time(timedelta(minutes=10), user_id=create_user.id, book_id=create_book.id)
+    ReadingStatistics.add_reading_time(timedelta(minutes=5), user_id=create_user.id, book_id=create_book.id)
+
+    reading_stat = ReadingStatistics.objects.get(user=create_user, book=create_book)
+    assert reading_stat.total_reading_time == timedelta(minutes=15)
+
+
+@pytest.mark.django_db
+def test_created_closed_session_is_counted(reading_session):
+    user_stat = ReadingStatistics.objects.get(user=reading_session.user, book=reading_session.book)
+    book_stat = BookReadingStatistics.objects.get(book=reading_session.book)
+
+    expected = reading_session.end_time - reading_session.start_time
+    assert user_stat.total_reading_time == expected
+    assert book_stat.total_reading_time == expected
+
+
+def test_reading_time_bucket_split_by_day():
+    start_time = datetime(2024, 1, 1, 22, 0, tzinfo=timezone.utc)
+    end_time = datetime(2024, 1, 3, 1, 30, tzinfo=timezone.utc)
+
+    assert list(ReadingTimeBucket.split_by_day(start_time, end_time)) == [
+        (date(2024, 1, 1), timedelta(hours=2)),
+        (date(2024, 1, 2), timedelta(days=1)),
+        (date(2024, 1, 3), timedelta(hours=1, minutes=30)),
+    ]
+
+
+@pytest.mark.django_db
+def test_reading_time_bucket_get_reading_time(reading_session):
+    first_day = reading_session.start_time.date()
+    total = ReadingTimeBucket.get_reading_time(first_day, user=reading_session.user)
+
+    assert total == reading_session.end_time - reading_session.start_time
+    assert ReadingTimeBucket.get_reading_time(first_day + timedelta(days=2)) == timedelta()
+
+
+@pytest.mark.django_db
+def test_reading_time_bucket_get_reading_time_counts_whole_months(create_user, create_book, settings):
+    settings.READING_TIME_BUCKETS_DAILY_HORIZON = 0
+    buckets = {
+        (ReadingTimeBucket.Period.MONTH, date(2020, 1, 1)): timedelta(hours=1),
+        (ReadingTimeBucket.Period.MONTH, date(2020, 2, 1)): timedelta(hours=2),
+        (ReadingTimeBucket.Period.MONTH, date(2020, 3, 1)): timedelta(hours=4),
+    }
+    for (period, day), reading_time in buckets.items():
+        ReadingTimeBucket.objects.create(
+            user=create_user, book=create_book, period=period, date=day, total_reading_time=reading_time
+        )
+    today = localdate()
+    ReadingTimeBucket.objects.create(
+        user=create_user, book=create_book, date=today.replace(day=1), total_reading_time=timedelta(minutes=10)
+    )
+    ReadingTimeBucket.objects.create(
+        user=create_user, book=create_book, date=today, total_reading_time=timedelta(minutes=20)
+    )
+
+    assert ReadingTimeBucket.get_reading_time(date(2020, 1, 1), date(2020, 2, 29)) == timedelta(hours=3)
+    assert ReadingTimeBucket.get_reading_time(date(2020, 2, 1), date(2020, 3, 31)) == timedelta(hours=6)
+    for date_from, date_to in [(date(2020, 1, 15), date(2020, 3, 31)), (date(2020, 1, 1), date(2020, 2, 15))]:
+        with pytest.raises(ValueError):
+            ReadingTimeBucket.get_reading_time(date_from, date_to)
+    # The days of the current month are not compacted, a range may start inside it.
+    assert ReadingTimeBucket.get_reading_time(today, user=create_user) == timedelta(minutes=20 if today.day > 1 else 30)
+
+
+@pytest.mark.django_db
+def test_book_reading_totals_view_replaces_previous_version(create_user, create_book):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP VIEW {BookReadingTotal._meta.db_table}")
+        cursor.execute(
+            "CREATE VIEW statistic_book_reading_total AS SELECT book_id, 0 AS total_reading_time "
+            "FROM library_readingsession GROUP BY book_id"
+        )
+    ReadingSessionSummary.objects.create(
+        user=create_user, book=create_book, month=date(2020, 1, 1), total_reading_time=timedelta(hours=2)
+    )
+
+    create_book_reading_totals_view(using="default")
+
+    views = connection.introspection.table_names(include_views=True)
+    assert "statistic_book_reading_total" not in views
+    assert BookReadingTotal.objects.get(book=create_book).total_reading_time == timedelta(hours=2)
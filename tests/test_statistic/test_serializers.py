@@ -10,7 +10,7 @@ def test_book_reading_time_serializer_validation(create_book):
     book_data = {
         "title": create_book.title,
         "author": create_book.author,
-        "year": create_book.year,
+        "year": create_book.year + 1,
     }
 
     serializer = BookReadingTimeSerializer(data=book_data)
@@ -26,7 +26,7 @@ def test_book_reading_time_serializer_read_only_field(create_book):
     book_data = {
         "title": create_book.title,
         "author": create_book.author,
-        "year": create_book.year,
+        "year": create_book.year + 1,
         "total_reading_time": timedelta(hours=2),
     }
 
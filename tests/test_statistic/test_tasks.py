@@ -1,7 +1,26 @@
+import threading
+from datetime import timedelta
+
 import pytest
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
 
+from auth_api.cache import UserCache
 from auth_api.models import UserReadingStats
-from statistic.tasks import UserReadingStatsUpdater, update_user_reading_stats_7_days, update_user_reading_stats_30_days
+from library.models import Book, ReadingSession
+from rtas_backend import celery_app
+from statistic.models import BookReadingTotal, LeaderboardEntry, ReadingTimeBucket
+from statistic.tasks import (
+    UserReadingStatsUpdater,
+    compact_reading_time_buckets,
+    rebuild_leaderboards,
+    refresh_book_reading_totals,
+    update_user_reading_stats,
+    update_user_reading_stats_7_days,
+    update_user_reading_stats_30_days,
+)
 
 
 @pytest.mark.django_db
@@ -42,3 +61,188 @@ def test_celery_task_update_user_reading_stats_30_days(mocker):
     update_user_reading_stats_30_days()
 
     mock_update.assert_called_once_with(30)
+
+
+def create_bucket(user, book, days_ago, reading_time):
+    return ReadingTimeBucket.objects.create(
+        user=user, book=book, date=timezone.localdate() - timedelta(days=days_ago), total_reading_time=reading_time
+    )
+
+
+@pytest.mark.django_db
+def test_update_reading_stats_both_windows(create_user, create_book):
+    create_bucket(create_user, create_book, 0, timedelta(minutes=30))
+    create_bucket(create_user, create_book, 6, timedelta(hours=1))
+    create_bucket(create_user, create_book, 7, timedelta(hours=2))
+    create_bucket(create_user, create_book, 30, timedelta(hours=4))
+    idle_user = User.objects.create(username="idle_reader")
+    UserReadingStats.objects.filter(user=idle_user).update(statistic_time_7_days=timedelta(hours=5))
+
+    assert UserReadingStatsUpdater.update_reading_stats() == 2
+
+    stats = UserReadingStats.objects.get(user=create_user)
+    assert stats.statistic_time_7_days == timedelta(hours=1, minutes=30)
+    assert stats.statistic_time_30_days == timedelta(hours=3, minutes=30)
+
+    idle_stats = UserReadingStats.objects.get(user=idle_user)
+    assert idle_stats.statistic_time_7_days == timedelta(0)
+    assert idle_stats.statistic_time_30_days == timedelta(0)
+
+
+@pytest.mark.django_db
+def test_update_reading_stats_invalidates_cached_users(create_user, create_book, django_capture_on_commit_callbacks):
+    assert UserCache.get(create_user.id).reading_stats.statistic_time_7_days == timedelta()
+    create_bucket(create_user, create_book, 0, timedelta(hours=1))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        UserReadingStatsUpdater.update_reading_stats()
+
+    # The local LRU of another process has expired, the user is loaded from the shared cache or the database.
+    UserCache.clear_local()
+    assert UserCache.get(create_user.id).reading_stats.statistic_time_7_days == timedelta(hours=1)
+
+
+@pytest.mark.django_db
+def test_update_reading_stats_from_closed_sessions(create_user, create_book, start_reading_session, auth_client):
+    start_reading_session(create_book)
+    auth_client.patch(reverse("end-reading-session", kwargs={"book_id": create_book.id}))
+    UserReadingStatsUpdater.update_reading_stats()
+
+    session = ReadingSession.objects.get(user=create_user)
+    stats = UserReadingStats.objects.get(user=create_user)
+    assert stats.statistic_time_7_days == session.end_time - session.start_time
+    assert stats.statistic_time_30_days == session.end_time - session.start_time
+
+
+@pytest.mark.django_db
+def test_update_reading_stats_constant_queries(create_book, django_assert_num_queries, settings):
+    settings.READING_STATS_BATCH_SIZE = 100
+    for index in range(50):
+        user = User.objects.create(username=f"reader_{index}")
+        create_bucket(user, create_book, 1, timedelta(hours=1))
+
+    with django_assert_num_queries(2):
+        UserReadingStatsUpdater.update_reading_stats()
+
+    assert UserReadingStats.objects.filter(statistic_time_30_days__gt=timedelta(0)).count() == 50
+
+
+@pytest.mark.django_db
+def test_celery_task_update_user_reading_stats_sharded(create_book, settings, monkeypatch):
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    settings.READING_STATS_SHARD_SIZE = 2
+    settings.READING_STATS_SHARD_CONCURRENCY = 2
+    users = [User.objects.create(username=f"reader_{index}") for index in range(5)]
+    for hours, user in enumerate(users, start=1):
+        create_bucket(user, create_book, 1, timedelta(hours=hours))
+
+    update_user_reading_stats()
+
+    for hours, user in enumerate(users, start=1):
+        assert UserReadingStats.objects.get(user=user).statistic_time_7_days == timedelta(hours=hours)
+    last_update = UserReadingStatsUpdater.get_last_update()
+    assert last_update["users"] == 5
+    assert last_update["shards"] == len(UserReadingStatsUpdater.get_shards(2))
+
+
+def test_split_lanes():
+    shards = [[index, index + 1] for index in range(5)]
+
+    assert UserReadingStatsUpdater.split_lanes(shards, 2) == [shards[0::2], shards[1::2]]
+    assert UserReadingStatsUpdater.split_lanes(shards[:1], 8) == [shards[:1]]
+    assert UserReadingStatsUpdater.split_lanes([], 8) == []
+
+
+@pytest.mark.django_db
+def test_compact_reading_time_buckets(create_user, create_book, settings):
+    settings.READING_TIME_BUCKETS_DAILY_HORIZON = 10
+    create_bucket(create_user, create_book, 0, timedelta(hours=1))
+    create_bucket(create_user, create_book, 100, timedelta(hours=2))
+    create_bucket(create_user, create_book, 101, timedelta(hours=3))
+    compact_reading_time_buckets()
+
+    assert ReadingTimeBucket.objects.filter(period=ReadingTimeBucket.Period.DAY).count() == 1
+    month_buckets = ReadingTimeBucket.objects.filter(period=ReadingTimeBucket.Period.MONTH)
+    assert sum((bucket.total_reading_time for bucket in month_buckets), timedelta()) == timedelta(hours=5)
+    assert all(bucket.date.day == 1 for bucket in month_buckets)
+
+
+@pytest.mark.django_db
+def test_rebuild_leaderboards_drops_days_outside_windows(create_user, create_book):
+    create_bucket(create_user, create_book, 0, timedelta(hours=1))
+    create_bucket(create_user, create_book, 3, timedelta(hours=2))
+    create_bucket(create_user, create_book, 40, timedelta(hours=4))
+    LeaderboardEntry.objects.create(
+        board=LeaderboardEntry.Board.BOOKS, days=1, subject_id=create_book.id, total_reading_time=timedelta(days=1)
+    )
+    LeaderboardEntry.objects.create(
+        board=LeaderboardEntry.Board.READERS, days=7, subject_id=0, total_reading_time=timedelta(hours=5)
+    )
+    assert rebuild_leaderboards() == 6
+
+    assert LeaderboardEntry.top(LeaderboardEntry.Board.BOOKS, 1, 10) == [(create_book.id, timedelta(hours=1))]
+    assert LeaderboardEntry.top(LeaderboardEntry.Board.READERS, 7, 10) == [(create_user.id, timedelta(hours=3))]
+    assert LeaderboardEntry.top(LeaderboardEntry.Board.READERS, 30, 10) == [(create_user.id, timedelta(hours=3))]
+    assert LeaderboardEntry.objects.count() == 6
+
+
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="Needs concurrent writers, SQLite locks the table.")
+@pytest.mark.django_db(transaction=True)
+def test_rebuild_leaderboards_keeps_concurrent_increments(create_user, create_book):
+    other_book = Book.objects.create(title="Other", author="Author", year=2000)
+    create_bucket(create_user, other_book, 3, timedelta(hours=2))
+    LeaderboardEntry.objects.create(
+        board=LeaderboardEntry.Board.BOOKS, days=1, subject_id=other_book.id, total_reading_time=timedelta(hours=2)
+    )
+    incremented = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def close_session():
+        try:
+            with transaction.atomic():
+                create_bucket(create_user, create_book, 0, timedelta(hours=1))
+                day_times = {(create_user.id, create_book.id, timezone.localdate()): timedelta(hours=1)}
+                LeaderboardEntry.add_day_times(day_times)
+                incremented.set()
+                release.wait(timeout=10)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    def rebuild():
+        try:
+            rebuild_leaderboards()
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    writer = threading.Thread(target=close_session)
+    writer.start()
+    incremented.wait(timeout=10)
+    rebuilder = threading.Thread(target=rebuild)
+    rebuilder.start()
+    rebuilder.join(timeout=5)
+    rebuilt_during_increment = not rebuilder.is_alive()
+    release.set()
+    writer.join()
+    rebuilder.join()
+
+    assert errors == []
+    assert rebuilt_during_increment
+    assert LeaderboardEntry.top(LeaderboardEntry.Board.BOOKS, 1, 10) == [(create_book.id, timedelta(hours=1))]
+    assert LeaderboardEntry.top(LeaderboardEntry.Board.BOOKS, 7, 10) == [(other_book.id, timedelta(hours=2))]
+
+
+@pytest.mark.django_db
+def test_refresh_book_reading_totals(reading_session, create_book, settings, mocker):
+    mock_refresh = mocker.patch("statistic.tasks.BookReadingTotal.refresh")
+    refresh_book_reading_totals()
+    mock_refresh.assert_not_called()
+
+    settings.BOOK_READING_TIME_SOURCE = "materialized"
+    refresh_book_reading_totals()
+    mock_refresh.assert_called_once_with("default")
+    assert BookReadingTotal.objects.get(book=create_book).total_reading_time == timedelta(hours=1)